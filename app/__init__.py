@@ -17,16 +17,71 @@ SF_USERNAME = get_env_variable('SF_USERNAME')
 SF_PASSWORD = get_env_variable('SF_PASSWORD')
 SF_SECURITY_TOKEN = get_env_variable('SF_SECURITY_TOKEN')
 SF_DOMAIN = get_env_variable('SF_DOMAIN')
+# The composite resource needs v42.0 or newer; simple_salesforce defaults to v38.0
+SF_API_VERSION = '42.0'
+SF_SESSION_CACHE_KEY = 'salesforce-session'
+SF_SESSION_CACHE_TIMEOUT = 60 * 60
+SF_IN_CLAUSE_CHUNK_SIZE = 200
+SF_QUERY_MAX_WORKERS = 4
+SF_HTTP_TIMEOUT = (3.05, 30)
+SF_ATTACHMENT_CHUNK_SIZE = 64 * 1024
+SF_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+SYNC_BATCH_SIZE = 500
+
+IMPORT_CREATED = 'created'
+IMPORT_ALREADY_EXISTS = 'already exists'
+IMPORT_NOT_FOUND = 'not found'
+IMPORT_NO_SIGNED_DATE = 'failed: the contract has no activation date'
+
+ATTACHMENT_CACHE_HITS_KEY = 'attachment-cache-hits'
+ATTACHMENT_CACHE_MISSES_KEY = 'attachment-cache-misses'
 
 LINK_TO_REPORT_EVENTS = "https://www.evbqa.com/myevent/{}/reports/attendee/"
 LINK_TO_RECOUPS = "https://admin.eventbrite.com/admin/upfront_recoups/manage"
 LINK_TO_SEARCH_EVENT_OR_USER = "https://admin.eventbrite.com/admin/search/?search_type=&search_query={email_organizer}"
 
 BASIC_CONDITIONS = ('Promissory Note', 'Bank Details', 'Payment Date', 'Funds Available')
+INSTALLMENT_SCHEDULE_MAX_TRANCHES = 60
 
 SUPERSET_QUERY_DATE_FORMAT = "%Y-%m-%d"
 SUPERSET_DEFAULT_CURRENCY = 'BRL'
 
 ITEMS_PER_PAGE = 15
+KEYSET_CURSOR_SALT = 'app.pagination.cursor'
+# Beyond this many rows the lists show "~N results" instead of counting them all
+ESTIMATED_COUNT_CAP = 10000
+COUNT_CACHE_GENERATION_KEY = 'list-count-generation'
+COUNT_CACHE_TIMEOUT = 60 * 60
+# Parameters that change the page or the output format, not the counted rows
+COUNT_CACHE_IGNORED_PARAMS = ('page', 'cursor', 'sort', 'download', 'compress')
+
+ORGANIZER_SEARCH_FTS_TABLE = 'app_contract_search'
+ORGANIZER_SEARCH_MIN_TRIGRAM_LENGTH = 3
+# Installments rebuilt per batch; keeps the id IN (...) lists under SQLite's 999 parameters
+INSTALLMENT_REPORT_CHUNK_SIZE = 500
+
+EXPORT_PENDING = 'pending'
+EXPORT_RUNNING = 'running'
+EXPORT_DONE = 'done'
+EXPORT_FAILED = 'failed'
+
+EXPORT_STATUS = [
+    (EXPORT_PENDING, 'Pending'),
+    (EXPORT_RUNNING, 'Running'),
+    (EXPORT_DONE, 'Done'),
+    (EXPORT_FAILED, 'Failed'),
+]
+
+EXPORT_CHUNK_SIZE = 2000
+# A finished export is handed out again for identical filters during this window
+EXPORT_RESULT_MAX_AGE = 60 * 60
+EXPORT_POLL_SECONDS = 5
+# A running export whose worker has not reported for this long is re-queued
+EXPORT_HEARTBEAT_TIMEOUT = 10 * 60
 
 DROPBOX_ERROR = "There was an error trying to connect with the file storage."
+DROPBOX_LINK_CACHE_KEY = 'dropbox-link-{}'
+# Dropbox temporary links expire after four hours; stop serving them a bit earlier
+DROPBOX_LINK_CACHE_TIMEOUT = 3 * 60 * 60 + 30 * 60
+DROPBOX_LINK_MAX_WORKERS = 8
@@ -0,0 +1,107 @@
+import csv
+import io
+import logging
+import tempfile
+
+from django.core.files import File
+from django.utils import timezone
+
+from app import (
+    EXPORT_CHUNK_SIZE,
+    EXPORT_DONE,
+    EXPORT_FAILED,
+    EXPORT_RUNNING,
+)
+from app.models import (
+    Event,
+    ExportJob,
+    InstallmentCondition,
+)
+from app.views import AllInstallmentsView
+
+
+logger = logging.getLogger(__name__)
+
+EXPORT_EXTRA_FIELDS = ['conditions', 'events']
+
+
+def claim_next_job():
+    for job in ExportJob.objects.claimable().order_by('created'):
+        # Conditional update, so two workers never build the same job; a
+        # stalled job is claimed again from the start
+        now = timezone.now()
+        if ExportJob.objects.claimable().filter(pk=job.pk).update(status=EXPORT_RUNNING, heartbeat=now, rows=0):
+            job.status = EXPORT_RUNNING
+            job.heartbeat = now
+            job.rows = 0
+            return job
+    return None
+
+
+def send_heartbeat(job):
+    job.heartbeat = timezone.now()
+    ExportJob.objects.filter(pk=job.pk).update(heartbeat=job.heartbeat)
+
+
+def iter_export_rows(params, chunk_size=EXPORT_CHUNK_SIZE):
+    view = AllInstallmentsView()
+    queryset = view.filterset_class(data=params, queryset=view.get_queryset()).qs
+    lookups = view.csv_lookups()
+    last_id = 0
+    while True:
+        chunk = [
+            dict(zip(['installment_id', 'contract_id'] + lookups, values))
+            for values in queryset.filter(
+                installment_id__gt=last_id,
+            ).values_list('installment_id', 'contract_id', *lookups)[:chunk_size]
+        ]
+        if not chunk:
+            return
+        last_id = chunk[-1]['installment_id']
+
+        conditions = {}
+        condition_rows = InstallmentCondition.objects.filter(
+            installment_id__in=[row['installment_id'] for row in chunk],
+        ).order_by('id').values_list('installment_id', 'condition_name', 'done')
+        for installment_id, condition_name, done in condition_rows:
+            conditions.setdefault(installment_id, []).append(
+                '{} (done)'.format(condition_name) if done else condition_name
+            )
+
+        events = {}
+        event_rows = Event.objects.filter(
+            contract_id__in={row['contract_id'] for row in chunk},
+        ).order_by('id').values_list('contract_id', 'event_id')
+        for contract_id, event_id in event_rows:
+            events.setdefault(contract_id, []).append(event_id)
+
+        for row in chunk:
+            yield view.csv_row(row) + [
+                '; '.join(conditions.get(row['installment_id'], [])),
+                '; '.join(events.get(row['contract_id'], [])),
+            ]
+
+
+def run_export_job(job, chunk_size=EXPORT_CHUNK_SIZE):
+    try:
+        with tempfile.TemporaryFile() as export_file:
+            text = io.TextIOWrapper(export_file, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow([name for name, _ in AllInstallmentsView.csv_fields] + EXPORT_EXTRA_FIELDS)
+            for row in iter_export_rows(job.filter_params, chunk_size):
+                writer.writerow(row)
+                job.rows += 1
+                if job.rows % chunk_size == 0:
+                    send_heartbeat(job)
+            text.flush()
+            text.detach()
+            export_file.seek(0)
+            job.file.save('{}-installments.csv'.format(job.pk), File(export_file), save=False)
+        job.status = EXPORT_DONE
+    except Exception as error:
+        logger.exception('Export job %s failed', job.pk)
+        job.status = EXPORT_FAILED
+        job.error = str(error)
+    job.finished = timezone.now()
+    job.save()
+    return job
@@ -1,6 +1,15 @@
+from decimal import Decimal
+
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
 
+from app import (
+    INSTALLMENT_SCHEDULE_MAX_TRANCHES,
+    STATUS,
+)
+from app.models import Installment
+from app.schedules import build_schedule
+
 
 class CustomAuthenticationForm(AuthenticationForm):
     username = forms.CharField(widget=forms.TextInput(
@@ -18,3 +27,108 @@ class CustomAuthenticationForm(AuthenticationForm):
             'required': True
         }
     ))
+
+
+class InstallmentScheduleForm(forms.Form):
+    total_upfront = forms.DecimalField(max_digits=19, decimal_places=2, min_value=Decimal('0.01'))
+    tranches = forms.IntegerField(min_value=1, max_value=INSTALLMENT_SCHEDULE_MAX_TRANCHES)
+    first_maximum_payment_date = forms.DateField(widget=forms.DateInput(
+        attrs={
+            'id': 'datepicker_first_maximum_payment_date',
+            'type': 'text',
+        }
+    ))
+    months_between = forms.IntegerField(min_value=1, max_value=12, initial=1)
+    is_recoup = forms.BooleanField(required=False)
+
+    def build_installments(self):
+        return build_schedule(
+            self.cleaned_data['total_upfront'],
+            self.cleaned_data['tranches'],
+            self.cleaned_data['first_maximum_payment_date'],
+            self.cleaned_data['months_between'],
+            self.cleaned_data['is_recoup'],
+        )
+
+
+class InstallmentBulkUpdateForm(forms.Form):
+    status = forms.ChoiceField(choices=[('', 'Status')] + STATUS, required=False)
+    payment_date = forms.DateField(required=False, widget=forms.DateInput(
+        attrs={
+            'id': 'datepicker_bulk_payment_date',
+            'type': 'text',
+            'placeholder': 'Payment date',
+        }
+    ))
+    recoup_amount = forms.DecimalField(max_digits=19, decimal_places=2, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.changes():
+            raise forms.ValidationError('Choose a status, payment date or recoup amount to apply.')
+        return cleaned_data
+
+    def changes(self):
+        return {
+            name: value
+            for name, value in self.cleaned_data.items()
+            if value not in (None, '')
+        }
+
+
+class InstallmentGridForm(forms.ModelForm):
+    """One row of the installment grid; only existing installments can be edited through it."""
+
+    class Meta:
+        model = Installment
+        fields = (
+            'is_recoup',
+            'status',
+            'upfront_projection',
+            'maximum_payment_date',
+            'payment_date',
+            'recoup_amount',
+            'gtf',
+            'gts',
+        )
+        widgets = {
+            'maximum_payment_date': forms.DateInput(attrs={'type': 'date'}, format='%Y-%m-%d'),
+            'payment_date': forms.DateInput(attrs={'type': 'date'}, format='%Y-%m-%d'),
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.instance.pk is None:
+            raise forms.ValidationError('This installment does not belong to the contract.')
+        return cleaned_data
+
+
+class BaseInstallmentGridFormSet(forms.BaseModelFormSet):
+
+    @classmethod
+    def get_default_prefix(cls):
+        return 'grid'
+
+    def _construct_form(self, i, **kwargs):
+        if self.is_bound and i < self.initial_form_count():
+            try:
+                int(self.data.get('{}-id'.format(self.add_prefix(i))))
+            except (TypeError, ValueError):
+                # BaseModelFormSet would look a missing or malformed id up before
+                # validation and crash; build an unbound row so the id field reports it
+                return forms.BaseFormSet._construct_form(self, i, **kwargs)
+        return super()._construct_form(i, **kwargs)
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # Rows are matched against the contract's installments, fetched once;
+        # the default ModelChoiceField would SELECT every posted id again
+        form.fields['id'] = forms.IntegerField(initial=form.instance.pk, widget=forms.HiddenInput)
+
+
+InstallmentGridFormSet = forms.modelformset_factory(
+    Installment,
+    form=InstallmentGridForm,
+    formset=BaseInstallmentGridFormSet,
+    extra=0,
+)
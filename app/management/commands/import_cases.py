@@ -0,0 +1,34 @@
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from app.utils import (
+    import_cases,
+    SalesforceQuery,
+)
+
+
+class Command(BaseCommand):
+    help = 'Import Salesforce cases as contracts, by case number or by contract signed date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--case-numbers', help='Comma separated case numbers')
+        parser.add_argument('--date-from', help='Signed date lower bound, YYYY-MM-DD')
+        parser.add_argument('--date-to', help='Signed date upper bound, YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        sf_query = SalesforceQuery()
+        if options['case_numbers']:
+            cases = sf_query.iter_cases(options['case_numbers'])
+        elif options['date_from'] and options['date_to']:
+            cases = sf_query.iter_cases_by_date(
+                '{}T00:00:00.000+0000'.format(options['date_from']),
+                '{}T23:59:59.000+0000'.format(options['date_to']),
+            )
+        else:
+            raise CommandError('Pass --case-numbers or both --date-from and --date-to')
+
+        report = import_cases([case['case_id'] for case in cases], sf_query)
+        for outcome in report:
+            self.stdout.write('{case_number}\t{case_id}\t{status}'.format(**outcome))
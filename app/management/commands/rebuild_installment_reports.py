@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app import INSTALLMENT_REPORT_CHUNK_SIZE
+from app.reporting import rebuild_reports
+
+
+class Command(BaseCommand):
+    help = 'Recreate the installment reporting table from the installments, contracts, conditions and events'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=INSTALLMENT_REPORT_CHUNK_SIZE,
+            help='Installments rebuilt per batch',
+        )
+
+    def handle(self, *args, **options):
+        created = rebuild_reports(options['chunk_size'])
+        self.stdout.write('Rebuilt {} installment reports'.format(created))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import EXPORT_CHUNK_SIZE
+from app.exports import (
+    claim_next_job,
+    run_export_job,
+)
+
+
+class Command(BaseCommand):
+    help = 'Build the queued installment exports into file storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Installments read per query')
+        parser.add_argument(
+            '--poll',
+            type=int,
+            default=0,
+            help='Keep waiting for new jobs, checking every POLL seconds. By default it exits once the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if not options['poll']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            job = run_export_job(job, options['chunk_size'])
+            self.stdout.write('Export {}: {} ({} rows)'.format(job.pk, job.status, job.rows))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from app import SYNC_BATCH_SIZE
+from app.sync import SalesforceSync
+
+
+class Command(BaseCommand):
+    help = 'Pull the Contract, Case and Attachment changes made in Salesforce since the last sync'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SYNC_BATCH_SIZE, help='Records written per transaction')
+
+    def handle(self, *args, **options):
+        for object_name, synced in SalesforceSync(batch_size=options['batch_size']).run().items():
+            self.stdout.write('{}: {} records synced'.format(object_name, synced))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.24 on 2026-10-18 09:17
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_auto_20191111_1419'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesforceCase',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('salesforce_id', models.CharField(max_length=80, unique=True)),
+                ('case_number', models.CharField(db_index=True, max_length=80)),
+                ('subject', models.CharField(blank=True, max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('link_to_salesforce_case', models.CharField(blank=True, max_length=255)),
+                ('system_modstamp', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesforceContract',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('salesforce_id', models.CharField(max_length=80, unique=True)),
+                ('organizer_email', models.CharField(blank=True, max_length=254)),
+                ('organizer_name', models.CharField(blank=True, max_length=255)),
+                ('activated_date', models.DateTimeField(blank=True, null=True)),
+                ('billing_country', models.CharField(blank=True, max_length=80)),
+                ('system_modstamp', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_name', models.CharField(max_length=40, unique=True)),
+                ('system_modstamp', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='salesforcecase',
+            name='contract',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='cases', to='app.SalesforceContract', to_field='salesforce_id'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.24 on 2026-10-18 09:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from app.search import normalize_search_text
+
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE app_contract_search USING fts5("
+    "organizer_search, content='app_contract', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER app_contract_search_ai AFTER INSERT ON app_contract BEGIN "
+    "INSERT INTO app_contract_search(rowid, organizer_search) VALUES (new.id, new.organizer_search); END",
+    "CREATE TRIGGER app_contract_search_ad AFTER DELETE ON app_contract BEGIN "
+    "INSERT INTO app_contract_search(app_contract_search, rowid, organizer_search) "
+    "VALUES ('delete', old.id, old.organizer_search); END",
+    "CREATE TRIGGER app_contract_search_au AFTER UPDATE ON app_contract BEGIN "
+    "INSERT INTO app_contract_search(app_contract_search, rowid, organizer_search) "
+    "VALUES ('delete', old.id, old.organizer_search); "
+    "INSERT INTO app_contract_search(rowid, organizer_search) VALUES (new.id, new.organizer_search); END",
+    "INSERT INTO app_contract_search(app_contract_search) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS app_contract_search_au",
+    "DROP TRIGGER IF EXISTS app_contract_search_ad",
+    "DROP TRIGGER IF EXISTS app_contract_search_ai",
+    "DROP TABLE IF EXISTS app_contract_search",
+]
+POSTGRESQL_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX contract_organizer_search_trgm ON app_contract USING gin (organizer_search gin_trgm_ops)",
+]
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS contract_organizer_search_trgm",
+]
+
+
+def fill_organizer_search(apps, schema_editor):
+    Contract = apps.get_model('app', 'Contract')
+    for contract in Contract.objects.only('organizer_account_name', 'organizer_email').iterator():
+        Contract.objects.filter(pk=contract.pk).update(organizer_search=normalize_search_text(
+            '{} {}'.format(contract.organizer_account_name, contract.organizer_email)
+        ))
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contract',
+            name='organizer_search',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_organizer_search, migrations.RunPython.noop),
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRESQL_CREATE}),
+            run_for_vendor({'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.24 on 2026-10-18 09:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_contract_organizer_search'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='contract',
+            name='contract_signed_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='contract',
+            index=models.Index(fields=['signed_date', 'id'], name='contract_signed_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.24 on 2026-10-18 09:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_installment_reports(apps, schema_editor):
+    Installment = apps.get_model('app', 'Installment')
+    InstallmentCondition = apps.get_model('app', 'InstallmentCondition')
+    InstallmentReport = apps.get_model('app', 'InstallmentReport')
+    Event = apps.get_model('app', 'Event')
+    conditions = {
+        installment_id: (done, total)
+        for installment_id, done, total in InstallmentCondition.objects.order_by().values(
+            'installment_id',
+        ).annotate(
+            done=models.Count('done'),
+            total=models.Count('id'),
+        ).values_list('installment_id', 'done', 'total')
+    }
+    events = dict(
+        Event.objects.order_by().values('contract_id').annotate(
+            total=models.Count('id'),
+        ).values_list('contract_id', 'total')
+    )
+    reports = []
+    for installment in Installment.objects.select_related('contract').iterator():
+        contract = installment.contract
+        conditions_done, conditions_total = conditions.get(installment.id, (0, 0))
+        reports.append(InstallmentReport(
+            installment=installment,
+            contract=contract,
+            organizer_account_name=contract.organizer_account_name,
+            organizer_email=contract.organizer_email,
+            signed_date=contract.signed_date,
+            is_recoup=installment.is_recoup,
+            status=installment.status,
+            upfront_projection=installment.upfront_projection,
+            recoup_amount=installment.recoup_amount,
+            balance=(installment.upfront_projection or 0) - (installment.recoup_amount or 0),
+            maximum_payment_date=installment.maximum_payment_date,
+            payment_date=installment.payment_date,
+            gtf=installment.gtf,
+            gts=installment.gts,
+            conditions_done=conditions_done,
+            conditions_total=conditions_total,
+            events=events.get(installment.contract_id, 0),
+        ))
+    InstallmentReport.objects.bulk_create(reports, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_contract_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstallmentReport',
+            fields=[
+                ('installment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='report', serialize=False, to='app.Installment')),
+                ('organizer_account_name', models.CharField(max_length=80)),
+                ('organizer_email', models.EmailField(max_length=254)),
+                ('signed_date', models.DateField()),
+                ('is_recoup', models.BooleanField()),
+                ('status', models.CharField(blank=True, choices=[('COMMITED/APPROVED', 'COMMITED/APPROVED'), ('INVESTED', 'INVESTED')], max_length=80, null=True)),
+                ('upfront_projection', models.DecimalField(blank=True, decimal_places=2, max_digits=19, null=True)),
+                ('recoup_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=19, null=True)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=19)),
+                ('maximum_payment_date', models.DateField(blank=True, null=True)),
+                ('payment_date', models.DateField(blank=True, null=True)),
+                ('gtf', models.DecimalField(blank=True, decimal_places=2, max_digits=19, null=True)),
+                ('gts', models.DecimalField(blank=True, decimal_places=2, max_digits=19, null=True)),
+                ('conditions_done', models.PositiveIntegerField(default=0)),
+                ('conditions_total', models.PositiveIntegerField(default=0)),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('contract', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installment_reports', to='app.Contract')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='installmentreport',
+            index=models.Index(fields=['status', 'payment_date'], name='report_st_payment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='installmentreport',
+            index=models.Index(fields=['payment_date'], name='report_payment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='installmentreport',
+            index=models.Index(fields=['maximum_payment_date'], name='report_max_payment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='installmentreport',
+            index=models.Index(fields=['signed_date'], name='report_signed_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='installmentreport',
+            index=models.Index(fields=['balance'], name='report_balance_idx'),
+        ),
+        migrations.RunPython(fill_installment_reports, migrations.RunPython.noop),
+    ]
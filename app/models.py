@@ -1,12 +1,40 @@
 import datetime
+import hashlib
+import json
 
 from django.core.validators import FileExtensionValidator
-from django.db import models
+from django.db import (
+    models,
+    transaction,
+)
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    Q,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import (
+    Coalesce,
+    ExtractMonth,
+    ExtractYear,
+)
+from django.dispatch import Signal
+from django.utils import timezone
 
 from . import (
+    EXPORT_DONE,
+    EXPORT_HEARTBEAT_TIMEOUT,
+    EXPORT_PENDING,
+    EXPORT_RUNNING,
+    EXPORT_STATUS,
+    SF_DATETIME_FORMAT,
     STATUS_COMMITED_APPROVED,
     STATUS,
 )
+from .search import normalize_search_text
 
 
 class Contract(models.Model):
@@ -19,6 +47,27 @@ class Contract(models.Model):
     salesforce_id = models.CharField(max_length=80)
     salesforce_case_id = models.CharField(max_length=80)
     link_to_salesforce_case = models.CharField(max_length=120)
+    # Unaccented, lowercased name and email, maintained by refresh_organizer_search
+    organizer_search = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Also serves the contracts list keyset ordering on (signed_date, id)
+            models.Index(fields=['signed_date', 'id'], name='contract_signed_date_id_idx'),
+            models.Index(fields=['organizer_email'], name='contract_org_email_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.refresh_organizer_search()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'organizer_account_name', 'organizer_email'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'organizer_search'}
+        super().save(*args, **kwargs)
+
+    def refresh_organizer_search(self):
+        self.organizer_search = normalize_search_text(
+            '{} {}'.format(self.organizer_account_name, self.organizer_email)
+        )
 
     @property
     def details(self):
@@ -33,8 +82,56 @@ class Contract(models.Model):
         return self
 
 
+AMOUNT_FIELD = models.DecimalField(max_digits=19, decimal_places=2)
+# SQL twin of Installment.balance: missing amounts count as zero
+BALANCE = (
+    Coalesce(F('upfront_projection'), Value(0), output_field=AMOUNT_FIELD) -
+    Coalesce(F('recoup_amount'), Value(0), output_field=AMOUNT_FIELD)
+)
+
+
+class InstallmentQuerySet(models.QuerySet):
+
+    def with_balance(self):
+        return self.annotate(balance_amount=BALANCE)
+
+    def totals(self):
+        totals = self.aggregate(
+            upfront_projection=Sum('upfront_projection'),
+            recoup_amount=Sum('recoup_amount'),
+        )
+        # SUM of no rows is NULL, and none() skips the query altogether
+        totals = {name: total or 0 for name, total in totals.items()}
+        totals['balance'] = totals['upfront_projection'] - totals['recoup_amount']
+        return totals
+
+    def summary(self):
+        """Totals per status, recoup flag and payment month, in one GROUP BY query."""
+        # Year and month rather than TruncMonth, which fails on NULL dates in SQLite
+        groups = self.order_by().annotate(
+            year=ExtractYear('payment_date'),
+            month=ExtractMonth('payment_date'),
+        ).values(
+            'status',
+            'is_recoup',
+            'year',
+            'month',
+        ).annotate(
+            installments=Count('id'),
+            contracts=Count('contract', distinct=True),
+            upfront_projection=Sum('upfront_projection'),
+            recoup_amount=Sum('recoup_amount'),
+        ).order_by('year', 'month', 'status', 'is_recoup')
+        for group in groups:
+            group['upfront_projection'] = group['upfront_projection'] or 0
+            group['recoup_amount'] = group['recoup_amount'] or 0
+            group['balance'] = group['upfront_projection'] - group['recoup_amount']
+            yield group
+
+
 class Installment(models.Model):
-    contract = models.ForeignKey(Contract, on_delete=models.CASCADE)
+    # installment_contract_st_idx leads with contract_id and serves the FK lookups
+    contract = models.ForeignKey(Contract, on_delete=models.CASCADE, db_index=False)
     is_recoup = models.BooleanField(blank=True)
     status = models.CharField(max_length=80, default=STATUS_COMMITED_APPROVED, choices=STATUS, null=True, blank=True)
     upfront_projection = models.DecimalField(
@@ -50,6 +147,17 @@ class Installment(models.Model):
     gtf = models.DecimalField(max_digits=19, decimal_places=2, null=True, blank=True, verbose_name="GTF")
     gts = models.DecimalField(max_digits=19, decimal_places=2, null=True, blank=True, verbose_name="GTS")
 
+    objects = InstallmentQuerySet.as_manager()
+
+    class Meta:
+        # Match the InstallmentsFilter lookups; the date columns also serve range scans
+        indexes = [
+            models.Index(fields=['contract', 'status'], name='installment_contract_st_idx'),
+            models.Index(fields=['status', 'payment_date'], name='installment_st_payment_idx'),
+            models.Index(fields=['payment_date'], name='installment_payment_idx'),
+            models.Index(fields=['maximum_payment_date'], name='installment_max_payment_idx'),
+        ]
+
     @property
     def balance(self):
         upfront_projection = self.upfront_projection or 0
@@ -69,6 +177,41 @@ class Installment(models.Model):
         return self
 
 
+# Sent after InstallmentCondition queryset updates, which skip post_save
+conditions_updated = Signal(providing_args=['installment_ids'])
+
+
+class InstallmentConditionQuerySet(models.QuerySet):
+
+    def update_done(self, done):
+        installment_ids = list(self.order_by().values_list('installment_id', flat=True).distinct())
+        with transaction.atomic():
+            updated = self.update(done=done)
+            conditions_updated.send(sender=self.model, installment_ids=installment_ids)
+        return updated
+
+    def toggle_done(self):
+        """Flip done on every row in one conditional UPDATE, so concurrent toggles cannot race."""
+        return self.update_done(Case(
+            When(done__isnull=True, then=Value(timezone.now())),
+            default=Value(None),
+            output_field=models.DateTimeField(),
+        ))
+
+    def set_done(self, done_ids=(), undone_ids=()):
+        """
+        Mark done_ids done, keeping the date of those already done, and
+        undone_ids undone, in one UPDATE keyed on the primary key.
+        """
+        done_ids, undone_ids = list(done_ids), list(undone_ids)
+        return self.filter(pk__in=done_ids + undone_ids).update_done(Case(
+            When(pk__in=done_ids, done__isnull=True, then=Value(timezone.now())),
+            When(pk__in=done_ids, then=F('done')),
+            default=Value(None),
+            output_field=models.DateTimeField(),
+        ))
+
+
 class InstallmentCondition(models.Model):
     condition_name = models.CharField(max_length=80)
     done = models.DateTimeField(blank=True, null=True)
@@ -78,12 +221,14 @@ class InstallmentCondition(models.Model):
         blank=True,
     )
 
+    objects = InstallmentConditionQuerySet.as_manager()
+
     def delete_upload_file(self):
         self.upload_file.delete()
 
     def toggle_done(self):
-        self.done = None if self.done else datetime.datetime.now()
-        self.save()
+        InstallmentCondition.objects.filter(pk=self.pk).toggle_done()
+        self.refresh_from_db(fields=['done'])
 
 
 class Attachment(models.Model):
@@ -97,3 +242,139 @@ class Event(models.Model):
     event_id = models.CharField(max_length=40)
     event_name = models.CharField(max_length=40)
     contract = models.ForeignKey(Contract, on_delete=models.CASCADE, related_name='events')
+
+
+class InstallmentReportQuerySet(models.QuerySet):
+
+    def totals(self):
+        totals = self.aggregate(
+            upfront_projection=Sum('upfront_projection'),
+            recoup_amount=Sum('recoup_amount'),
+            balance=Sum('balance'),
+        )
+        # SUM of no rows is NULL, and none() skips the query altogether
+        return {name: total or 0 for name, total in totals.items()}
+
+
+class InstallmentReport(models.Model):
+    """
+    One row per installment with its contract columns, balance and condition
+    and event counts copied in, so the installments list reads a single table.
+    app.signals keeps it current; `manage.py rebuild_installment_reports`
+    recreates it from scratch.
+    """
+    installment = models.OneToOneField(
+        Installment,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='report',
+    )
+    contract = models.ForeignKey(Contract, on_delete=models.CASCADE, related_name='installment_reports')
+    organizer_account_name = models.CharField(max_length=80)
+    organizer_email = models.EmailField()
+    signed_date = models.DateField()
+    is_recoup = models.BooleanField(blank=True)
+    status = models.CharField(max_length=80, choices=STATUS, null=True, blank=True)
+    upfront_projection = models.DecimalField(max_digits=19, decimal_places=2, null=True, blank=True)
+    recoup_amount = models.DecimalField(max_digits=19, decimal_places=2, null=True, blank=True)
+    balance = models.DecimalField(max_digits=19, decimal_places=2, default=0)
+    maximum_payment_date = models.DateField(null=True, blank=True)
+    payment_date = models.DateField(null=True, blank=True)
+    gtf = models.DecimalField(max_digits=19, decimal_places=2, null=True, blank=True)
+    gts = models.DecimalField(max_digits=19, decimal_places=2, null=True, blank=True)
+    conditions_done = models.PositiveIntegerField(default=0)
+    conditions_total = models.PositiveIntegerField(default=0)
+    events = models.PositiveIntegerField(default=0)
+
+    objects = InstallmentReportQuerySet.as_manager()
+
+    class Meta:
+        # Match the InstallmentsFilter lookups, without the join to Contract
+        indexes = [
+            models.Index(fields=['status', 'payment_date'], name='report_st_payment_idx'),
+            models.Index(fields=['payment_date'], name='report_payment_idx'),
+            models.Index(fields=['maximum_payment_date'], name='report_max_payment_idx'),
+            models.Index(fields=['signed_date'], name='report_signed_date_idx'),
+            models.Index(fields=['balance'], name='report_balance_idx'),
+        ]
+
+
+class SalesforceContract(models.Model):
+    salesforce_id = models.CharField(max_length=80, unique=True)
+    organizer_email = models.CharField(max_length=254, blank=True)
+    organizer_name = models.CharField(max_length=255, blank=True)
+    activated_date = models.DateTimeField(null=True, blank=True)
+    billing_country = models.CharField(max_length=80, blank=True)
+    system_modstamp = models.DateTimeField()
+
+
+class SalesforceCase(models.Model):
+    salesforce_id = models.CharField(max_length=80, unique=True)
+    case_number = models.CharField(max_length=80, db_index=True)
+    contract = models.ForeignKey(
+        SalesforceContract,
+        to_field='salesforce_id',
+        db_constraint=False,
+        null=True,
+        on_delete=models.DO_NOTHING,
+        related_name='cases',
+    )
+    subject = models.CharField(max_length=255, blank=True)
+    description = models.TextField(blank=True)
+    link_to_salesforce_case = models.CharField(max_length=255, blank=True)
+    system_modstamp = models.DateTimeField()
+
+    def as_search_result(self):
+        return {
+            'case_id': self.salesforce_id,
+            'case_number': self.case_number,
+            'contract_id': self.contract_id,
+            'description': self.description,
+            'link_to_salesforce_case': self.link_to_salesforce_case,
+            'organizer_email': self.contract.organizer_email,
+            'organizer_name': self.contract.organizer_name,
+            'signed_date': self.contract.activated_date.strftime(SF_DATETIME_FORMAT),
+        }
+
+
+class SyncWatermark(models.Model):
+    object_name = models.CharField(max_length=40, unique=True)
+    system_modstamp = models.DateTimeField()
+
+
+def stalled_export_jobs():
+    """Running jobs whose worker stopped reporting, e.g. killed by a restart or deploy."""
+    cutoff = timezone.now() - datetime.timedelta(seconds=EXPORT_HEARTBEAT_TIMEOUT)
+    return Q(status=EXPORT_RUNNING) & (Q(heartbeat__lt=cutoff) | Q(heartbeat__isnull=True))
+
+
+class ExportJobQuerySet(models.QuerySet):
+
+    def claimable(self):
+        return self.filter(Q(status=EXPORT_PENDING) | stalled_export_jobs())
+
+    def reusable(self):
+        """Jobs an identical export request can wait on instead of queueing a new one."""
+        return self.filter(status__in=[EXPORT_PENDING, EXPORT_RUNNING, EXPORT_DONE]).exclude(stalled_export_jobs())
+
+
+class ExportJob(models.Model):
+    params_hash = models.CharField(max_length=64, db_index=True)
+    params = models.TextField()
+    status = models.CharField(max_length=10, choices=EXPORT_STATUS, default=EXPORT_PENDING)
+    file = models.FileField(upload_to='exports/', blank=True)
+    rows = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    objects = ExportJobQuerySet.as_manager()
+
+    @staticmethod
+    def hash_params(params):
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @property
+    def filter_params(self):
+        return json.loads(self.params)
@@ -0,0 +1,231 @@
+import datetime
+import functools
+import hashlib
+import json
+import operator
+import uuid
+
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.http import Http404
+from pure_pagination import Paginator
+
+from app import (
+    COUNT_CACHE_GENERATION_KEY,
+    COUNT_CACHE_IGNORED_PARAMS,
+    COUNT_CACHE_TIMEOUT,
+    ESTIMATED_COUNT_CAP,
+    KEYSET_CURSOR_SALT,
+)
+
+
+NEXT = 'next'
+PREVIOUS = 'previous'
+
+
+def encode_cursor(direction, values):
+    return signing.dumps(
+        [direction, [value.isoformat() if isinstance(value, datetime.date) else value for value in values]],
+        salt=KEYSET_CURSOR_SALT,
+        compress=True,
+    )
+
+
+def decode_cursor(cursor):
+    try:
+        direction, values = signing.loads(cursor, salt=KEYSET_CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise Http404('Invalid cursor')
+    if direction not in (NEXT, PREVIOUS):
+        raise Http404('Invalid cursor')
+    return direction, values
+
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+
+def keyset_filter(ordering, values):
+    """
+    Rows strictly after `values` in `ordering`, e.g. for ('signed_date', 'id'):
+    signed_date > x OR (signed_date = x AND id > y)
+    """
+    clauses = []
+    for position, field in enumerate(ordering):
+        equal = {name.lstrip('-'): value for name, value in zip(ordering[:position], values)}
+        lookup = '{}__{}'.format(field.lstrip('-'), 'lt' if field.startswith('-') else 'gt')
+        clauses.append(Q(**equal) & Q(**{lookup: values[position]}))
+    return functools.reduce(operator.or_, clauses)
+
+
+def keyset_values(instance, ordering):
+    return [
+        functools.reduce(getattr, field.lstrip('-').split('__'), instance)
+        for field in ordering
+    ]
+
+
+class KeysetPage:
+    is_keyset = True
+    count = None
+    count_is_approximate = False
+
+    def __init__(self, object_list, ordering, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next and bool(object_list)
+        self.has_previous = has_previous and bool(object_list)
+        self.next_cursor = encode_cursor(NEXT, keyset_values(object_list[-1], ordering)) if self.has_next else None
+        self.previous_cursor = (
+            encode_cursor(PREVIOUS, keyset_values(object_list[0], ordering)) if self.has_previous else None
+        )
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def keyset_paginate(queryset, ordering, per_page, cursor=None):
+    """
+    Fetch one page after (or before) the cursor. The cost does not depend on
+    how deep the page is, as long as `ordering` is backed by an index.
+    """
+    direction, values = decode_cursor(cursor) if cursor else (NEXT, None)
+    if direction == PREVIOUS:
+        ordering_used = reverse_ordering(ordering)
+    else:
+        ordering_used = list(ordering)
+    queryset = queryset.order_by(*ordering_used)
+    if values is not None:
+        queryset = queryset.filter(keyset_filter(ordering_used, values))
+    rows = list(queryset[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == PREVIOUS:
+        rows.reverse()
+        return KeysetPage(rows, ordering, has_next=True, has_previous=more)
+    return KeysetPage(rows, ordering, has_next=more, has_previous=values is not None)
+
+
+def estimated_count(queryset, cap=ESTIMATED_COUNT_CAP):
+    """
+    Return (count, approximate). PostgreSQL answers from the planner's row
+    estimate; other backends count at most `cap` rows.
+    """
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            return int(cursor.fetchone()[0][0]['Plan']['Plan Rows']), True
+    count = queryset.order_by()[:cap + 1].count()
+    return min(count, cap), count > cap
+
+
+def count_cache_key(label, query_dict, kind):
+    """Key a list count by view, count kind, write generation and the filter params that shape the rows."""
+    params = {
+        name: sorted(value for value in query_dict.getlist(name) if value)
+        for name in query_dict
+        if name not in COUNT_CACHE_IGNORED_PARAMS
+    }
+    params = {name: values for name, values in params.items() if values}
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+    generation = cache.get_or_set(COUNT_CACHE_GENERATION_KEY, 0, None)
+    return 'list-count:{}:{}:{}:{}'.format(generation, label, kind, digest)
+
+
+def invalidate_counts():
+    """Retire every cached list count. Called on Contract and Installment writes."""
+    # A fresh token rather than cache.incr(): BaseCache.incr() (FileBasedCache in
+    # production) re-sets the key with the default timeout, and an expired
+    # generation would bring the old counts back
+    cache.set(COUNT_CACHE_GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    pure_pagination Paginator that reads and stores its count under `count_key`.
+    On PostgreSQL a result estimated above ESTIMATED_COUNT_CAP rows keeps the
+    planner's estimate instead of running COUNT(*), so its last page numbers
+    are approximate; smaller results and other backends are counted exactly.
+    """
+
+    def __init__(self, *args, count_key=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_key = count_key
+
+    def _get_count(self):
+        if self._count is None and self.count_key:
+            self._count = cache.get(self.count_key)
+            if self._count is None:
+                self._count = self._estimate_large_count()
+                if self._count is None:
+                    self._count = super()._get_count()
+                cache.set(self.count_key, self._count, COUNT_CACHE_TIMEOUT)
+        return super()._get_count()
+    count = property(_get_count)
+
+    def _estimate_large_count(self):
+        if connection.vendor != 'postgresql' or not isinstance(self.object_list, QuerySet):
+            return None
+        count, _ = estimated_count(self.object_list)
+        return count if count > ESTIMATED_COUNT_CAP else None
+
+
+class KeysetPaginationMixin:
+    """
+    Paginate a ListView by keyset on `keyset_ordering`, with opaque `cursor`
+    links. Requests that ask for a page number or a column sort fall back to
+    the regular OFFSET pagination. Either way the count comes from the cache
+    when these filters were counted before.
+    """
+    keyset_ordering = ('id',)
+    estimate_count = True
+
+    def use_keyset(self):
+        return not ({'page', 'sort'} & set(self.request.GET))
+
+    def count_cache_key(self, kind):
+        return count_cache_key(type(self).__name__, self.request.GET, kind)
+
+    def get_estimated_count(self, queryset):
+        key = self.count_cache_key('estimate')
+        count = cache.get(key)
+        if count is None:
+            count = estimated_count(queryset)
+            cache.set(key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return CachedCountPaginator(
+            queryset,
+            per_page,
+            orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+            request=self.request,
+            count_key=self.count_cache_key('offset'),
+        )
+
+    def cursor_querystring(self, cursor):
+        query = self.request.GET.copy()
+        query.pop('cursor', None)
+        query['cursor'] = cursor
+        return query.urlencode()
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset():
+            return super().paginate_queryset(queryset, page_size)
+        page = keyset_paginate(queryset, self.keyset_ordering, page_size, self.request.GET.get('cursor'))
+        page.next_querystring = self.cursor_querystring(page.next_cursor) if page.has_next else None
+        page.previous_querystring = self.cursor_querystring(page.previous_cursor) if page.has_previous else None
+        if self.estimate_count:
+            page.count, page.count_is_approximate = self.get_estimated_count(queryset)
+        self.keyset_page = page
+        return None, page, page.object_list, page.has_other_pages()
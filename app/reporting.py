@@ -0,0 +1,149 @@
+from django.db import transaction
+from django.db.models import (
+    Count,
+    F,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce
+
+from app import INSTALLMENT_REPORT_CHUNK_SIZE
+from app.models import (
+    AMOUNT_FIELD,
+    Event,
+    Installment,
+    InstallmentCondition,
+    InstallmentReport,
+)
+from app.pagination import invalidate_counts
+
+
+def build_reports(installment_ids):
+    """Unsaved InstallmentReport rows for the given installments, read with three queries."""
+    installments = list(Installment.objects.filter(id__in=installment_ids).select_related('contract'))
+    conditions = {
+        installment_id: (done, total)
+        for installment_id, done, total in InstallmentCondition.objects.filter(
+            installment_id__in=installment_ids,
+        ).order_by().values('installment_id').annotate(
+            done=Count('done'),
+            total=Count('id'),
+        ).values_list('installment_id', 'done', 'total')
+    }
+    events = dict(
+        Event.objects.filter(
+            contract_id__in={installment.contract_id for installment in installments},
+        ).order_by().values('contract_id').annotate(total=Count('id')).values_list('contract_id', 'total')
+    )
+    reports = []
+    for installment in installments:
+        contract = installment.contract
+        conditions_done, conditions_total = conditions.get(installment.id, (0, 0))
+        reports.append(InstallmentReport(
+            installment=installment,
+            contract=contract,
+            organizer_account_name=contract.organizer_account_name,
+            organizer_email=contract.organizer_email,
+            signed_date=contract.signed_date,
+            is_recoup=installment.is_recoup,
+            status=installment.status,
+            upfront_projection=installment.upfront_projection,
+            recoup_amount=installment.recoup_amount,
+            balance=installment.balance,
+            maximum_payment_date=installment.maximum_payment_date,
+            payment_date=installment.payment_date,
+            gtf=installment.gtf,
+            gts=installment.gts,
+            conditions_done=conditions_done,
+            conditions_total=conditions_total,
+            events=events.get(installment.contract_id, 0),
+        ))
+    return reports
+
+
+def refresh_installment_reports(installment_ids):
+    """Replace the report rows of these installments; rows of deleted installments just go away."""
+    installment_ids = list(installment_ids)
+    with transaction.atomic():
+        for start in range(0, len(installment_ids), INSTALLMENT_REPORT_CHUNK_SIZE):
+            chunk = installment_ids[start:start + INSTALLMENT_REPORT_CHUNK_SIZE]
+            InstallmentReport.objects.filter(installment_id__in=chunk).delete()
+            InstallmentReport.objects.bulk_create(build_reports(chunk))
+
+
+def refresh_contract_reports(contract):
+    InstallmentReport.objects.filter(contract_id=contract.id).update(
+        organizer_account_name=contract.organizer_account_name,
+        organizer_email=contract.organizer_email,
+        signed_date=contract.signed_date,
+    )
+
+
+def count_conditions(conditions):
+    """Correlated count of `conditions` per report row, for use in an UPDATE."""
+    return Coalesce(Subquery(
+        conditions.filter(
+            installment_id=OuterRef('installment_id'),
+        ).order_by().values('installment_id').annotate(total=Count('id')).values('total'),
+        output_field=IntegerField(),
+    ), Value(0))
+
+
+def refresh_condition_counts(installment_ids):
+    # Only counts are updated: while an installment is being deleted its
+    # conditions go first, and rebuilding its report then would recreate it
+    installment_ids = list(installment_ids)
+    conditions = InstallmentCondition.objects.all()
+    for start in range(0, len(installment_ids), INSTALLMENT_REPORT_CHUNK_SIZE):
+        InstallmentReport.objects.filter(
+            installment_id__in=installment_ids[start:start + INSTALLMENT_REPORT_CHUNK_SIZE],
+        ).update(
+            conditions_done=count_conditions(conditions.filter(done__isnull=False)),
+            conditions_total=count_conditions(conditions),
+        )
+
+
+def refresh_event_counts(contract_id):
+    InstallmentReport.objects.filter(contract_id=contract_id).update(
+        events=Event.objects.filter(contract_id=contract_id).count(),
+    )
+
+
+def rebuild_reports(chunk_size=INSTALLMENT_REPORT_CHUNK_SIZE):
+    """Recreate the whole reporting table from the installments, in one transaction."""
+    created = 0
+    with transaction.atomic():
+        InstallmentReport.objects.all().delete()
+        last_id = 0
+        while True:
+            chunk = list(
+                Installment.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not chunk:
+                return created
+            InstallmentReport.objects.bulk_create(build_reports(chunk))
+            created += len(chunk)
+            last_id = chunk[-1]
+
+
+def update_installments(reports, changes):
+    """
+    Apply `changes` (status, payment_date and/or recoup_amount) to the
+    installments behind the `reports` queryset, and to the reports
+    themselves, with one UPDATE each. Returns the installments updated.
+    """
+    report_changes = dict(changes)
+    if 'recoup_amount' in changes:
+        # SET expressions read the old row, so use the new amount rather than F('recoup_amount')
+        report_changes['balance'] = (
+            Coalesce(F('upfront_projection'), Value(0), output_field=AMOUNT_FIELD) -
+            Value(changes['recoup_amount'] or 0, output_field=AMOUNT_FIELD)
+        )
+    with transaction.atomic():
+        # Installments first: the report filter must still see the old values
+        updated = Installment.objects.filter(pk__in=reports.values('installment_id')).update(**changes)
+        reports.update(**report_changes)
+    invalidate_counts()
+    return updated
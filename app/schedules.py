@@ -0,0 +1,110 @@
+from decimal import (
+    ROUND_DOWN,
+    Decimal,
+)
+
+from dateutil.relativedelta import relativedelta
+from django.db import (
+    connection,
+    transaction,
+)
+from django.db.models import (
+    Case,
+    F,
+    Value,
+    When,
+)
+
+from app import BASIC_CONDITIONS
+from app.models import (
+    Installment,
+    InstallmentCondition,
+)
+from app.pagination import invalidate_counts
+from app.reporting import refresh_installment_reports
+
+
+CENT = Decimal('0.01')
+
+
+def split_amount(total, tranches):
+    """Split `total` into `tranches` amounts in cents; the last one takes the rounding remainder."""
+    share = (Decimal(total) / tranches).quantize(CENT, rounding=ROUND_DOWN)
+    return [share] * (tranches - 1) + [Decimal(total) - share * (tranches - 1)]
+
+
+def schedule_dates(first_date, tranches, months_between=1):
+    """`tranches` dates, `months_between` months apart; month ends are clamped (Jan 31 -> Feb 28)."""
+    return [first_date + relativedelta(months=months_between * number) for number in range(tranches)]
+
+
+def build_schedule(total_upfront, tranches, first_maximum_payment_date, months_between=1, is_recoup=False):
+    """Unsaved installments that split `total_upfront` over monthly maximum payment dates."""
+    return [
+        Installment(
+            is_recoup=is_recoup,
+            upfront_projection=amount,
+            maximum_payment_date=maximum_payment_date,
+        )
+        for amount, maximum_payment_date in zip(
+            split_amount(total_upfront, tranches),
+            schedule_dates(first_maximum_payment_date, tranches, months_between),
+        )
+    ]
+
+
+def create_installments(contract_id, installments):
+    """
+    Save `installments` for the contract with their BASIC_CONDITIONS, in one
+    transaction and a fixed number of queries however many there are.
+    bulk_create sends no signals, so the reports and list counts are
+    refreshed here.
+    """
+    for installment in installments:
+        installment.contract_id = contract_id
+    with transaction.atomic():
+        Installment.objects.bulk_create(installments)
+        if not connection.features.can_return_ids_from_bulk_insert:
+            # SQLite does not hand back the new ids; inside this transaction
+            # they are the contract's highest ones
+            ids = Installment.objects.filter(
+                contract_id=contract_id,
+            ).order_by('-id').values_list('id', flat=True)[:len(installments)]
+            for installment, installment_id in zip(installments, reversed(list(ids))):
+                installment.pk = installment_id
+        InstallmentCondition.objects.bulk_create([
+            InstallmentCondition(installment=installment, condition_name=condition)
+            for installment in installments
+            for condition in BASIC_CONDITIONS
+        ])
+        refresh_installment_reports([installment.pk for installment in installments])
+    invalidate_counts()
+    return installments
+
+
+def bulk_update_installments(installments, fields):
+    """
+    Write `fields` of the saved `installments` with a single
+    UPDATE ... SET field = CASE id WHEN ... END, in one transaction (Django
+    1.11 has no QuerySet.bulk_update()). update() sends no signals, so the
+    reports and list counts are refreshed here.
+    """
+    if not installments or not fields:
+        return 0
+    ids = [installment.pk for installment in installments]
+    changes = {}
+    for name in fields:
+        field = Installment._meta.get_field(name)
+        changes[name] = Case(
+            *[
+                When(pk=installment.pk, then=Value(getattr(installment, name), output_field=field))
+                for installment in installments
+            ],
+            default=F(name),
+            output_field=field,
+        )
+    with transaction.atomic():
+        updated = Installment.objects.filter(pk__in=ids).update(**changes)
+        refresh_installment_reports(ids)
+    invalidate_counts()
+    return updated
@@ -0,0 +1,97 @@
+import unicodedata
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from app import (
+    ORGANIZER_SEARCH_FTS_TABLE,
+    ORGANIZER_SEARCH_MIN_TRIGRAM_LENGTH,
+)
+
+
+def normalize_search_text(value):
+    """Lowercase and strip accents, so 'João' and 'joao' compare equal."""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+class FtsMatches(RawSQL):
+    """
+    The contract ids (FTS5 rowids) matching `phrase`, as the right-hand side
+    of an __in filter. Unlike extra(where=...), the filtered column keeps its
+    alias when the queryset is itself used as a subquery.
+    """
+
+    def __init__(self, phrase):
+        super().__init__(
+            'SELECT rowid FROM {fts} WHERE {fts} MATCH %s'.format(fts=ORGANIZER_SEARCH_FTS_TABLE),
+            [phrase],
+        )
+
+    def as_sql(self, compiler, connection):
+        # The IN lookup adds the parentheses; RawSQL's own would turn this into a scalar subquery
+        return self.sql, self.params
+
+
+class OrganizerSearch:
+    """
+    Substring match on Contract.organizer_search; works on any backend, unindexed.
+    matching() filters contracts, or any queryset whose contract_field points at one.
+    """
+
+    def matching(self, queryset, value, contract_field=None):
+        lookup = 'organizer_search__contains'
+        if contract_field:
+            lookup = '{}__{}'.format(contract_field, lookup)
+        return queryset.filter(**{lookup: normalize_search_text(value.strip())})
+
+
+class TrigramOrganizerSearch(OrganizerSearch):
+    """PostgreSQL: the pg_trgm GIN index answers the LIKE, similarity ranks the contracts."""
+
+    def matching(self, queryset, value, contract_field=None):
+        queryset = super().matching(queryset, value, contract_field)
+        if contract_field:
+            return queryset
+        return queryset.annotate(
+            search_rank=TrigramSimilarity('organizer_search', normalize_search_text(value.strip())),
+        ).order_by('-search_rank')
+
+
+class Fts5OrganizerSearch(OrganizerSearch):
+    """SQLite: the FTS5 trigram table answers the match, bm25 ranks the contracts."""
+
+    def matching(self, queryset, value, contract_field=None):
+        term = normalize_search_text(value.strip())
+        if len(term) < ORGANIZER_SEARCH_MIN_TRIGRAM_LENGTH:
+            # The trigram tokenizer cannot match shorter terms
+            return super().matching(queryset, value, contract_field)
+        phrase = '"{}"'.format(term.replace('"', '""'))
+        queryset = queryset.filter(**{'{}__in'.format(contract_field or 'id'): FtsMatches(phrase)})
+        if contract_field:
+            return queryset
+        return queryset.annotate(
+            search_rank=RawSQL(
+                'SELECT bm25({fts}) FROM {fts} WHERE {fts} MATCH %s AND rowid = {table}.id'.format(
+                    fts=ORGANIZER_SEARCH_FTS_TABLE,
+                    table=connection.ops.quote_name(queryset.model._meta.db_table),
+                ),
+                [phrase],
+            ),
+        ).order_by('search_rank')
+
+
+VENDOR_BACKENDS = {
+    'postgresql': TrigramOrganizerSearch,
+    'sqlite': Fts5OrganizerSearch,
+}
+
+
+def get_organizer_search():
+    backend = getattr(settings, 'ORGANIZER_SEARCH_BACKEND', None)
+    if backend:
+        return import_string(backend)()
+    return VENDOR_BACKENDS.get(connection.vendor, OrganizerSearch)()
@@ -0,0 +1,58 @@
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+)
+from django.dispatch import receiver
+
+from app.models import (
+    Contract,
+    Event,
+    Installment,
+    InstallmentCondition,
+    conditions_updated,
+)
+from app.pagination import invalidate_counts
+from app.reporting import (
+    refresh_condition_counts,
+    refresh_contract_reports,
+    refresh_event_counts,
+    refresh_installment_reports,
+)
+
+
+@receiver(post_save, sender=Contract)
+@receiver(post_delete, sender=Contract)
+@receiver(post_save, sender=Installment)
+@receiver(post_delete, sender=Installment)
+def invalidate_list_counts(sender, **kwargs):
+    invalidate_counts()
+
+
+# Deletes of contracts and installments cascade to their report rows
+
+@receiver(post_save, sender=Installment)
+def refresh_installment_report(sender, instance, **kwargs):
+    refresh_installment_reports([instance.pk])
+
+
+@receiver(post_save, sender=Contract)
+def refresh_contract_report(sender, instance, created, **kwargs):
+    if not created:
+        refresh_contract_reports(instance)
+
+
+@receiver(post_save, sender=InstallmentCondition)
+@receiver(post_delete, sender=InstallmentCondition)
+def refresh_installment_condition_counts(sender, instance, **kwargs):
+    refresh_condition_counts([instance.installment_id])
+
+
+@receiver(conditions_updated, sender=InstallmentCondition)
+def refresh_updated_condition_counts(sender, installment_ids, **kwargs):
+    refresh_condition_counts(installment_ids)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def refresh_contract_event_counts(sender, instance, **kwargs):
+    refresh_event_counts(instance.contract_id)
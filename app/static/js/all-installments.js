@@ -2,6 +2,8 @@ $( function() {
   $( "#datepicker_signed_date" ).datepicker();
   $( "#datepicker_max_payment_date" ).datepicker();
   $( "#datepicker_payment_date" ).datepicker();
+  $( ".datepicker-range" ).datepicker({ dateFormat: "yy-mm-dd" });
+  $( "#datepicker_bulk_payment_date" ).datepicker({ dateFormat: "yy-mm-dd" });
 } );
 
 const csvExportLink = document.querySelector("#export-csv");
@@ -11,3 +13,47 @@ if (csvExportLink) {
   const uriParam = connector + "download=true";
   csvExportLink.href = currentUrl + uriParam;
 }
+
+const exportJobForm = document.querySelector("#export-job");
+if (exportJobForm) {
+  const pollExport = job => {
+    if (job.download_url) {
+      window.location = job.download_url;
+    } else if (job.status === "failed") {
+      alert("The export could not be built.");
+    } else {
+      setTimeout(() => fetch(job.status_url).then(r => r.json()).then(pollExport), 2000);
+    }
+  };
+
+  exportJobForm.addEventListener("submit", e => {
+    e.preventDefault();
+    const data = new FormData(exportJobForm);
+    new URLSearchParams(window.location.search).forEach((value, key) => data.append(key, value));
+    fetch(exportJobForm.action, { method: "POST", body: data, credentials: "same-origin" })
+      .then(r => r.json())
+      .then(pollExport);
+  });
+}
+
+const bulkUpdateForm = document.querySelector("#bulk-update");
+if (bulkUpdateForm) {
+  bulkUpdateForm.addEventListener("submit", e => {
+    e.preventDefault();
+    if (!confirm("Apply these changes to every installment matching the current filters?")) return;
+    fetch(bulkUpdateForm.action + window.location.search, {
+      method: "POST",
+      body: new FormData(bulkUpdateForm),
+      credentials: "same-origin",
+    })
+      .then(r => r.json())
+      .then(result => {
+        if (result.errors) {
+          alert(Object.values(result.errors).join("\n"));
+        } else {
+          alert(result.updated + " installments updated.");
+          window.location.reload();
+        }
+      });
+  });
+}
@@ -1,3 +1,52 @@
 $( function() {
     $( "#datepicker_maximum_payment_date" ).datepicker();
+    $( "#datepicker_first_maximum_payment_date" ).datepicker();
 } );
+
+const installmentGrid = document.querySelector("#installment-grid");
+if (installmentGrid) {
+  const prefix = "grid";
+  installmentGrid.querySelectorAll("tbody tr").forEach(row => {
+    row.addEventListener("change", () => row.classList.add("table-warning"));
+  });
+
+  installmentGrid.addEventListener("submit", e => {
+    e.preventDefault();
+    // Only the edited rows are posted, renumbered as a formset of their own
+    const rows = Array.from(installmentGrid.querySelectorAll("tbody tr.table-warning"));
+    if (!rows.length) return;
+    const data = new FormData();
+    data.append("csrfmiddlewaretoken", installmentGrid.querySelector("[name=csrfmiddlewaretoken]").value);
+    data.append(prefix + "-TOTAL_FORMS", rows.length);
+    data.append(prefix + "-INITIAL_FORMS", rows.length);
+    data.append(prefix + "-MIN_NUM_FORMS", 0);
+    data.append(prefix + "-MAX_NUM_FORMS", 1000);
+    rows.forEach((row, index) => {
+      row.querySelectorAll("input, select").forEach(input => {
+        if (input.type === "checkbox" && !input.checked) return;
+        data.append(input.name.replace(/^grid-\d+-/, prefix + "-" + index + "-"), input.value);
+      });
+    });
+    fetch(installmentGrid.action, { method: "POST", body: data, credentials: "same-origin" })
+      .then(r => r.json())
+      .then(result => {
+        installmentGrid.querySelectorAll("tbody tr").forEach(row => row.classList.remove("table-danger"));
+        if (result.errors) {
+          const messages = result.non_form_errors.slice();
+          result.errors.forEach((errors, index) => {
+            if (Object.keys(errors).length) {
+              rows[index].classList.add("table-danger");
+              Object.entries(errors).forEach(([name, error]) => messages.push(name + ": " + error.join(" ")));
+            }
+          });
+          alert(messages.join("\n"));
+          return;
+        }
+        result.installments.forEach(installment => {
+          const row = installmentGrid.querySelector("tr[data-installment='" + installment.id + "']");
+          row.classList.remove("table-warning");
+          row.querySelector(".grid-balance").textContent = installment.balance;
+        });
+      });
+  });
+}
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+
+from django.core.cache import cache
+from storages.backends.dropbox import DropBoxStorage
+
+from app import (
+    DROPBOX_LINK_CACHE_KEY,
+    DROPBOX_LINK_CACHE_TIMEOUT,
+    DROPBOX_LINK_MAX_WORKERS,
+)
+
+
+class CachedLinkDropBoxStorage(DropBoxStorage):
+    """
+    Dropbox storage that remembers temporary links while they are still valid,
+    so rendering a file link does not cost a Dropbox round trip every time.
+    """
+
+    def link_cache_key(self, name):
+        return DROPBOX_LINK_CACHE_KEY.format(hashlib.sha1(self._full_path(name).encode('utf-8')).hexdigest())
+
+    def url(self, name):
+        return self.urls([name])[name]
+
+    def urls(self, names):
+        names = list(set(names))
+        keys = {name: self.link_cache_key(name) for name in names}
+        cached = cache.get_many(keys.values())
+        links = {name: cached[key] for name, key in keys.items() if key in cached}
+        missing = [name for name in names if name not in links]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(DROPBOX_LINK_MAX_WORKERS, len(missing))) as executor:
+                resolved = dict(zip(missing, executor.map(super().url, missing)))
+            cache.set_many(
+                {keys[name]: link for name, link in resolved.items()},
+                DROPBOX_LINK_CACHE_TIMEOUT,
+            )
+            links.update(resolved)
+        return links
+
+    def delete(self, name):
+        super().delete(name)
+        cache.delete(self.link_cache_key(name))
@@ -0,0 +1,219 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Q
+
+from app import (
+    SF_DATETIME_FORMAT,
+    SYNC_BATCH_SIZE,
+)
+from app.models import (
+    Attachment,
+    Contract,
+    SalesforceCase,
+    SalesforceContract,
+    SyncWatermark,
+)
+from app.utils import (
+    attachment_data,
+    chunked,
+    SalesforceQuery,
+)
+
+
+CASES_WITH_CONTRACT_QUERY = "SELECT Contract__c from Case WHERE Contract__c != null"
+CONTRACT_FIELDS = "Id, Eventbrite_Username__c, Hoopla_Account_Name__c, ActivatedDate, BillingCountry, SystemModstamp"
+
+
+def parse_salesforce_datetime(value):
+    return datetime.datetime.strptime(value, SF_DATETIME_FORMAT) if value else None
+
+
+def iter_batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class SalesforceSync:
+    """
+    Pull the Contract, Case and Attachment changes made in Salesforce since the last run.
+
+    Every object keeps its own SystemModstamp watermark, which only moves forward
+    once a batch has been written, so an interrupted sync resumes where it stopped.
+
+    Records deleted in Salesforce are not removed from the mirror: SOQL does not
+    return them, and reconciling them would need the getDeleted API.
+    """
+
+    def __init__(self, sf_query=None, batch_size=SYNC_BATCH_SIZE):
+        self.sf_query = sf_query or SalesforceQuery()
+        self.batch_size = batch_size
+
+    def run(self):
+        return {
+            'Contract': self.sync_object(
+                'Contract',
+                "SELECT {} from Contract WHERE Id IN ({})".format(CONTRACT_FIELDS, CASES_WITH_CONTRACT_QUERY),
+                self.upsert_contracts,
+            ),
+            'Case': self.sync_object(
+                'Case',
+                "SELECT Id, Contract__c, Subject, Description, CaseNumber, Case_URL__c, SystemModstamp \
+                from Case WHERE Contract__c != null",
+                self.upsert_cases,
+            ),
+            'Attachment': self.sync_object(
+                'Attachment',
+                "SELECT Id, Name, ContentType, ParentId, SystemModstamp from Attachment \
+                WHERE ParentId IN ({})".format(CASES_WITH_CONTRACT_QUERY),
+                self.upsert_attachments,
+            ),
+        }
+
+    def sync_object(self, object_name, query, upsert):
+        watermark = SyncWatermark.objects.filter(
+            object_name=object_name,
+        ).values_list('system_modstamp', flat=True).first()
+        if watermark:
+            # >= so records modified within the same second as the watermark are not lost; upserts are idempotent
+            query += ' AND SystemModstamp >= {}'.format(watermark.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        query += ' ORDER BY SystemModstamp'
+
+        synced = 0
+        for batch in iter_batches(self.sf_query.iter_query(query), self.batch_size):
+            with transaction.atomic():
+                upsert(batch)
+                SyncWatermark.objects.update_or_create(
+                    object_name=object_name,
+                    defaults={'system_modstamp': parse_salesforce_datetime(batch[-1]['SystemModstamp'])},
+                )
+            synced += len(batch)
+        return synced
+
+    def upsert_contracts(self, records):
+        replace_mirror_rows(SalesforceContract, [
+            SalesforceContract(
+                salesforce_id=record['Id'],
+                organizer_email=record['Eventbrite_Username__c'] or '',
+                organizer_name=record['Hoopla_Account_Name__c'] or '',
+                activated_date=parse_salesforce_datetime(record['ActivatedDate']),
+                billing_country=record['BillingCountry'] or '',
+                system_modstamp=parse_salesforce_datetime(record['SystemModstamp']),
+            ) for record in records
+        ])
+        records_by_id = {record['Id']: record for record in records}
+        for contract in Contract.objects.filter(salesforce_id__in=records_by_id):
+            record = records_by_id[contract.salesforce_id]
+            if not record['ActivatedDate']:
+                continue
+            update_changed_fields(
+                contract,
+                organizer_account_name=record['Hoopla_Account_Name__c'],
+                organizer_email=record['Eventbrite_Username__c'],
+                signed_date=parse_salesforce_datetime(record['ActivatedDate']).date(),
+            )
+
+    def upsert_cases(self, records):
+        replace_mirror_rows(SalesforceCase, [
+            SalesforceCase(
+                salesforce_id=record['Id'],
+                case_number=record['CaseNumber'],
+                contract_id=record['Contract__c'],
+                subject=record['Subject'] or '',
+                description=record['Description'] or '',
+                link_to_salesforce_case=record['Case_URL__c'] or '',
+                system_modstamp=parse_salesforce_datetime(record['SystemModstamp']),
+            ) for record in records
+        ])
+        self.mirror_linked_contracts(records)
+        records_by_id = {record['Id']: record for record in records}
+        for contract in Contract.objects.filter(salesforce_case_id__in=records_by_id):
+            record = records_by_id[contract.salesforce_case_id]
+            update_changed_fields(
+                contract,
+                description=record['Description'] or '',
+                link_to_salesforce_case=record['Case_URL__c'] or '',
+            )
+
+    def mirror_linked_contracts(self, case_records):
+        """
+        Mirror the contracts of these cases that are not mirrored yet. A contract
+        that a new or relinked case points to may not have changed since the
+        Contract watermark, so the Contract sync never returns it, and the
+        case would drop out of the local searches that join the two.
+        """
+        contract_ids = {record['Contract__c'] for record in case_records if record['Contract__c']}
+        mirrored = set(SalesforceContract.objects.filter(
+            salesforce_id__in=contract_ids,
+        ).values_list('salesforce_id', flat=True))
+        missing = contract_ids - mirrored
+        if missing:
+            self.upsert_contracts(self.sf_query.fetch_contracts_by_ids(missing, CONTRACT_FIELDS))
+
+    def upsert_attachments(self, records):
+        contract_pks_by_salesforce_id = {}
+        for pk, salesforce_id in Contract.objects.filter(
+            salesforce_id__in={record['ParentId'] for record in records},
+        ).values_list('pk', 'salesforce_id'):
+            contract_pks_by_salesforce_id.setdefault(salesforce_id, []).append(pk)
+
+        existing = {
+            (attachment.contract_id, attachment.salesforce_id): attachment
+            for attachment in Attachment.objects.filter(salesforce_id__in=[record['Id'] for record in records])
+        }
+        new_attachments = []
+        for record in records:
+            for contract_pk in contract_pks_by_salesforce_id.get(record['ParentId'], []):
+                attachment = existing.get((contract_pk, record['Id']))
+                if attachment is None:
+                    new_attachments.append(Attachment(contract_id=contract_pk, **attachment_data(record)))
+                else:
+                    update_changed_fields(attachment, name=record['Name'], content_type=record['ContentType'])
+        Attachment.objects.bulk_create(new_attachments)
+
+
+def replace_mirror_rows(model, rows):
+    model.objects.filter(salesforce_id__in=[row.salesforce_id for row in rows]).delete()
+    model.objects.bulk_create(rows)
+
+
+def update_changed_fields(instance, **values):
+    changed = [field for field, value in values.items() if getattr(instance, field) != value]
+    if changed:
+        for field in changed:
+            setattr(instance, field, values[field])
+        instance.save(update_fields=changed)
+
+
+def synced_cases_by_numbers(case_numbers):
+    cases = []
+    for numbers in chunked(case_numbers, SYNC_BATCH_SIZE):
+        cases.extend(
+            SalesforceCase.objects.select_related('contract').filter(
+                case_number__in=numbers,
+                contract__activated_date__isnull=False,
+            )
+        )
+    return [case.as_search_result() for case in cases]
+
+
+def synced_cases_by_date(date_from, date_to):
+    """
+    Cases whose contract was signed in the range, or None when cases were never synced
+    and the local mirror cannot answer.
+    """
+    if not SyncWatermark.objects.filter(object_name='Case').exists():
+        return None
+    cases = SalesforceCase.objects.select_related('contract').filter(
+        Q(subject__istartswith='RECOUPABLE') | Q(subject__istartswith='NON-RECOUPABLE'),
+        contract__billing_country='Brazil',
+        contract__activated_date__gt=date_from,
+        contract__activated_date__lt=date_to,
+    ).order_by('case_number')
+    return [case.as_search_result() for case in cases]
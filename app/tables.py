@@ -16,6 +16,8 @@ from .models import (
 
 
 class InstallmentsTable(tables.Table):
+    # Read from the with_balance() annotation, so the database can sort it
+    balance = tables.Column(accessor='balance_amount', order_by='balance_amount')
     edit = tables.Column()
     delete = tables.Column()
     conditions = tables.Column()
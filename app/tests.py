@@ -1,9 +1,16 @@
 import base64
+from collections import Counter
 import csv
 import datetime
+from decimal import Decimal
+import gzip
 import io
+import json
 import mock
+import os
+import re
 import requests
+import tempfile
 from textwrap import dedent
 from unittest.mock import (
     MagicMock,
@@ -14,15 +21,28 @@ from django.contrib.auth.models import (
     User,
 )
 from django.contrib.humanize.templatetags.humanize import intcomma
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.db.models import Q
 from django.test import (
     Client,
     RequestFactory,
     TestCase,
+    override_settings,
 )
+from django.test.utils import CaptureQueriesContext
+from django.http import Http404
 from django.urls import reverse
+from django.utils import timezone
 from freezegun import freeze_time
+from simple_salesforce import (
+    SalesforceError,
+    SalesforceExpiredSession,
+)
 
 from app.factories import (
     AttachmentFactory,
@@ -32,17 +52,37 @@ from app.factories import (
     InstallmentFactory,
 )
 from app import (
+    BASIC_CONDITIONS,
+    EXPORT_DONE,
+    EXPORT_FAILED,
+    EXPORT_HEARTBEAT_TIMEOUT,
+    EXPORT_PENDING,
+    EXPORT_RESULT_MAX_AGE,
+    EXPORT_RUNNING,
+    ESTIMATED_COUNT_CAP,
+    IMPORT_ALREADY_EXISTS,
+    IMPORT_CREATED,
+    IMPORT_NO_SIGNED_DATE,
+    IMPORT_NOT_FOUND,
     INVALID_SIGN_DATE,
     INVALID_PAYMENT_DATE,
     INVALID_RECOUP_AMOUNT,
     ITEMS_PER_PAGE,
+    SF_API_VERSION,
+    SF_HTTP_TIMEOUT,
+    SF_IN_CLAUSE_CHUNK_SIZE,
+    SF_DATETIME_FORMAT,
+    SF_SESSION_CACHE_KEY,
     STATUS,
+    STATUS_COMMITED_APPROVED,
+    STATUS_INVESTED,
     SUPERSET_QUERY_DATE_FORMAT,
 )
 from app.forms import CustomAuthenticationForm
 from app.views import (
     AllInstallmentsView,
     ConditionBackupProofView,
+    ConditionBatchDoneView,
     ConditionView,
     ContractAdd,
     ContractsFilter,
@@ -52,25 +92,78 @@ from app.views import (
     DeleteInstallmentCondition,
     DeleteUploadedFileCondition,
     DetailContractView,
+    InstallmentBulkUpdateView,
     InstallmentDelete,
+    InstallmentGridView,
     InstallmentsFilter,
     InstallmentUpdate,
+    InstallmentScheduleView,
     InstallmentView,
+    PortfolioSummaryJsonView,
+    PortfolioSummaryView,
     SaveCaseView,
     ToggleConditionView,
 )
 from app.models import (
     Contract,
     Event,
+    ExportJob,
     Installment,
     InstallmentCondition,
+    InstallmentReport,
+    SalesforceCase,
+    SalesforceContract,
+    SyncWatermark,
+)
+from app.exports import (
+    claim_next_job,
+    iter_export_rows,
+    run_export_job,
+)
+from app.pagination import (
+    CachedCountPaginator,
+    estimated_count,
+)
+from app.schedules import (
+    build_schedule,
+    create_installments,
+    schedule_dates,
+    split_amount,
+)
+from app.search import (
+    Fts5OrganizerSearch,
+    get_organizer_search,
+    OrganizerSearch,
+)
+from app.storage import CachedLinkDropBoxStorage
+from app.sync import (
+    SalesforceSync,
+    synced_cases_by_numbers,
 )
 from app.utils import (
+    attachment_cache,
     generate_presto_query,
+    import_cases,
+    join_cases_with_contracts,
     SalesforceQuery,
+    SalesforceSession,
 )
 
 
+def _use_file_based_cache(test):
+    """Run `test` against FileBasedCache, the production backend, in a temporary directory."""
+    cache_dir = tempfile.TemporaryDirectory()
+    test.addCleanup(cache_dir.cleanup)
+    settings_override = override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': cache_dir.name,
+        },
+    })
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+
+
 def _generate_fake_salesforce_query_instance():
     with patch.object(SalesforceQuery, '__init__', return_value=None):
         sfq = SalesforceQuery()
@@ -223,7 +316,7 @@ class InstallmentConditionTest(TestCase):
         self.assertEqual(condition.done, None)
         with freeze_time(FREEZED_TIME):
             condition.toggle_done()
-        self.assertEqual(condition.done, FREEZED_TIME)
+        self.assertEqual(condition.done, timezone.make_aware(FREEZED_TIME))
         condition.toggle_done()
         self.assertIsNone(condition.done)
 
@@ -264,6 +357,80 @@ class InstallmentConditionTest(TestCase):
         installment_condition.refresh_from_db()
         self.assertNotEqual(installment_condition.done, None)
 
+    def toggle(self, condition, installment=None):
+        kwargs = {
+            'contract_id': self.contract.id,
+            'installment_id': (installment or self.installment).id,
+            'condition_id': condition.id,
+        }
+        request = self.factory.post(reverse('toggle-condition', kwargs=kwargs))
+        return ToggleConditionView.as_view()(request, **kwargs)
+
+    def test_toggle_condition_is_one_update(self):
+        condition = InstallmentConditionFactory(installment=self.installment)
+        # installment ids, then one conditional UPDATE and the report counts in a savepoint
+        with self.assertNumQueries(5):
+            self.toggle(condition)
+        condition.refresh_from_db()
+        self.assertIsNotNone(condition.done)
+        self.assertEqual(self.installment.report.conditions_done, 1)
+        self.toggle(condition)
+        condition.refresh_from_db()
+        self.assertIsNone(condition.done)
+        self.installment.report.refresh_from_db()
+        self.assertEqual(self.installment.report.conditions_done, 0)
+
+    def test_toggle_condition_of_another_installment(self):
+        condition = InstallmentConditionFactory(installment=self.installment)
+        self.toggle(condition, installment=InstallmentFactory(contract=self.contract))
+        condition.refresh_from_db()
+        self.assertIsNone(condition.done)
+
+    def test_set_done(self):
+        other_installment = InstallmentFactory(contract=self.contract)
+        already_done, pending, undone = InstallmentConditionFactory.create_batch(3, installment=self.installment)
+        other = InstallmentConditionFactory(installment=other_installment)
+        done_date = timezone.make_aware(datetime.datetime(2019, 8, 20))
+        InstallmentCondition.objects.filter(pk__in=[already_done.pk, undone.pk]).update(done=done_date)
+
+        updated = InstallmentCondition.objects.set_done(
+            done_ids=[already_done.pk, pending.pk, other.pk],
+            undone_ids=[undone.pk],
+        )
+
+        self.assertEqual(updated, 4)
+        for condition in (already_done, pending, undone, other):
+            condition.refresh_from_db()
+        self.assertEqual(already_done.done, done_date)
+        self.assertIsNotNone(pending.done)
+        self.assertIsNone(undone.done)
+        self.assertIsNotNone(other.done)
+        self.assertEqual(
+            list(InstallmentReport.objects.order_by('pk').values_list('conditions_done', 'conditions_total')),
+            [(2, 3), (1, 1)],
+        )
+
+    def test_batch_done_view(self):
+        user = User.objects.create_user(username='test', email='test@test.com', password='secret')
+        conditions = InstallmentConditionFactory.create_batch(3, installment=self.installment)
+        other_installment = InstallmentFactory(contract=self.contract)
+        conditions += InstallmentConditionFactory.create_batch(3, installment=other_installment)
+
+        def post(data):
+            request = self.factory.post(reverse('conditions-batch-done'), data)
+            request.user = user
+            return ConditionBatchDoneView.as_view()(request)
+
+        # installment ids, then one UPDATE for the conditions and one for the reports, in a savepoint
+        with self.assertNumQueries(5):
+            response = post({'done': [condition.pk for condition in conditions[:5]], 'undone': [conditions[5].pk]})
+        self.assertEqual(json.loads(response.content.decode()), {'updated': 6})
+        self.assertEqual(InstallmentCondition.objects.filter(done__isnull=False).count(), 5)
+        self.assertEqual(sum(InstallmentReport.objects.values_list('conditions_done', flat=True)), 5)
+
+        response = post({'done': ['1', 'x']})
+        self.assertEqual(response.status_code, 400)
+
     def test_delete_condition_view(self):
         factory = RequestFactory()
         condition = InstallmentConditionFactory()
@@ -281,6 +448,56 @@ class InstallmentConditionTest(TestCase):
         self.assertEqual(condition_query.count(), 0)
 
 
+class IndexUsageTest(TestCase):
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # the test tables are tiny, so stop the planner preferring a sequential scan
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql, params)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' '.join(str(row) for row in cursor.fetchall())
+
+    def test_contract_filters_use_indexes(self):
+        self.assertIn('contract_signed_date_id_idx', self.explain(Contract.objects.filter(signed_date='2019-03-20')))
+        self.assertIn(
+            'contract_signed_date_id_idx',
+            self.explain(Contract.objects.filter(signed_date__range=('2019-03-01', '2019-03-31'))),
+        )
+        self.assertIn('contract_org_email_idx', self.explain(Contract.objects.filter(organizer_email='a@b.com')))
+
+    def test_organizer_search_uses_index(self):
+        plan = self.explain(get_organizer_search().matching(Contract.objects.all(), 'eventos'))
+        if connection.vendor == 'postgresql':
+            self.assertIn('contract_organizer_search_trgm', plan)
+        else:
+            self.assertIn('VIRTUAL TABLE INDEX', plan)
+
+    def test_installment_filters_use_indexes(self):
+        self.assertIn(
+            'installment_contract_st_idx',
+            self.explain(Installment.objects.filter(contract_id=1, status=STATUS_INVESTED)),
+        )
+        self.assertIn(
+            'installment_st_payment_idx',
+            self.explain(Installment.objects.filter(
+                status=STATUS_INVESTED,
+                payment_date__range=('2019-05-01', '2019-05-31'),
+            )),
+        )
+        self.assertIn(
+            'installment_payment_idx',
+            self.explain(Installment.objects.filter(payment_date__gte='2019-05-01', payment_date__lt='2019-06-01')),
+        )
+        self.assertIn(
+            'installment_max_payment_idx',
+            self.explain(Installment.objects.filter(maximum_payment_date='2019-05-30')),
+        )
+
+
 class RedirectTest(TestCase):
 
     def test_redirect_to_login_when_login_is_required(self):
@@ -318,6 +535,92 @@ class FilterTest(TestCase):
         self.assertNotIn(contract2, result)
 
 
+class OrganizerSearchTest(TestCase):
+
+    def setUp(self):
+        self.joao = ContractFactory(
+            organizer_account_name='João Eventos',
+            organizer_email='contato@joaoeventos.com.br',
+            case_number='1',
+        )
+        self.joana = ContractFactory(
+            organizer_account_name='Joana Produções',
+            organizer_email='joana@producoes.com.br',
+            case_number='2',
+        )
+        self.joao_partial = ContractFactory(
+            organizer_account_name='Shows do Sertão',
+            organizer_email='joao@sertao.com.br',
+            case_number='3',
+        )
+
+    def search(self, value, backend=None):
+        backend = backend or get_organizer_search()
+        return list(backend.matching(Contract.objects.all(), value))
+
+    def test_search_column_is_normalized_on_save(self):
+        self.assertEqual(self.joao.organizer_search, 'joao eventos contato@joaoeventos.com.br')
+        self.joao.organizer_account_name = 'SÃO PAULO FESTIVAIS'
+        self.joao.save()
+        self.assertTrue(Contract.objects.get(pk=self.joao.pk).organizer_search.startswith('sao paulo festivais '))
+        self.assertEqual(self.search('São Paulo'), [self.joao])
+        self.assertNotIn(self.joao, self.search('João Eventos'))
+
+    def test_search_column_follows_partial_saves(self):
+        # SalesforceSync saves only the changed fields
+        self.joana.organizer_account_name = 'Festa Junina'
+        self.joana.save(update_fields=['organizer_account_name'])
+        self.assertEqual(
+            Contract.objects.get(pk=self.joana.pk).organizer_search,
+            'festa junina joana@producoes.com.br',
+        )
+        self.assertEqual(self.search('festa junina'), [self.joana])
+        self.assertEqual(self.search('Joana Produções'), [])
+
+    def test_accents_and_case_are_ignored(self):
+        self.assertEqual(self.search('JOÃO EVENTOS'), [self.joao])
+        self.assertEqual(self.search('producoes'), [self.joana])
+        self.assertEqual(self.search('Produções'), [self.joana])
+
+    def test_email_and_substring_matches(self):
+        self.assertEqual(self.search('sertao.com'), [self.joao_partial])
+        self.assertCountEqual(self.search('joao'), [self.joao, self.joao_partial])
+
+    def test_short_terms_fall_back_to_substring(self):
+        self.assertCountEqual(self.search('jo'), [self.joao, self.joana, self.joao_partial])
+
+    def test_best_match_ranks_first(self):
+        self.assertEqual(self.search('joaoeventos')[0], self.joao)
+        self.assertEqual(self.search('joao')[0], self.joao)
+
+    def test_contracts_list_keeps_the_ranking(self):
+        request = RequestFactory().get(reverse('contracts'), {'organizer_search': 'joao'})
+        request.user = User.objects.create_user(username='test', email='test@test.com', password='secret')
+        response = ContractsTableView.as_view()(request)
+        self.assertEqual(
+            [contract.organizer_account_name for contract in response.context_data['table'].data],
+            ['João Eventos', 'Shows do Sertão'],
+        )
+
+    def test_deleted_contracts_leave_the_index(self):
+        self.joana.delete()
+        self.assertEqual(self.search('producoes'), [])
+
+    def test_portable_backend(self):
+        self.assertCountEqual(self.search('joão', OrganizerSearch()), [self.joao, self.joao_partial])
+
+    @override_settings(ORGANIZER_SEARCH_BACKEND='app.search.OrganizerSearch')
+    def test_backend_is_configurable(self):
+        self.assertIsInstance(get_organizer_search(), OrganizerSearch)
+        self.assertNotIsInstance(get_organizer_search(), Fts5OrganizerSearch)
+
+    def test_installments_filter_by_organizer(self):
+        installment = InstallmentFactory(contract=self.joana)
+        InstallmentFactory(contract=self.joao)
+        result = InstallmentsFilter().search_contract_organizer(Installment.objects.all(), '', 'Produções')
+        self.assertEqual(list(result), [installment])
+
+
 class TableTest(TestCase):
 
     def test_installment_table(self):
@@ -353,6 +656,328 @@ class TableTest(TestCase):
         self.assertIn(bytes(contract_data['organizer_account_name'], encoding='utf-8'), content)
 
 
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+        # Several contracts share a signed date, so the id tiebreak matters
+        self.contracts = [
+            ContractFactory(
+                organizer_account_name='Organizer {}'.format(number),
+                signed_date=datetime.date(2019, 1, 1) + datetime.timedelta(days=number // 4),
+                case_number='keyset-{}'.format(number),
+            )
+            for number in range(ITEMS_PER_PAGE * 3 + 2)
+        ]
+
+    def get(self, view, url, params):
+        request = RequestFactory().get(url, params)
+        request.user = self.user
+        return view.as_view()(request)
+
+    def walk(self, view, url, params):
+        pages = []
+        response = self.get(view, url, params)
+        pages.append(response)
+        while response.context_data['page_obj'].has_next:
+            response = self.get(view, url, dict(params, cursor=response.context_data['page_obj'].next_cursor))
+            pages.append(response)
+        return pages
+
+    def test_contracts_walk_forward_and_back(self):
+        pages = self.walk(ContractsTableView, reverse('contracts'), {})
+        seen = [row.record.id for page in pages for row in page.context_data['table'].rows]
+        newest_first = sorted(self.contracts, key=lambda contract: (contract.signed_date, contract.id), reverse=True)
+        expected = [contract.id for contract in newest_first]
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 4)
+        self.assertFalse(pages[0].context_data['page_obj'].has_previous)
+
+        last = pages[-1].context_data['page_obj']
+        previous = self.get(ContractsTableView, reverse('contracts'), {'cursor': last.previous_cursor})
+        self.assertEqual(
+            [row.record.id for row in previous.context_data['table'].rows],
+            [row.record.id for row in pages[-2].context_data['table'].rows],
+        )
+        self.assertTrue(previous.context_data['page_obj'].has_next)
+
+    def test_cursor_keeps_the_filters(self):
+        for contract in self.contracts[:ITEMS_PER_PAGE + 3]:
+            InstallmentFactory(contract=contract, status=STATUS_INVESTED)
+        InstallmentFactory.create_batch(5, contract=self.contracts[-1])
+        params = {'status': STATUS_INVESTED}
+
+        pages = self.walk(AllInstallmentsView, reverse('all-installments'), params)
+
+        self.assertEqual(len(pages), 2)
+        installments = [installment for page in pages for installment in page.context_data['object_list']]
+        self.assertEqual(len(installments), ITEMS_PER_PAGE + 3)
+        self.assertTrue(all(installment.status == STATUS_INVESTED for installment in installments))
+        self.assertIn('status=INVESTED', pages[0].context_data['page_obj'].next_querystring)
+        self.assertEqual(pages[0].context_data['page_obj'].count, ITEMS_PER_PAGE + 3)
+
+    def test_deep_pages_cost_the_same(self):
+        pages = self.walk(ContractsTableView, reverse('contracts'), {})
+        # one keyset SELECT on the first page and the last alike; the walk already cached the count
+        with self.assertNumQueries(1):
+            self.get(ContractsTableView, reverse('contracts'), {}).render()
+        with self.assertNumQueries(1):
+            self.get(
+                ContractsTableView,
+                reverse('contracts'),
+                {'cursor': pages[-2].context_data['page_obj'].next_cursor},
+            ).render()
+
+    def test_page_number_falls_back_to_offset(self):
+        response = self.get(ContractsTableView, reverse('contracts'), {'page': 2})
+        self.assertEqual(response.context_data['page_obj'].number, 2)
+        self.assertFalse(hasattr(response.context_data['page_obj'], 'is_keyset'))
+
+    def test_tampered_cursor(self):
+        with self.assertRaises(Http404):
+            self.get(ContractsTableView, reverse('contracts'), {'cursor': 'not-a-cursor'})
+
+    def test_estimated_count_is_capped(self):
+        self.assertEqual(estimated_count(Contract.objects.all(), cap=10), (10, True))
+        self.assertEqual(estimated_count(Contract.objects.filter(signed_date='2019-01-01'), cap=10), (4, False))
+
+
+class ListCountCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+        self.contract = ContractFactory()
+        InstallmentFactory.create_batch(3, contract=self.contract, status=STATUS_INVESTED)
+        InstallmentFactory(contract=self.contract)
+
+    def get(self, view, url, params):
+        request = RequestFactory().get(url, params)
+        request.user = self.user
+        response = view.as_view()(request)
+        response.render()
+        return response
+
+    def test_invalidation_outlives_the_default_cache_timeout(self):
+        _use_file_based_cache(self)
+        response = self.get(AllInstallmentsView, reverse('all-installments'), {'status': STATUS_INVESTED})
+        self.assertEqual(response.context_data['page_obj'].count, 3)
+        InstallmentFactory(contract=self.contract, status=STATUS_INVESTED)
+        with freeze_time(timezone.now() + datetime.timedelta(minutes=10)):
+            response = self.get(AllInstallmentsView, reverse('all-installments'), {'status': STATUS_INVESTED})
+        self.assertEqual(response.context_data['page_obj'].count, 4)
+
+    def test_count_is_served_from_cache(self):
+        with self.assertNumQueries(3):
+            response = self.get(AllInstallmentsView, reverse('all-installments'), {'status': STATUS_INVESTED})
+        self.assertEqual(response.context_data['page_obj'].count, 3)
+        # the cursor and empty params do not change the counted rows
+        with self.assertNumQueries(1):
+            response = self.get(
+                AllInstallmentsView,
+                reverse('all-installments'),
+                {'status': STATUS_INVESTED, 'search_organizer': '', 'cursor': ''},
+            )
+        self.assertEqual(response.context_data['page_obj'].count, 3)
+        with self.assertNumQueries(3):
+            self.get(AllInstallmentsView, reverse('all-installments'), {})
+
+    def test_writes_invalidate_counts(self):
+        self.get(AllInstallmentsView, reverse('all-installments'), {'status': STATUS_INVESTED})
+        installment = InstallmentFactory(contract=self.contract, status=STATUS_INVESTED)
+        response = self.get(AllInstallmentsView, reverse('all-installments'), {'status': STATUS_INVESTED})
+        self.assertEqual(response.context_data['page_obj'].count, 4)
+
+        Installment.objects.filter(pk=installment.pk).delete()
+        response = self.get(AllInstallmentsView, reverse('all-installments'), {'status': STATUS_INVESTED})
+        self.assertEqual(response.context_data['page_obj'].count, 3)
+
+        self.contract.organizer_account_name = 'Renamed'
+        self.contract.save()
+        with self.assertNumQueries(3):
+            self.get(AllInstallmentsView, reverse('all-installments'), {'status': STATUS_INVESTED})
+
+    def test_offset_pages_share_the_exact_count(self):
+        with self.assertNumQueries(3):
+            # the list paginator counts once, the table paginator reuses it, then the page SELECT
+            response = self.get(ContractsTableView, reverse('contracts'), {'page': 1})
+        self.assertEqual(response.context_data['page_obj'].paginator.count, 1)
+        with self.assertNumQueries(2):
+            self.get(ContractsTableView, reverse('contracts'), {'page': 1})
+
+    @patch('app.pagination.connection', Mock(vendor='postgresql'))
+    def test_offset_count_uses_the_estimate_for_large_results_on_postgresql(self):
+        queryset = Installment.objects.all()
+        with patch('app.pagination.estimated_count', return_value=(ESTIMATED_COUNT_CAP + 1, True)):
+            with self.assertNumQueries(0):
+                paginator = CachedCountPaginator(queryset, 10, count_key='large')
+                self.assertEqual(paginator.count, ESTIMATED_COUNT_CAP + 1)
+        with patch('app.pagination.estimated_count', return_value=(3, False)):
+            paginator = CachedCountPaginator(queryset, 10, count_key='small')
+            self.assertEqual(paginator.count, 4)
+
+
+class PortfolioSummaryTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+        contract = ContractFactory(organizer_account_name='Planner Eventos', case_number='1')
+        other = ContractFactory(organizer_account_name='Other', case_number='2')
+        InstallmentFactory(
+            contract=contract, status=STATUS_INVESTED, is_recoup=True,
+            payment_date='2019-05-05', upfront_projection=1000, recoup_amount=250,
+        )
+        InstallmentFactory(
+            contract=other, status=STATUS_INVESTED, is_recoup=True,
+            payment_date='2019-05-20', upfront_projection=500, recoup_amount=None,
+        )
+        InstallmentFactory(
+            contract=contract, status=STATUS_INVESTED, is_recoup=True,
+            payment_date='2019-06-01', upfront_projection=300, recoup_amount=100,
+        )
+        InstallmentFactory(
+            contract=contract, status=STATUS_INVESTED, is_recoup=False,
+            payment_date=None, upfront_projection=None, recoup_amount=None,
+        )
+
+    def get(self, view, params):
+        request = RequestFactory().get(reverse('installments-summary'), params)
+        request.user = self.user
+        response = view.as_view()(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_summary_groups(self):
+        with self.assertNumQueries(1):
+            response = self.get(PortfolioSummaryView, {})
+        summary = response.context_data['summary']
+        self.assertEqual(
+            [
+                (group['year'], group['month'], group['is_recoup'], group['contracts'], group['installments'],
+                 group['upfront_projection'], group['recoup_amount'], group['balance'])
+                for group in summary['groups']
+            ],
+            [
+                (None, None, False, 1, 1, 0, 0, 0),
+                (2019, 5, True, 2, 2, 1500, 250, 1250),
+                (2019, 6, True, 1, 1, 300, 100, 200),
+            ],
+        )
+        self.assertEqual(
+            summary['totals'],
+            {'installments': 4, 'upfront_projection': 1800, 'recoup_amount': 350, 'balance': 1450},
+        )
+        self.assertContains(response, '$1,450')
+
+    def test_summary_honors_filters(self):
+        response = self.get(PortfolioSummaryJsonView, {'search_organizer': 'planner'})
+        data = json.loads(response.content.decode())
+        self.assertEqual(data['totals']['installments'], 3)
+        self.assertEqual([group['installments'] for group in data['groups']], [1, 1, 1])
+        self.assertEqual(data['groups'][1]['upfront_projection'], '1000.00')
+
+        response = self.get(PortfolioSummaryJsonView, {'payment_date_after': '2019-06-01'})
+        data = json.loads(response.content.decode())
+        self.assertEqual(data['totals']['balance'], '200.00')
+
+    def test_summary_json_rejects_invalid_filters(self):
+        response = self.get(PortfolioSummaryJsonView, {'status': 'NOT_A_STATUS'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', json.loads(response.content.decode())['errors'])
+
+    def test_summary_is_cached_until_a_write(self):
+        self.get(PortfolioSummaryView, {})
+        with self.assertNumQueries(0):
+            response = self.get(PortfolioSummaryJsonView, {})
+        self.assertEqual(json.loads(response.content.decode())['totals']['installments'], 4)
+        InstallmentFactory(contract=Contract.objects.first(), upfront_projection=1)
+        with self.assertNumQueries(1):
+            response = self.get(PortfolioSummaryJsonView, {})
+        self.assertEqual(json.loads(response.content.decode())['totals']['installments'], 5)
+
+
+class InstallmentReportTest(TestCase):
+
+    def setUp(self):
+        self.contract = ContractFactory(organizer_account_name='Planner Eventos', signed_date='2019-03-20')
+        self.installment = InstallmentFactory(contract=self.contract, upfront_projection=1000, recoup_amount=250)
+
+    def report(self):
+        return InstallmentReport.objects.get(installment=self.installment)
+
+    def test_installment_writes_refresh_the_report(self):
+        report = self.report()
+        self.assertEqual(report.organizer_account_name, 'Planner Eventos')
+        self.assertEqual(report.signed_date, datetime.date(2019, 3, 20))
+        self.assertEqual(report.balance, 750)
+        self.installment.recoup_amount = None
+        self.installment.status = STATUS_INVESTED
+        self.installment.save()
+        self.assertEqual(self.report().balance, 1000)
+        self.assertEqual(self.report().status, STATUS_INVESTED)
+
+    def test_contract_writes_refresh_the_report(self):
+        self.contract.organizer_account_name = 'Renamed'
+        self.contract.signed_date = datetime.date(2019, 4, 1)
+        self.contract.save()
+        report = self.report()
+        self.assertEqual(report.organizer_account_name, 'Renamed')
+        self.assertEqual(report.signed_date, datetime.date(2019, 4, 1))
+
+    def test_condition_and_event_counts(self):
+        condition = InstallmentConditionFactory(installment=self.installment)
+        InstallmentConditionFactory(installment=self.installment)
+        condition.toggle_done()
+        event = EventFactory(contract=self.contract)
+        report = self.report()
+        self.assertEqual((report.conditions_done, report.conditions_total, report.events), (1, 2, 1))
+        condition.delete()
+        event.delete()
+        report = self.report()
+        self.assertEqual((report.conditions_done, report.conditions_total, report.events), (0, 1, 0))
+
+    def test_deletes_cascade_to_the_report(self):
+        InstallmentConditionFactory(installment=self.installment)
+        Installment.objects.filter(pk=self.installment.pk).delete()
+        self.assertFalse(InstallmentReport.objects.exists())
+        installment = InstallmentFactory(contract=self.contract)
+        InstallmentConditionFactory(installment=installment)
+        self.contract.delete()
+        self.assertFalse(InstallmentReport.objects.exists())
+
+    def test_rebuild_command(self):
+        InstallmentConditionFactory(installment=self.installment)
+        # bulk_create sends no post_save, so these installments have no report yet
+        Installment.objects.bulk_create([
+            Installment(contract=self.contract, is_recoup=False, upfront_projection=number)
+            for number in range(3)
+        ])
+        InstallmentReport.objects.filter(installment=self.installment).update(balance=0)
+        out = io.StringIO()
+        call_command('rebuild_installment_reports', chunk_size=2, stdout=out)
+        self.assertIn('Rebuilt 4 installment reports', out.getvalue())
+        self.assertEqual(InstallmentReport.objects.count(), 4)
+        self.assertEqual(self.report().balance, 750)
+        self.assertEqual(self.report().conditions_total, 1)
+
+    def test_installments_list_reads_one_table(self):
+        user = User.objects.create_user(username='test', email='test@test.com', password='secret')
+        request = RequestFactory().get(reverse('all-installments'), {'signed_date_after': '2019-03-01'})
+        request.user = user
+        with CaptureQueriesContext(connection) as queries:
+            response = AllInstallmentsView.as_view()(request)
+            response.render()
+        self.assertEqual(len(response.context_data['object_list']), 1)
+        self.assertContains(response, 'Planner Eventos')
+        self.assertFalse(any('JOIN' in query['sql'] for query in queries.captured_queries))
+
+
 class UpdateContractTest(TestCase):
 
     def test_update_contract(self):
@@ -422,7 +1047,7 @@ class TestDownloadCsv(TestCase):
 
         self.client.force_login(user)
         response = self.client.get(reverse('all-installments'), kwargs)
-        decoded_response = response.content.decode('utf-8')
+        decoded_response = b''.join(response.streaming_content).decode('utf-8')
         reader = csv.reader(io.StringIO(decoded_response))
         next(reader)
         csv_rows = [row for row in reader]
@@ -456,11 +1081,172 @@ class TestDownloadCsv(TestCase):
         self.client.force_login(user)
         response = self.client.get(reverse('all-installments'), kwargs)
 
-        decoded_response = response.content.decode('utf-8')
+        decoded_response = b''.join(response.streaming_content).decode('utf-8')
         reader = csv.DictReader(io.StringIO(decoded_response))
         for row in reader:
             self.assertEqual(row['status'], FILTERED_STATUS)
 
+    def test_download_csv_is_not_paginated(self):
+        InstallmentFactory.create_batch(ITEMS_PER_PAGE + 5, contract=self.contract)
+        user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('all-installments'), {'download': 'true'})
+
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(len(rows) - 1, Installment.objects.count())
+        self.assertEqual(
+            rows[1],
+            ['True', 'COMMITED/APPROVED', 'EDA', '55555.00', '77777.00', '22222.00', 'juan@eventbrite.com',
+             '2019-04-04', '77777.00', '2019-05-30', '2019-05-05', '7000.00', '100000.00'],
+        )
+
+    def test_download_csv_gzip(self):
+        user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('all-installments'), {'download': 'true', 'compress': 'gzip'})
+
+        self.assertEqual('application/gzip', response.get('Content-Type'))
+        self.assertIn('-installments.csv.gz', response.get('Content-Disposition'))
+        content = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        self.assertEqual(len(list(csv.reader(io.StringIO(content)))), 2)
+
+
+class ExportJobTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+        self.client.force_login(self.user)
+        self.contract = ContractFactory()
+        self.installment = InstallmentFactory(contract=self.contract, status=STATUS_INVESTED)
+        InstallmentFactory(contract=self.contract)
+        InstallmentConditionFactory(installment=self.installment, condition_name='Bank Details')
+        InstallmentConditionFactory(
+            installment=self.installment,
+            condition_name='Promissory Note',
+            done=timezone.now(),
+        )
+        EventFactory(contract=self.contract, event_id='1234')
+
+    def test_identical_exports_share_a_job(self):
+        first = self.client.post(reverse('installments-export'), {'status': STATUS_INVESTED, 'search_organizer': ''})
+        second = self.client.post(reverse('installments-export'), {'status': STATUS_INVESTED})
+        other = self.client.post(reverse('installments-export'), {})
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.json()['id'], second.json()['id'])
+        self.assertNotEqual(first.json()['id'], other.json()['id'])
+        self.assertEqual(ExportJob.objects.count(), 2)
+        self.assertEqual(first.json()['status'], EXPORT_PENDING)
+
+    def test_stale_or_failed_exports_are_rebuilt(self):
+        stale = ExportJob.objects.create(params_hash=ExportJob.hash_params({}), params='{}', status=EXPORT_DONE)
+        ExportJob.objects.filter(pk=stale.pk).update(
+            created=timezone.now() - datetime.timedelta(seconds=EXPORT_RESULT_MAX_AGE + 1),
+        )
+        failed = ExportJob.objects.create(params_hash=ExportJob.hash_params({}), params='{}', status=EXPORT_FAILED)
+
+        response = self.client.post(reverse('installments-export'), {})
+
+        self.assertNotIn(response.json()['id'], [stale.id, failed.id])
+
+    def test_stalled_running_export_is_requeued(self):
+        stalled = ExportJob.objects.create(
+            params_hash=ExportJob.hash_params({}),
+            params='{}',
+            status=EXPORT_RUNNING,
+            heartbeat=timezone.now() - datetime.timedelta(seconds=EXPORT_HEARTBEAT_TIMEOUT + 1),
+            rows=5,
+        )
+        alive = ExportJob.objects.create(
+            params_hash=ExportJob.hash_params({'status': STATUS_INVESTED}),
+            params=json.dumps({'status': STATUS_INVESTED}),
+            status=EXPORT_RUNNING,
+            heartbeat=timezone.now(),
+        )
+
+        response = self.client.post(reverse('installments-export'), {})
+        self.assertNotEqual(response.json()['id'], stalled.id)
+        response = self.client.post(reverse('installments-export'), {'status': STATUS_INVESTED})
+        self.assertEqual(response.json()['id'], alive.id)
+
+        claimed = claim_next_job()
+        self.assertEqual((claimed.id, claimed.rows), (stalled.id, 0))
+        self.assertEqual(claim_next_job().status, EXPORT_RUNNING)
+        self.assertIsNone(claim_next_job())
+
+    def test_worker_sends_heartbeats(self):
+        job = ExportJob.objects.create(params_hash=ExportJob.hash_params({}), params='{}')
+        claimed_at = timezone.now() - datetime.timedelta(minutes=1)
+        with freeze_time(claimed_at):
+            job = claim_next_job()
+        self.assertEqual(job.heartbeat, claimed_at)
+        with mock.patch.object(job.file, 'save'):
+            run_export_job(job, chunk_size=1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, EXPORT_DONE)
+        self.assertGreater(job.heartbeat, claimed_at)
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.post(reverse('installments-export'), {'status': 'UNKNOWN'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+    @mock.patch('django.core.files.storage.default_storage._wrapped')
+    def test_worker_builds_export(self, storage_mock):
+        saved = {}
+
+        def save(name, content, max_length=None):
+            saved[name] = content.read().decode('utf-8')
+            return name
+        storage_mock.generate_filename.side_effect = lambda name: name
+        storage_mock.save.side_effect = save
+        storage_mock.url.return_value = 'https://dropbox/exports/1-installments.csv'
+        job_id = self.client.post(reverse('installments-export'), {'status': STATUS_INVESTED}).json()['id']
+
+        out = io.StringIO()
+        call_command('run_export_jobs', chunk_size=1, stdout=out)
+
+        job = ExportJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, EXPORT_DONE)
+        self.assertEqual(job.rows, 1)
+        rows = list(csv.DictReader(io.StringIO(saved[job.file.name])))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['status'], STATUS_INVESTED)
+        self.assertEqual(rows[0]['conditions'], 'Bank Details; Promissory Note (done)')
+        self.assertEqual(rows[0]['events'], '1234')
+        self.assertIn('done (1 rows)', out.getvalue())
+
+        status = self.client.get(reverse('installments-export-status', kwargs={'pk': job_id})).json()
+        self.assertEqual(status['download_url'], reverse('installments-export-download', kwargs={'pk': job_id}))
+        download = self.client.get(status['download_url'])
+        self.assertEqual(download.url, 'https://dropbox/exports/1-installments.csv')
+
+    def test_worker_reads_in_chunks(self):
+        InstallmentFactory.create_batch(4, contract=self.contract)
+        rows = list(iter_export_rows({}, chunk_size=2))
+        self.assertEqual(len(rows), Installment.objects.count())
+
+    def test_worker_records_failures(self):
+        job = ExportJob.objects.create(params_hash=ExportJob.hash_params({}), params='{}')
+        with mock.patch('app.exports.iter_export_rows', side_effect=ValueError('boom')):
+            with self.assertLogs('app.exports', level='ERROR'):
+                call_command('run_export_jobs', stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, EXPORT_FAILED)
+        self.assertEqual(job.error, 'boom')
+        self.assertIsNone(claim_next_job())
+
+    def test_download_before_done(self):
+        job = ExportJob.objects.create(params_hash=ExportJob.hash_params({}), params='{}')
+        response = self.client.get(reverse('installments-export-download', kwargs={'pk': job.id}))
+        self.assertEqual(response.status_code, 404)
+
 
 class FetchCaseTests(TestCase):
     def test_fetch_cases_by_case_number(self):
@@ -486,15 +1272,17 @@ class FetchCaseTests(TestCase):
             {
                 'records': [
                     {
-                        'Eventbrite_Username__c': 'FAKE_EVENTBRITE_USERNAME_1',
-                        'Hoopla_Account_Name__c': 'FAKE_ACCOUNT_NAME_1',
-                        'ActivatedDate': 'FAKE_SIGNED_DATE_1',
-                    },
-                    {
+                        'Id': 'FAKE_CONTRACT_ID_2',
                         'Eventbrite_Username__c': 'FAKE_EVENTBRITE_USERNAME_2',
                         'Hoopla_Account_Name__c': 'FAKE_ACCOUNT_NAME_2',
                         'ActivatedDate': 'FAKE_SIGNED_DATE_2',
                     },
+                    {
+                        'Id': 'FAKE_CONTRACT_ID_1',
+                        'Eventbrite_Username__c': 'FAKE_EVENTBRITE_USERNAME_1',
+                        'Hoopla_Account_Name__c': 'FAKE_ACCOUNT_NAME_1',
+                        'ActivatedDate': 'FAKE_SIGNED_DATE_1',
+                    },
                 ]
             },
         )
@@ -505,9 +1293,61 @@ class FetchCaseTests(TestCase):
             result = sfq.fetch_cases(','.join(case_numbers))
         for elem in result:
             self.assertIn(elem['case_number'], case_numbers)
+            self.assertEqual(elem['case_number'][-1], elem['organizer_email'][-1])
+
+    def test_fetch_cases_in_deduplicated_chunks(self):
+        def fake_query(query):
+            values = re.search(r'IN \((.*)\)', query).group(1).replace("'", '').split(',')
+            if query.startswith('SELECT id, Contract__c'):
+                records = [
+                    {
+                        'Id': 'FAKE_CASE_ID_{}'.format(num),
+                        'CaseNumber': num,
+                        'Contract__c': 'FAKE_CONTRACT_ID_{}'.format(num),
+                        'Description': 'FAKE_DESCRIPTION',
+                        'Case_URL__c': 'FAKE_CASE_URL',
+                    } for num in values
+                ]
+            else:
+                records = [
+                    {
+                        'Id': contract_id,
+                        'Eventbrite_Username__c': 'FAKE_EVENTBRITE_USERNAME',
+                        'Hoopla_Account_Name__c': 'FAKE_ACCOUNT_NAME',
+                        'ActivatedDate': 'FAKE_SIGNED_DATE',
+                    } for contract_id in values
+                ]
+            return {'records': records}
+
+        case_numbers = [str(num) for num in range(500)]
+        pasted_case_numbers = ',\n'.join(case_numbers + case_numbers[:50])
+        sfq = _generate_fake_salesforce_query_instance()
+        with patch.object(sfq.sf, 'query', side_effect=fake_query) as query_mock:
+            result = sfq.fetch_cases(pasted_case_numbers)
+        self.assertEqual(case_numbers, [elem['case_number'] for elem in result])
+        for elem in result:
+            self.assertEqual('FAKE_CONTRACT_ID_{}'.format(elem['case_number']), elem['contract_id'])
+        expected_chunks = -(-len(case_numbers) // SF_IN_CLAUSE_CHUNK_SIZE)
+        self.assertEqual(expected_chunks * 2, query_mock.call_count)
 
     def test_fetch_cases_by_date(self):
         FAKE_SF_QUERY_RESPONSES = (
+            {
+                'records': [
+                    {
+                        'Id': 'FAKE_CONTRACT_ID_1',
+                        'Eventbrite_Username__c': 'FAKE_EVENTBRITE_USERNAME_1',
+                        'Hoopla_Account_Name__c': 'FAKE_ACCOUNT_NAME_1',
+                        'ActivatedDate': 'FAKE_SIGNED_DATE_1',
+                    },
+                    {
+                        'Id': 'FAKE_CONTRACT_ID_2',
+                        'Eventbrite_Username__c': 'FAKE_EVENTBRITE_USERNAME_2',
+                        'Hoopla_Account_Name__c': 'FAKE_ACCOUNT_NAME_2',
+                        'ActivatedDate': 'FAKE_SIGNED_DATE_2',
+                    },
+                ]
+            },
             {
                 'records': [
                     {
@@ -526,30 +1366,154 @@ class FetchCaseTests(TestCase):
                     },
                  ]
             },
-            {
-                'records': [
-                    {
-                        'Id': 'FAKE_CONTRACT_ID_1',
-                        'Eventbrite_Username__c': 'FAKE_EVENTBRITE_USERNAME_1',
-                        'Hoopla_Account_Name__c': 'FAKE_ACCOUNT_NAME_1',
-                        'ActivatedDate': 'FAKE_SIGNED_DATE_1',
-                    },
-                    {
-                        'Id': 'FAKE_CONTRACT_ID_2',
-                        'Eventbrite_Username__c': 'FAKE_EVENTBRITE_USERNAME_2',
-                        'Hoopla_Account_Name__c': 'FAKE_ACCOUNT_NAME_2',
-                        'ActivatedDate': 'FAKE_SIGNED_DATE_2',
-                    },
-                ]
-            },
         )
         dates_from_to = ['FAKE_SIGNED_DATE_FROM_1', 'FAKE_SIGNED_DATE_TO_1']
         case_numbers = ['FAKE_CASE_NUMBER_1', 'FAKE_CASE_NUMBER_2']
         sfq = _generate_fake_salesforce_query_instance()
-        with patch.object(sfq.sf, 'query', side_effect=FAKE_SF_QUERY_RESPONSES):
+        with patch.object(sfq.sf, 'query', side_effect=FAKE_SF_QUERY_RESPONSES) as query_mock:
             result = sfq.fetch_cases_by_date(dates_from_to[0], dates_from_to[1])
         for elem in result:
             self.assertIn(elem['case_number'], case_numbers)
+        self.assertEqual(case_numbers, [elem['case_number'] for elem in result])
+        cases_query = query_mock.call_args_list[1][0][0]
+        self.assertIn('ActivatedDate > {}'.format(dates_from_to[0]), cases_query)
+        self.assertIn('ActivatedDate < {}'.format(dates_from_to[1]), cases_query)
+
+    def _generate_fake_cases_and_contracts(self, size):
+        cases = [
+            {
+                'Id': 'FAKE_CASE_ID_{}'.format(i),
+                'CaseNumber': 'FAKE_CASE_NUMBER_{}'.format(i),
+                'Contract__c': 'FAKE_CONTRACT_ID_{}'.format(i),
+                'Description': 'FAKE_DESCRIPTION',
+                'Case_URL__c': 'FAKE_CASE_URL',
+            } for i in range(size)
+        ]
+        contracts = [
+            {
+                'Id': 'FAKE_CONTRACT_ID_{}'.format(i),
+                'Eventbrite_Username__c': 'FAKE_EVENTBRITE_USERNAME',
+                'Hoopla_Account_Name__c': 'FAKE_ACCOUNT_NAME',
+                'ActivatedDate': 'FAKE_SIGNED_DATE',
+            } for i in reversed(range(size))
+        ]
+        return cases, contracts
+
+    def test_join_cases_with_contracts_skips_cases_out_of_range(self):
+        cases, contracts = self._generate_fake_cases_and_contracts(3)
+        result = list(join_cases_with_contracts(cases, contracts[1:]))
+        self.assertEqual(['FAKE_CASE_ID_0', 'FAKE_CASE_ID_1'], [elem['case_id'] for elem in result])
+        for elem in result:
+            self.assertEqual(elem['case_id'].replace('CASE', 'CONTRACT'), elem['contract_id'])
+
+    def test_join_cases_with_contracts_reads_each_contract_once(self):
+        reads = Counter()
+
+        class Record(dict):
+            def __getitem__(self, key):
+                reads[key] += 1
+                return super().__getitem__(key)
+
+        cases, contracts = self._generate_fake_cases_and_contracts(1000)
+        result = list(join_cases_with_contracts(
+            [Record(case) for case in cases],
+            [Record(contract) for contract in contracts],
+        ))
+        self.assertEqual(1000, len(result))
+        # One 'Id' read per contract to index them and one per joined case;
+        # a nested loop would read every contract's Id once per case
+        self.assertEqual(2000, reads['Id'])
+
+
+class SalesforceQueryPaginationTest(TestCase):
+
+    def test_iter_query_follows_next_records_url_lazily(self):
+        FAKE_FIRST_PAGE = {
+            'records': [{'Id': 'FAKE_ID_1'}, {'Id': 'FAKE_ID_2'}],
+            'done': False,
+            'nextRecordsUrl': '/services/data/v42.0/query/FAKE_LOCATOR-2000',
+        }
+        FAKE_LAST_PAGE = {
+            'records': [{'Id': 'FAKE_ID_3'}],
+            'done': True,
+        }
+        sfq = _generate_fake_salesforce_query_instance()
+        sfq.sf.query.return_value = FAKE_FIRST_PAGE
+        sfq.sf.query_more.return_value = FAKE_LAST_PAGE
+        records = sfq.iter_query('SELECT Id from Case')
+        sfq.sf.query.assert_not_called()
+        self.assertEqual('FAKE_ID_1', next(records)['Id'])
+        self.assertEqual('FAKE_ID_2', next(records)['Id'])
+        sfq.sf.query_more.assert_not_called()
+        self.assertEqual(['FAKE_ID_3'], [record['Id'] for record in records])
+        sfq.sf.query_more.assert_called_once_with(FAKE_FIRST_PAGE['nextRecordsUrl'], identifier_is_url=True)
+
+    def test_fetch_contract_attachments_reads_every_page(self):
+        sfq = _generate_fake_salesforce_query_instance()
+        sfq.sf.query.return_value = {
+            'records': [{'Id': 'FAKE_ID_1', 'Name': 'FAKE_NAME_1', 'ContentType': 'application/pdf'}],
+            'nextRecordsUrl': '/services/data/v42.0/query/FAKE_LOCATOR-2000',
+        }
+        sfq.sf.query_more.return_value = {
+            'records': [{'Id': 'FAKE_ID_2', 'Name': 'FAKE_NAME_2', 'ContentType': 'application/pdf'}],
+        }
+        result = sfq.fetch_contract_attachments('FAKE_CONTRACT_ID')
+        self.assertEqual(['FAKE_ID_1', 'FAKE_ID_2'], [attachment['salesforce_id'] for attachment in result])
+
+
+class SalesforceSessionTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _fake_client(self, session_id):
+        client = Mock()
+        client.session_id = session_id
+        client.sf_instance = 'FAKE_INSTANCE'
+        return client
+
+    def test_borrow_logs_in_once(self):
+        session = SalesforceSession()
+        with patch('app.utils.Salesforce', return_value=self._fake_client('FAKE_SESSION_ID')) as salesforce_mock:
+            first = session.borrow()
+            second = session.borrow()
+        self.assertIs(first, second)
+        self.assertEqual(salesforce_mock.call_count, 1)
+        self.assertEqual(salesforce_mock.call_args[1]['version'], SF_API_VERSION)
+        self.assertEqual(cache.get(SF_SESSION_CACHE_KEY)['session_id'], 'FAKE_SESSION_ID')
+
+    def test_borrow_reuses_cached_session(self):
+        cache.set(SF_SESSION_CACHE_KEY, {'session_id': 'CACHED_SESSION_ID', 'instance': 'FAKE_INSTANCE'})
+        session = SalesforceSession()
+        with patch('app.utils.Salesforce') as salesforce_mock:
+            session.borrow()
+        salesforce_mock.assert_called_once_with(
+            session_id='CACHED_SESSION_ID',
+            instance='FAKE_INSTANCE',
+            session=session.http,
+            version=SF_API_VERSION,
+        )
+
+    def test_expired_session_logs_in_again(self):
+        expired = self._fake_client('EXPIRED_SESSION_ID')
+        expired.Case.get.side_effect = SalesforceExpiredSession('url', 401, 'Case', 'expired')
+        renewed = self._fake_client('RENEWED_SESSION_ID')
+        renewed.Case.get.return_value = {'Id': 'FAKE_CASE_ID'}
+        session = SalesforceSession()
+        with patch('app.utils.Salesforce', side_effect=[expired, renewed]):
+            sfq = SalesforceQuery(session)
+            case = sfq.get_case_by_id('FAKE_CASE_ID')
+        self.assertEqual(case, {'Id': 'FAKE_CASE_ID'})
+        self.assertIs(sfq.sf, renewed)
+        self.assertIs(session.borrow(), renewed)
+
+    def test_warm_up_swallows_login_errors(self):
+        session = SalesforceSession()
+        with patch('app.utils.Salesforce', side_effect=requests.ConnectionError), \
+                self.assertLogs('app.utils', level='ERROR'):
+            session.warm_up()
+        with patch('app.utils.Salesforce', return_value=self._fake_client('FAKE_SESSION_ID')):
+            self.assertEqual(session.borrow().session_id, 'FAKE_SESSION_ID')
 
 
 class AddContractTests(TestCase):
@@ -593,6 +1557,13 @@ class AddContractTests(TestCase):
             for key, value in elem.items():
                 self.assertIn(bytes(value, encoding='utf-8'), response)
 
+    def test_search_form_without_parameters_does_not_use_salesforce(self):
+        request = self.factory.get(reverse('contracts-add'))
+        with patch.object(SalesforceQuery, '__init__', return_value=None) as init_mock:
+            response = ContractAdd.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        init_mock.assert_not_called()
+
     def test_save_case(self):
         FAKE_CASE_ID = 'FAKE_CASE_ID'
         FAKE_CONTRACT_ID = 'FAKE_CONTRACT_ID'
@@ -610,20 +1581,79 @@ class AddContractTests(TestCase):
             'Eventbrite_Username__c': 'FAKE_ORGANIZER_EMAIL',
             'ActivatedDate': '2019-02-08T21:26:13.000+0000',
         }
-        FAKE_ATTACHMENT_RETURN = [{
-            'name': 'FAKE_ATTACHMENT_NAME',
-            'salesforce_id': 'FAKE_ATTACHMENT_SALESFORCE_ID',
-            'content_type': 'FAKE_ATTACHMENT_CONTENT_TYPE',
-        }]
-
-        with patch('app.views.SalesforceQuery.get_case_by_id', return_value=FAKE_CASE_RETURN), \
-                patch('app.views.SalesforceQuery.get_contract_by_id', return_value=FAKE_CONTRACT_RETURN), \
-                patch('app.views.SalesforceQuery.fetch_contract_attachments', return_value=FAKE_ATTACHMENT_RETURN), \
-                patch.object(SalesforceQuery, '__init__', return_value=None):
+        FAKE_ATTACHMENT_RETURN = [
+            {
+                'name': 'FAKE_ATTACHMENT_NAME_{}'.format(i),
+                'salesforce_id': 'FAKE_ATTACHMENT_SALESFORCE_ID_{}'.format(i),
+                'content_type': 'FAKE_ATTACHMENT_CONTENT_TYPE',
+            } for i in range(3)
+        ]
+
+        with patch(
+            'app.views.SalesforceQuery.fetch_case_with_contract',
+            return_value=(FAKE_CASE_RETURN, FAKE_CONTRACT_RETURN, FAKE_ATTACHMENT_RETURN),
+        ) as fetch_mock, patch.object(SalesforceQuery, '__init__', return_value=None):
             response = SaveCaseView.as_view()(request, **kwargs)
         self.assertEqual(response.status_code, 302)
+        fetch_mock.assert_called_once_with(FAKE_CONTRACT_ID)
         contract = Contract.objects.first()
         self.assertEqual(contract.case_number, FAKE_CASE_RETURN['CaseNumber'])
+        self.assertEqual(
+            sorted(attachment['salesforce_id'] for attachment in FAKE_ATTACHMENT_RETURN),
+            sorted(contract.attachment_set.values_list('salesforce_id', flat=True)),
+        )
+
+    def test_fetch_case_with_contract_in_one_composite_request(self):
+        FAKE_COMPOSITE_RESPONSE = {
+            'compositeResponse': [
+                {
+                    'referenceId': 'case',
+                    'httpStatusCode': 200,
+                    'body': {'Id': 'FAKE_CASE_ID', 'Contract__c': 'FAKE_CONTRACT_ID'},
+                },
+                {
+                    'referenceId': 'contract',
+                    'httpStatusCode': 200,
+                    'body': {'Id': 'FAKE_CONTRACT_ID'},
+                },
+                {
+                    'referenceId': 'attachments',
+                    'httpStatusCode': 200,
+                    'body': {
+                        'records': [
+                            {'Id': 'FAKE_ATTACHMENT_ID', 'Name': 'FAKE_NAME', 'ContentType': 'application/pdf'},
+                        ],
+                    },
+                },
+            ],
+        }
+        sfq = _generate_fake_salesforce_query_instance()
+        sfq.sf.restful.return_value = FAKE_COMPOSITE_RESPONSE
+        case, contract, attachments = sfq.fetch_case_with_contract('FAKE_CASE_ID')
+        self.assertEqual('FAKE_CONTRACT_ID', contract['Id'])
+        self.assertEqual([{
+            'salesforce_id': 'FAKE_ATTACHMENT_ID',
+            'name': 'FAKE_NAME',
+            'content_type': 'application/pdf',
+        }], attachments)
+        sfq.sf.restful.assert_called_once()
+        sfq.sf.query.assert_not_called()
+        subrequests = json.loads(sfq.sf.restful.call_args[1]['data'])['compositeRequest']
+        self.assertEqual('/services/data/v42.0/sobjects/Case/FAKE_CASE_ID', subrequests[0]['url'])
+        self.assertIn("ParentId+%3D+'@{case.Contract__c}'", subrequests[2]['url'])
+
+    def test_fetch_case_with_contract_missing_case(self):
+        sfq = _generate_fake_salesforce_query_instance()
+        sfq.sf.restful.return_value = {
+            'compositeResponse': [
+                {'referenceId': 'case', 'httpStatusCode': 404, 'body': [{'errorCode': 'NOT_FOUND'}]},
+                {'referenceId': 'contract', 'httpStatusCode': 400, 'body': [{'errorCode': 'PROCESSING_HALTED'}]},
+                {'referenceId': 'attachments', 'httpStatusCode': 400, 'body': [{'errorCode': 'PROCESSING_HALTED'}]},
+            ],
+        }
+        with self.assertRaises(SalesforceError) as cm:
+            sfq.fetch_case_with_contract('FAKE_CASE_ID')
+        self.assertEqual(404, cm.exception.status)
 
     def test_get_case_already_persisted(self):
         contract = ContractFactory.create()
@@ -649,6 +1679,550 @@ class AddContractTests(TestCase):
         self.assertIn(bytes("This contract already exists.", encoding='utf-8'), response)
 
 
+class ImportCasesTest(TestCase):
+
+    FAKE_CASES = [
+        {
+            'Id': 'FAKE_CASE_ID_{}'.format(i),
+            'CaseNumber': 'FAKE_CASE_NUMBER_{}'.format(i),
+            'Contract__c': 'FAKE_CONTRACT_ID_{}'.format(i),
+            'Description': 'FAKE_DESCRIPTION',
+            'Case_URL__c': 'https://pe33.zzxxzzz.com/5348fObs',
+        } for i in range(3)
+    ]
+    FAKE_CONTRACTS = [
+        {
+            'Id': 'FAKE_CONTRACT_ID_{}'.format(i),
+            'Eventbrite_Username__c': 'organizer{}@test.com'.format(i),
+            'Hoopla_Account_Name__c': 'FAKE_ORGANIZER_NAME_{}'.format(i),
+            'ActivatedDate': '2019-02-08T21:26:13.000+0000',
+        } for i in range(3)
+    ]
+    FAKE_ATTACHMENTS = [
+        {
+            'Id': 'FAKE_ATTACHMENT_ID_{}_{}'.format(i, j),
+            'Name': 'FAKE_ATTACHMENT_NAME',
+            'ContentType': 'application/pdf',
+            'ParentId': 'FAKE_CONTRACT_ID_{}'.format(i),
+        } for i in range(3) for j in range(2)
+    ]
+
+    def setUp(self):
+        self.sf_query = Mock()
+        self.sf_query.fetch_cases_by_ids.return_value = (self.FAKE_CASES, self.FAKE_CONTRACTS, self.FAKE_ATTACHMENTS)
+        ContractFactory(case_number='FAKE_CASE_NUMBER_0')
+
+    def test_import_cases(self):
+        case_ids = ['FAKE_CASE_ID_0', 'FAKE_CASE_ID_1', 'FAKE_CASE_ID_2', 'FAKE_CASE_ID_1', 'FAKE_MISSING_CASE_ID']
+        report = import_cases(case_ids, self.sf_query)
+        self.assertEqual([
+            {'case_id': 'FAKE_CASE_ID_0', 'case_number': 'FAKE_CASE_NUMBER_0', 'status': IMPORT_ALREADY_EXISTS},
+            {'case_id': 'FAKE_CASE_ID_1', 'case_number': 'FAKE_CASE_NUMBER_1', 'status': IMPORT_CREATED},
+            {'case_id': 'FAKE_CASE_ID_2', 'case_number': 'FAKE_CASE_NUMBER_2', 'status': IMPORT_CREATED},
+            {'case_id': 'FAKE_MISSING_CASE_ID', 'case_number': None, 'status': IMPORT_NOT_FOUND},
+        ], report)
+        self.sf_query.fetch_cases_by_ids.assert_called_once_with(
+            ['FAKE_CASE_ID_0', 'FAKE_CASE_ID_1', 'FAKE_CASE_ID_2', 'FAKE_MISSING_CASE_ID'],
+        )
+        contract = Contract.objects.get(case_number='FAKE_CASE_NUMBER_2')
+        self.assertEqual('organizer2@test.com', contract.organizer_email)
+        self.assertIn('organizer2@test.com', contract.organizer_search)
+        self.assertEqual([contract], list(get_organizer_search().matching(Contract.objects.all(), 'organizer2@')))
+        self.assertEqual(
+            ['FAKE_ATTACHMENT_ID_2_0', 'FAKE_ATTACHMENT_ID_2_1'],
+            sorted(contract.attachment_set.values_list('salesforce_id', flat=True)),
+        )
+        self.assertEqual(3, Contract.objects.count())
+
+    def test_contract_without_activation_date_is_reported(self):
+        contracts = [dict(contract) for contract in self.FAKE_CONTRACTS]
+        contracts[1]['ActivatedDate'] = None
+        self.sf_query.fetch_cases_by_ids.return_value = (self.FAKE_CASES, contracts, self.FAKE_ATTACHMENTS)
+        report = import_cases(['FAKE_CASE_ID_1', 'FAKE_CASE_ID_2'], self.sf_query)
+        self.assertEqual([IMPORT_NO_SIGNED_DATE, IMPORT_CREATED], [outcome['status'] for outcome in report])
+        self.assertFalse(Contract.objects.filter(case_number='FAKE_CASE_NUMBER_1').exists())
+        self.assertTrue(Contract.objects.filter(case_number='FAKE_CASE_NUMBER_2').exists())
+
+    def test_concurrent_import_of_the_same_case(self):
+        refresh_organizer_search = Contract.refresh_organizer_search
+        raced = []
+
+        def concurrent_import(contract):
+            refresh_organizer_search(contract)
+            if contract.case_number == 'FAKE_CASE_NUMBER_1' and not raced:
+                # Another request saves the case between the existence check and the INSERT
+                raced.append(contract)
+                ContractFactory(case_number='FAKE_CASE_NUMBER_1')
+
+        with patch.object(Contract, 'refresh_organizer_search', concurrent_import):
+            report = import_cases(['FAKE_CASE_ID_1', 'FAKE_CASE_ID_2'], self.sf_query)
+        self.assertEqual([IMPORT_ALREADY_EXISTS, IMPORT_CREATED], [outcome['status'] for outcome in report])
+        self.assertEqual(1, Contract.objects.filter(case_number='FAKE_CASE_NUMBER_1').count())
+        contract = Contract.objects.get(case_number='FAKE_CASE_NUMBER_2')
+        self.assertEqual(2, contract.attachment_set.count())
+
+    def test_import_cases_query_count_does_not_grow_with_cases(self):
+        with self.assertNumQueries(6):
+            import_cases([case['Id'] for case in self.FAKE_CASES], self.sf_query)
+
+    def test_fetch_cases_by_ids_in_chunks(self):
+        sfq = _generate_fake_salesforce_query_instance()
+        sfq.sf.query.side_effect = [
+            {'records': self.FAKE_CASES},
+            {'records': self.FAKE_CONTRACTS},
+            {'records': self.FAKE_ATTACHMENTS},
+        ]
+        cases, contracts, attachments = sfq.fetch_cases_by_ids([case['Id'] for case in self.FAKE_CASES])
+        self.assertEqual(self.FAKE_ATTACHMENTS, attachments)
+        self.assertEqual(3, sfq.sf.query.call_count)
+        self.assertIn("ParentId IN ('FAKE_CONTRACT_ID_0','FAKE_CONTRACT_ID_1','FAKE_CONTRACT_ID_2')",
+                      sfq.sf.query.call_args[0][0])
+
+    def test_import_cases_view(self):
+        user = User.objects.create_user(username='test', email='test@test.com', password='secret')
+        self.client.force_login(user)
+        with patch.object(SalesforceQuery, '__init__', return_value=None), \
+                patch.object(SalesforceQuery, 'fetch_cases_by_ids', self.sf_query.fetch_cases_by_ids):
+            response = self.client.post(reverse('contracts-import'), {'case_ids': ['FAKE_CASE_ID_0', 'FAKE_CASE_ID_1']})
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, IMPORT_ALREADY_EXISTS)
+        self.assertContains(response, IMPORT_CREATED)
+
+    def test_import_cases_command(self):
+        out = io.StringIO()
+        with patch.object(SalesforceQuery, '__init__', return_value=None), \
+                patch.object(SalesforceQuery, 'iter_cases', return_value=iter([{'case_id': 'FAKE_CASE_ID_1'}])), \
+                patch.object(SalesforceQuery, 'fetch_cases_by_ids', self.sf_query.fetch_cases_by_ids):
+            call_command('import_cases', case_numbers='FAKE_CASE_NUMBER_1', stdout=out)
+        self.assertIn('FAKE_CASE_NUMBER_1\tFAKE_CASE_ID_1\t{}'.format(IMPORT_CREATED), out.getvalue())
+        self.assertTrue(Contract.objects.filter(case_number='FAKE_CASE_NUMBER_1').exists())
+
+
+class FakeSalesforce:
+    """
+    Answers the sync SOQL queries from in-memory records, honouring the SystemModstamp
+    watermark and paginating through nextRecordsUrl like the real API.
+    """
+    page_size = 2
+
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+        self.remaining_pages = {}
+
+    def query(self, soql):
+        self.queries.append(soql)
+        object_name = re.search(r'from (\w+)', soql).group(1)
+        records = self.records[object_name]
+        ids = re.search(r"Id IN \(('[^)]*')\)", soql)
+        if ids:
+            records = [record for record in records if repr(record['Id']) in ids.group(1).split(',')]
+        watermark = re.search(r'SystemModstamp >= (\S+)', soql)
+        if watermark:
+            since = datetime.datetime.strptime(watermark.group(1), '%Y-%m-%dT%H:%M:%SZ').replace(
+                tzinfo=datetime.timezone.utc,
+            )
+            records = [record for record in records if self._modstamp(record) >= since]
+        return self._page(sorted(records, key=self._modstamp))
+
+    def query_more(self, next_records_url, identifier_is_url=False):
+        return self._page(self.remaining_pages.pop(next_records_url))
+
+    def _page(self, records):
+        page = {'records': records[:self.page_size], 'done': len(records) <= self.page_size}
+        if not page['done']:
+            page['nextRecordsUrl'] = '/services/data/v42.0/query/FAKE-{}'.format(len(self.queries))
+            self.remaining_pages[page['nextRecordsUrl']] = records[self.page_size:]
+        return page
+
+    def _modstamp(self, record):
+        return datetime.datetime.strptime(record['SystemModstamp'], SF_DATETIME_FORMAT)
+
+
+class SalesforceSyncTest(TestCase):
+
+    def setUp(self):
+        self.records = {
+            'Contract': [
+                {
+                    'Id': 'FAKE_CONTRACT_ID_{}'.format(i),
+                    'Eventbrite_Username__c': 'organizer{}@test.com'.format(i),
+                    'Hoopla_Account_Name__c': 'FAKE_ORGANIZER_NAME_{}'.format(i),
+                    'ActivatedDate': '2019-02-0{}T21:26:13.000+0000'.format(i + 1),
+                    'BillingCountry': 'Brazil',
+                    'SystemModstamp': '2019-03-01T10:00:0{}.000+0000'.format(i),
+                } for i in range(3)
+            ],
+            'Case': [
+                {
+                    'Id': 'FAKE_CASE_ID_{}'.format(i),
+                    'CaseNumber': 'FAKE_CASE_NUMBER_{}'.format(i),
+                    'Contract__c': 'FAKE_CONTRACT_ID_{}'.format(i),
+                    'Subject': 'RECOUPABLE upfront',
+                    'Description': 'FAKE_DESCRIPTION_{}'.format(i),
+                    'Case_URL__c': 'https://pe33.zzxxzzz.com/5348fObs',
+                    'SystemModstamp': '2019-03-01T11:00:0{}.000+0000'.format(i),
+                } for i in range(3)
+            ],
+            'Attachment': [
+                {
+                    'Id': 'FAKE_ATTACHMENT_ID_{}'.format(i),
+                    'Name': 'FAKE_ATTACHMENT_NAME_{}'.format(i),
+                    'ContentType': 'application/pdf',
+                    'ParentId': 'FAKE_CONTRACT_ID_0',
+                    'SystemModstamp': '2019-03-01T12:00:0{}.000+0000'.format(i),
+                } for i in range(3)
+            ],
+        }
+        self.fake_salesforce = FakeSalesforce(self.records)
+        self.sf_query = _generate_fake_salesforce_query_instance()
+        self.sf_query.sf = self.fake_salesforce
+        self.contract = ContractFactory(
+            case_number='FAKE_CASE_NUMBER_0',
+            salesforce_id='FAKE_CONTRACT_ID_0',
+            salesforce_case_id='FAKE_CASE_ID_0',
+            description='OUTDATED_DESCRIPTION',
+        )
+        AttachmentFactory(contract=self.contract, salesforce_id='FAKE_ATTACHMENT_ID_0', name='OUTDATED_NAME')
+
+    def test_first_sync_pulls_everything(self):
+        result = SalesforceSync(self.sf_query, batch_size=2).run()
+        self.assertEqual({'Contract': 3, 'Case': 3, 'Attachment': 3}, result)
+        self.assertEqual(3, SalesforceCase.objects.count())
+        self.assertEqual(3, SalesforceContract.objects.count())
+        self.contract.refresh_from_db()
+        self.assertEqual('FAKE_DESCRIPTION_0', self.contract.description)
+        self.assertEqual('FAKE_ORGANIZER_NAME_0', self.contract.organizer_account_name)
+        self.assertEqual(
+            ['FAKE_ATTACHMENT_NAME_0', 'FAKE_ATTACHMENT_NAME_1', 'FAKE_ATTACHMENT_NAME_2'],
+            sorted(self.contract.attachment_set.values_list('name', flat=True)),
+        )
+        self.assertEqual(
+            datetime.datetime(2019, 3, 1, 11, 0, 2, tzinfo=datetime.timezone.utc),
+            SyncWatermark.objects.get(object_name='Case').system_modstamp,
+        )
+
+    def test_next_sync_only_pulls_changes(self):
+        SalesforceSync(self.sf_query).run()
+        self.records['Case'][1]['Description'] = 'UPDATED_DESCRIPTION'
+        self.records['Case'][1]['SystemModstamp'] = '2019-03-02T11:00:00.000+0000'
+        result = SalesforceSync(self.sf_query).run()
+        # The watermark is inclusive, so the last record of the previous sync is pulled again
+        self.assertEqual({'Contract': 1, 'Case': 2, 'Attachment': 1}, result)
+        self.assertEqual(3, SalesforceCase.objects.count())
+        self.assertEqual('UPDATED_DESCRIPTION', SalesforceCase.objects.get(salesforce_id='FAKE_CASE_ID_1').description)
+        self.assertIn('SystemModstamp >= 2019-03-01T11:00:02Z', self.fake_salesforce.queries[-2])
+
+    def test_case_linking_an_unchanged_contract_mirrors_it(self):
+        SalesforceSync(self.sf_query).run()
+        # The contract predates the Contract watermark; only the new case points at it
+        self.records['Contract'].append(dict(
+            self.records['Contract'][0],
+            Id='FAKE_CONTRACT_ID_9',
+            Hoopla_Account_Name__c='FAKE_ORGANIZER_NAME_9',
+            SystemModstamp='2019-01-01T10:00:00.000+0000',
+        ))
+        self.records['Case'].append(dict(
+            self.records['Case'][0],
+            Id='FAKE_CASE_ID_9',
+            CaseNumber='FAKE_CASE_NUMBER_9',
+            Contract__c='FAKE_CONTRACT_ID_9',
+            SystemModstamp='2019-03-02T11:00:00.000+0000',
+        ))
+        SalesforceSync(self.sf_query).run()
+        self.assertEqual(
+            'FAKE_ORGANIZER_NAME_9',
+            SalesforceContract.objects.get(salesforce_id='FAKE_CONTRACT_ID_9').organizer_name,
+        )
+        self.assertEqual(['FAKE_CASE_NUMBER_9'], [
+            result['case_number'] for result in synced_cases_by_numbers(['FAKE_CASE_NUMBER_9'])
+        ])
+
+    def test_sync_command(self):
+        out = io.StringIO()
+        with patch.object(SalesforceQuery, '__init__', return_value=None), \
+                patch.object(SalesforceQuery, 'sf', self.fake_salesforce, create=True):
+            call_command('sync_salesforce', stdout=out)
+        self.assertIn('Case: 3 records synced', out.getvalue())
+
+    def test_search_by_case_number_uses_synced_cases(self):
+        SalesforceSync(self.sf_query).run()
+        request = RequestFactory().get(reverse('contracts-add'), {'case_numbers': 'FAKE_CASE_NUMBER_1'})
+        with patch.object(SalesforceQuery, '__init__', side_effect=AssertionError):
+            response = ContractAdd.as_view()(request)
+        self.assertIn(b'FAKE_ORGANIZER_NAME_1', response.render().content)
+
+    def test_search_by_case_number_falls_back_to_salesforce_on_a_miss(self):
+        SalesforceSync(self.sf_query).run()
+        request = RequestFactory().get(reverse('contracts-add'), {'case_numbers': 'FAKE_CASE_NUMBER_1,1234'})
+        with patch.object(SalesforceQuery, '__init__', return_value=None), \
+                patch.object(SalesforceQuery, 'fetch_cases', return_value=[]) as fetch_mock:
+            ContractAdd.as_view()(request)
+        fetch_mock.assert_called_once_with('1234')
+
+    def test_search_by_date_uses_synced_cases(self):
+        SalesforceSync(self.sf_query).run()
+        request = RequestFactory().get(
+            reverse('contracts-add'),
+            {'case_date_from': '02/02/2019', 'case_date_to': '02/03/2019'},
+        )
+        with patch.object(SalesforceQuery, '__init__', side_effect=AssertionError):
+            response = ContractAdd.as_view()(request)
+        content = response.render().content
+        self.assertIn(b'FAKE_CASE_NUMBER_1', content)
+        self.assertIn(b'FAKE_CASE_NUMBER_2', content)
+        self.assertNotIn(b'FAKE_CASE_NUMBER_0', content)
+
+
+# Installments, their ids, conditions, then the report rows (delete, three reads, insert),
+# plus two savepoints with their releases; the same for one installment or sixty
+SCHEDULE_QUERIES = 12
+
+
+class InstallmentScheduleTest(TestCase):
+
+    def setUp(self):
+        self.contract = ContractFactory()
+        self.user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+
+    def post(self, view, name, data):
+        kwargs = {'contract_id': self.contract.id}
+        request = RequestFactory().post(reverse(name, kwargs=kwargs), data)
+        request.user = self.user
+        return view.as_view()(request, **kwargs)
+
+    def schedule(self, tranches, **data):
+        return self.post(InstallmentScheduleView, 'installments-schedule', dict({
+            'total_upfront': '1000',
+            'tranches': tranches,
+            'first_maximum_payment_date': '01/31/2020',
+            'months_between': 1,
+        }, **data))
+
+    def test_split_amount(self):
+        self.assertEqual(split_amount(Decimal('1000'), 3), [Decimal('333.33'), Decimal('333.33'), Decimal('333.34')])
+        self.assertEqual(split_amount(Decimal('10'), 1), [Decimal('10')])
+
+    def test_schedule_dates_clamp_month_ends(self):
+        self.assertEqual(
+            schedule_dates(datetime.date(2020, 1, 31), 3),
+            [datetime.date(2020, 1, 31), datetime.date(2020, 2, 29), datetime.date(2020, 3, 31)],
+        )
+        self.assertEqual(
+            schedule_dates(datetime.date(2020, 1, 15), 2, months_between=3),
+            [datetime.date(2020, 1, 15), datetime.date(2020, 4, 15)],
+        )
+
+    def test_create_installment_adds_basic_conditions(self):
+        with self.assertNumQueries(SCHEDULE_QUERIES):
+            response = self.post(InstallmentView, 'installments-create', {
+                'is_recoup': True,
+                'upfront_projection': 19000,
+                'maximum_payment_date': '09/14/2019',
+            })
+        self.assertEqual(response.status_code, 302)
+        installment = Installment.objects.get()
+        self.assertEqual(installment.contract, self.contract)
+        self.assertEqual(
+            list(installment.installmentcondition_set.order_by('id').values_list('condition_name', flat=True)),
+            list(BASIC_CONDITIONS),
+        )
+        self.assertEqual(installment.report.conditions_total, len(BASIC_CONDITIONS))
+
+    def test_create_schedule(self):
+        with self.assertNumQueries(SCHEDULE_QUERIES):
+            response = self.schedule(12, is_recoup=True)
+        self.assertEqual(response.status_code, 302)
+        installments = list(Installment.objects.order_by('id'))
+        self.assertEqual(len(installments), 12)
+        self.assertEqual(sum(installment.upfront_projection for installment in installments), 1000)
+        self.assertEqual(installments[1].maximum_payment_date, datetime.date(2020, 2, 29))
+        self.assertTrue(all(installment.is_recoup for installment in installments))
+        self.assertEqual(InstallmentCondition.objects.count(), 12 * len(BASIC_CONDITIONS))
+        self.assertEqual(
+            set(InstallmentCondition.objects.values_list('installment_id', flat=True)),
+            {installment.id for installment in installments},
+        )
+        self.assertEqual(InstallmentReport.objects.filter(conditions_total=len(BASIC_CONDITIONS)).count(), 12)
+
+    def test_invalid_schedule(self):
+        response = self.schedule(0)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('tranches', response.context_data['schedule_form'].errors)
+        self.assertFalse(Installment.objects.exists())
+
+
+class InstallmentBulkUpdateTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', email='test@test.com', password='secret')
+        planner = ContractFactory(organizer_account_name='Planner Eventos')
+        other = ContractFactory(organizer_account_name='Other Organizer', case_number='2')
+        self.matching = InstallmentFactory.create_batch(
+            3, contract=planner, status=STATUS_COMMITED_APPROVED, upfront_projection=1000, recoup_amount=None,
+        )
+        self.untouched = InstallmentFactory(
+            contract=other, status=STATUS_COMMITED_APPROVED, upfront_projection=1000, recoup_amount=None,
+        )
+
+    def post(self, query, data):
+        request = RequestFactory().post('{}?{}'.format(reverse('installments-bulk-update'), query), data)
+        request.user = self.user
+        return InstallmentBulkUpdateView.as_view()(request)
+
+    def test_updates_only_the_filtered_installments(self):
+        # savepoint, one UPDATE for the installments and one for their reports, release
+        with self.assertNumQueries(4):
+            response = self.post('search_organizer=planner', {
+                'status': STATUS_INVESTED,
+                'payment_date': '01/15/2020',
+                'recoup_amount': '250',
+            })
+        self.assertEqual(json.loads(response.content.decode()), {'updated': 3})
+        for installment in self.matching:
+            installment.refresh_from_db()
+            self.assertEqual(installment.status, STATUS_INVESTED)
+            self.assertEqual(installment.payment_date, datetime.date(2020, 1, 15))
+            self.assertEqual(installment.recoup_amount, 250)
+            report = installment.report
+            self.assertEqual(
+                (report.status, report.payment_date, report.recoup_amount, report.balance),
+                (STATUS_INVESTED, datetime.date(2020, 1, 15), 250, 750),
+            )
+        self.untouched.refresh_from_db()
+        self.assertEqual(self.untouched.status, STATUS_COMMITED_APPROVED)
+        self.assertNotEqual(self.untouched.payment_date, datetime.date(2020, 1, 15))
+        self.assertEqual(self.untouched.report.balance, 1000)
+
+    def test_only_the_given_fields_change(self):
+        self.post('', {'status': STATUS_INVESTED})
+        self.assertEqual(InstallmentReport.objects.filter(status=STATUS_INVESTED).count(), 4)
+        self.assertFalse(Installment.objects.filter(recoup_amount__isnull=False).exists())
+
+    def test_invalidates_cached_counts(self):
+        def invested_count():
+            request = RequestFactory().get(reverse('all-installments'), {'status': STATUS_INVESTED})
+            request.user = self.user
+            return AllInstallmentsView.as_view()(request).context_data['page_obj'].count
+
+        self.assertEqual(invested_count(), 0)
+        self.post('', {'status': STATUS_INVESTED})
+        self.assertEqual(invested_count(), 4)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post('', {}).status_code, 400)
+        self.assertEqual(self.post('', {'status': 'UNKNOWN'}).status_code, 400)
+        self.assertEqual(self.post('status=UNKNOWN', {'status': STATUS_INVESTED}).status_code, 400)
+        self.assertFalse(Installment.objects.filter(status=STATUS_INVESTED).exists())
+
+
+# The contract's installments, the UPDATE, the report rows (delete, three reads, insert),
+# plus two savepoints with their releases; the same for one changed row or twelve
+GRID_QUERIES = 11
+
+
+class InstallmentGridTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', email='test@test.com', password='secret')
+        self.contract = ContractFactory()
+        self.installments = create_installments(
+            self.contract.id,
+            build_schedule(Decimal('1200'), 12, datetime.date(2020, 1, 31)),
+        )
+
+    def post(self, rows, contract=None, omit=()):
+        data = {
+            'grid-TOTAL_FORMS': len(rows),
+            'grid-INITIAL_FORMS': len(rows),
+            'grid-MIN_NUM_FORMS': 0,
+            'grid-MAX_NUM_FORMS': 1000,
+        }
+        for index, (installment, changes) in enumerate(rows):
+            values = {
+                'id': installment.pk,
+                'status': installment.status,
+                'upfront_projection': installment.upfront_projection,
+                'maximum_payment_date': str(installment.maximum_payment_date),
+                'gtf': installment.gtf,
+                'gts': installment.gts,
+            }
+            values.update(changes)
+            data.update({
+                'grid-{}-{}'.format(index, name): '' if value is None else value
+                for name, value in values.items()
+            })
+        for key in omit:
+            del data[key]
+        kwargs = {'contract_id': (contract or self.contract).id}
+        request = RequestFactory().post(reverse('installments-grid', kwargs=kwargs), data)
+        request.user = self.user
+        return InstallmentGridView.as_view()(request, **kwargs)
+
+    def test_rebalances_a_schedule_in_one_update(self):
+        rows = [(installment, {'upfront_projection': '150.00'}) for installment in self.installments]
+        rows[0][1]['recoup_amount'] = '50.00'
+        with self.assertNumQueries(GRID_QUERIES):
+            response = self.post(rows)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content.decode())['installments']), 12)
+        self.assertEqual(Installment.objects.filter(upfront_projection=150).count(), 12)
+        self.assertEqual(Installment.objects.get(pk=self.installments[0].pk).recoup_amount, 50)
+        self.assertEqual(InstallmentReport.objects.filter(contract=self.contract).totals()['balance'], 1750)
+
+    def test_returns_only_the_changed_rows(self):
+        unchanged, changed = self.installments[:2]
+        with self.assertNumQueries(GRID_QUERIES):
+            response = self.post([
+                (unchanged, {}),
+                (changed, {'status': STATUS_INVESTED, 'payment_date': '2020-02-10'}),
+            ])
+        rows = json.loads(response.content.decode())['installments']
+        self.assertEqual([row['id'] for row in rows], [changed.pk])
+        self.assertEqual(
+            (rows[0]['status'], rows[0]['payment_date'], rows[0]['balance']),
+            (STATUS_INVESTED, '2020-02-10', '100.00'),
+        )
+        self.assertEqual(changed.report.status, STATUS_INVESTED)
+        self.assertEqual(Installment.objects.filter(status=STATUS_INVESTED).count(), 1)
+
+    def test_rejects_installments_of_other_contracts(self):
+        other = InstallmentFactory(contract=ContractFactory(case_number='2'), upfront_projection=1000)
+        response = self.post([(other, {'upfront_projection': '1'})])
+        self.assertEqual(response.status_code, 400)
+        other.refresh_from_db()
+        self.assertEqual(other.upfront_projection, 1000)
+
+    def test_invalid_rows_write_nothing(self):
+        response = self.post([
+            (self.installments[0], {'upfront_projection': '500'}),
+            (self.installments[1], {'upfront_projection': 'x'}),
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = json.loads(response.content.decode())['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('upfront_projection', errors[1])
+        self.assertFalse(Installment.objects.filter(upfront_projection=500).exists())
+
+    def test_missing_row_id_is_a_bad_request(self):
+        response = self.post([
+            (self.installments[0], {'upfront_projection': '500'}),
+            (self.installments[1], {'upfront_projection': '500'}),
+        ], omit=['grid-1-id'])
+        self.assertEqual(response.status_code, 400)
+        errors = json.loads(response.content.decode())['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('id', errors[1])
+        self.assertFalse(Installment.objects.filter(upfront_projection=500).exists())
+
+    def test_non_integer_row_id_is_a_bad_request(self):
+        response = self.post([(self.installments[0], {'id': 'x', 'upfront_projection': '500'})])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('id', json.loads(response.content.decode())['errors'][0])
+        self.assertFalse(Installment.objects.filter(upfront_projection=500).exists())
+
+
 class InstallmentTest(TestCase):
 
     def test_create_installment_table(self):
@@ -756,6 +2330,28 @@ class InstallmentTest(TestCase):
         installment1 = Installment.objects.create(**installment_data)
         self.assertEqual(installment_data['upfront_projection'], installment1.balance)
 
+    def test_balance_amount_matches_balance(self):
+        contract = ContractFactory()
+        InstallmentFactory(contract=contract, upfront_projection=None, recoup_amount=None)
+        InstallmentFactory(contract=contract, upfront_projection=1234, recoup_amount=None)
+        InstallmentFactory(contract=contract, upfront_projection=None, recoup_amount=100)
+        InstallmentFactory(contract=contract, upfront_projection=Decimal('77777'), recoup_amount=Decimal('55555.55'))
+        for installment in Installment.objects.with_balance():
+            self.assertEqual(installment.balance_amount, installment.balance)
+
+    def test_installment_totals(self):
+        self.assertEqual(
+            Installment.objects.totals(),
+            {'upfront_projection': 0, 'recoup_amount': 0, 'balance': 0},
+        )
+        contract = ContractFactory()
+        InstallmentFactory(contract=contract, upfront_projection=1000, recoup_amount=None)
+        InstallmentFactory(contract=contract, upfront_projection=Decimal('500.50'), recoup_amount=200)
+        self.assertEqual(
+            Installment.objects.totals(),
+            {'upfront_projection': Decimal('1500.50'), 'recoup_amount': 200, 'balance': Decimal('1300.50')},
+        )
+
 
 class AllInstallmentsViewTest(TestCase):
 
@@ -870,6 +2466,87 @@ class AllInstallmentsViewTest(TestCase):
         self.assertEqual(expected_number_of_elements_in_first_page, len(response.context_data['object_list']))
         self.assertFalse(response.context_data['is_paginated'])
 
+    def test_filter_installment_by_date_ranges(self):
+        def search(**params):
+            return set(InstallmentsFilter(params, queryset=Installment.objects.all()).qs)
+
+        self.assertEqual(
+            search(payment_date_after='2019-05-01', payment_date_before='2019-05-10'),
+            {self.installment1, self.installment3},
+        )
+        self.assertEqual(search(payment_date_after='2019-05-06'), {self.installment2})
+        self.assertEqual(
+            search(signed_date_before='2019-03-15'),
+            {self.installment2, self.installment3},
+        )
+        self.assertEqual(
+            search(signed_date_after='2019-03-16', maximum_payment_date_before='2019-05-30'),
+            {self.installment1},
+        )
+        self.assertEqual(search(maximum_payment_date_after='2019-05-31'), set())
+
+    def test_filter_and_sort_installment_by_balance(self):
+        def search(**params):
+            return InstallmentsFilter(params, queryset=Installment.objects.all()).qs
+
+        self.assertEqual(set(search(balance_min='100000')), {self.installment2})
+        self.assertEqual(set(search(balance_max='22222')), {self.installment1, self.installment3})
+        self.assertEqual(set(search(balance_min='22223', balance_max='489197')), set())
+        self.assertEqual(
+            list(Installment.objects.with_balance().order_by('-balance_amount', 'id')),
+            [self.installment2, self.installment1, self.installment3],
+        )
+
+    def test_all_installments_totals(self):
+        self.user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+        response = self._render_all_installments(balance_max='22222')
+        self.assertEqual(
+            response.context_data['totals'],
+            {'upfront_projection': 155554, 'recoup_amount': 111110, 'balance': 44444},
+        )
+        self.assertContains(response, '$44,444')
+        response = self._render_all_installments(status=STATUS_INVESTED)
+        self.assertEqual(
+            response.context_data['totals'],
+            {'upfront_projection': 0, 'recoup_amount': 0, 'balance': 0},
+        )
+
+    def test_filter_installment_status_is_exact(self):
+        result = InstallmentsFilter({'status': STATUS_INVESTED}, queryset=Installment.objects.all()).qs
+        self.assertEqual(list(result), [])
+        self.assertEqual(
+            set(InstallmentsFilter().search_status(Installment.objects.all(), '', 'COMMITED')),
+            set(),
+        )
+
+    def _render_all_installments(self, **params):
+        request = RequestFactory().get(reverse('all-installments'), params)
+        request.user = self.user
+        response = AllInstallmentsView.as_view()(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_all_installments_query_budget(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+        # one joined select, the pagination count and the totals, whatever the page size
+        with self.assertNumQueries(3):
+            self._render_all_installments()
+        for number in range(ITEMS_PER_PAGE):
+            InstallmentFactory(contract=ContractFactory(case_number='budget-{}'.format(number)))
+        with self.assertNumQueries(3):
+            response = self._render_all_installments()
+        self.assertEqual(len(response.context_data['object_list']), ITEMS_PER_PAGE)
+        with self.assertNumQueries(3):
+            self._render_all_installments(search_organizer='EDA')
+        # the export skips pagination, so there is no count query
+        with self.assertNumQueries(1):
+            response = self._render_all_installments(download='true')
+            list(response.streaming_content)
+
     def test_all_installments_pagination_complete_page(self):
 
         factory = RequestFactory()
@@ -887,6 +2564,54 @@ class AllInstallmentsViewTest(TestCase):
         self.assertTrue(response.context_data['is_paginated'])
 
 
+class FilterQueryShapeTest(TestCase):
+
+    def setUp(self):
+        contracts = [
+            Contract(
+                organizer_account_name='Organizer {}'.format(number),
+                organizer_email='organizer{}@test.com'.format(number),
+                signed_date=datetime.date(2017, 1, 1) + datetime.timedelta(days=number),
+                case_number='bench-{}'.format(number),
+            )
+            for number in range(100)
+        ]
+        Contract.objects.bulk_create(contracts)
+        contract_ids = list(Contract.objects.values_list('id', flat=True))
+        Installment.objects.bulk_create([
+            Installment(
+                contract_id=contract_ids[number % len(contract_ids)],
+                is_recoup=bool(number % 2),
+                status=STATUS[number % len(STATUS)][0],
+                payment_date=datetime.date(2017, 1, 1) + datetime.timedelta(days=number % 1000),
+                maximum_payment_date=datetime.date(2017, 1, 1) + datetime.timedelta(days=number % 1000),
+            )
+            for number in range(2000)
+        ])
+
+    def test_range_filters_replace_text_casts(self):
+        days = ('2018-03-01', '2018-03-09')
+        text_cast = Installment.objects.filter(
+            Q(status__icontains=STATUS_INVESTED) & Q(payment_date__icontains='2018-03-0'),
+        )
+        sargable = InstallmentsFilter(
+            {'status': STATUS_INVESTED, 'payment_date_after': days[0], 'payment_date_before': days[1]},
+            queryset=Installment.objects.all(),
+        ).qs
+        self.assertEqual(set(text_cast.values_list('id', flat=True)), set(sargable.values_list('id', flat=True)))
+
+        sql, params = sargable.query.sql_with_params()
+        self.assertIn('"app_installment"."status" = %s', sql)
+        self.assertIn('"app_installment"."payment_date" BETWEEN %s AND %s', sql)
+        self.assertNotIn('LIKE', sql)
+        self.assertNotIn('CAST', sql)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn('USING INDEX installment_st_payment_idx', plan)
+
+
 class UploadBackUpFilesTest(TestCase):
 
     def setUp(self):
@@ -952,6 +2677,88 @@ class UploadBackUpFilesTest(TestCase):
         self.assertEqual(response.status_code, 302)
 
 
+class CachedLinkDropBoxStorageTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.storage = CachedLinkDropBoxStorage(oauth2_access_token='token', root_path='/Backup_Files')
+        self.storage.client = MagicMock()
+        self.storage.client.files_get_temporary_link.side_effect = lambda path: MagicMock(
+            link='https://dl.dropboxusercontent.com{}'.format(path),
+        )
+
+    def test_url_is_resolved_once(self):
+        first = self.storage.url('test.pdf')
+        second = self.storage.url('test.pdf')
+        self.assertEqual(first, 'https://dl.dropboxusercontent.com/Backup_Files/test.pdf')
+        self.assertEqual(first, second)
+        self.storage.client.files_get_temporary_link.assert_called_once_with('/Backup_Files/test.pdf')
+
+    def test_urls_only_resolves_missing_links(self):
+        self.storage.url('one.pdf')
+        links = self.storage.urls(['one.pdf', 'two.pdf', 'three.pdf'])
+        self.assertEqual(
+            links,
+            {
+                'one.pdf': 'https://dl.dropboxusercontent.com/Backup_Files/one.pdf',
+                'two.pdf': 'https://dl.dropboxusercontent.com/Backup_Files/two.pdf',
+                'three.pdf': 'https://dl.dropboxusercontent.com/Backup_Files/three.pdf',
+            },
+        )
+        self.assertEqual(self.storage.client.files_get_temporary_link.call_count, 3)
+
+    def test_delete_forgets_link(self):
+        self.storage.url('test.pdf')
+        self.storage.delete('test.pdf')
+        self.storage.url('test.pdf')
+        self.storage.client.files_delete.assert_called_once_with('/Backup_Files/test.pdf')
+        self.assertEqual(self.storage.client.files_get_temporary_link.call_count, 2)
+
+    @mock.patch('app.views.default_storage')
+    def test_condition_view_resolves_links_in_one_batch(self, storage_mock):
+        storage_mock.urls.return_value = {
+            'one.pdf': 'https://dropbox/one.pdf',
+            'two.pdf': 'https://dropbox/two.pdf',
+        }
+        installment = InstallmentFactory()
+        InstallmentConditionFactory(installment=installment, upload_file='one.pdf')
+        InstallmentConditionFactory(installment=installment, upload_file='two.pdf')
+        InstallmentConditionFactory(installment=installment)
+        kwargs = {
+            'contract_id': installment.contract_id,
+            'installment_id': installment.id,
+        }
+        request = RequestFactory().get(reverse('conditions', kwargs=kwargs))
+        request.user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+        response = ConditionView.as_view()(request, **kwargs)
+        self.assertEqual(
+            [condition.upload_file_url for condition in response.context_data['object_list']],
+            ['https://dropbox/one.pdf', 'https://dropbox/two.pdf', None],
+        )
+        self.assertCountEqual(storage_mock.urls.call_args[0][0], ['one.pdf', 'two.pdf'])
+        self.assertEqual(storage_mock.urls.call_count, 1)
+
+    def test_condition_view_with_storage_without_batch_links(self):
+        installment = InstallmentFactory()
+        InstallmentConditionFactory(installment=installment, upload_file='one.pdf')
+        InstallmentConditionFactory(installment=installment)
+        kwargs = {
+            'contract_id': installment.contract_id,
+            'installment_id': installment.id,
+        }
+        request = RequestFactory().get(reverse('conditions', kwargs=kwargs))
+        request.user = User.objects.create_user(
+            username='test', email='test@test.com', password='secret')
+        with tempfile.TemporaryDirectory() as location, \
+                mock.patch('app.views.default_storage', FileSystemStorage(location=location, base_url='/media/')):
+            response = ConditionView.as_view()(request, **kwargs)
+        self.assertEqual(
+            [condition.upload_file_url for condition in response.context_data['object_list']],
+            ['/media/one.pdf', None],
+        )
+
+
 class PrestoQueriesTest(TestCase):
     def test_generate_presto_query(self):
         event_id = '1234'
@@ -1016,6 +2823,14 @@ class PrestoQueriesTest(TestCase):
 
 class DownloadAttachment(TestCase):
 
+    def setUp(self):
+        cache.clear()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(ATTACHMENT_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
     def test_get_one_contract_attachment(self):
         FAKE_ATTACHMENT_ID = 'FAKE_ATTACHMENT_ID_1'
         FAKE_SF_QUERY_RESPONSES = (
@@ -1062,15 +2877,32 @@ class DownloadAttachment(TestCase):
             self.assertIn(attachment['salesforce_id'], FAKE_ATTACHMENT_ID)
 
     def test_fetch_attachment(self):
-        FAKE_BODY = base64.b64encode(b"FAKE_CONTRACT_BODY")
         FAKE_CONTENT_TYPE = "FAKE_CONTENT_TYPE"
         FAKE_ATTACHMENT_ID = "FAKE_ATTACHMENT_ID"
         sfq = _generate_fake_salesforce_query_instance()
+        response_mock = Mock(status_code=200)
 
-        with patch.object(requests, 'get', return_value=FAKE_BODY):
+        with patch.object(sfq.sf.session, 'get', return_value=response_mock) as get_mock:
             response = sfq.fetch_attachment(FAKE_ATTACHMENT_ID, FAKE_CONTENT_TYPE)
 
-        self.assertEqual(response, FAKE_BODY)
+        self.assertEqual(response, response_mock)
+        self.assertTrue(get_mock.call_args[1]['stream'])
+        self.assertEqual(SF_HTTP_TIMEOUT, get_mock.call_args[1]['timeout'])
+
+    def test_fetch_attachment_with_expired_session(self):
+        sfq = _generate_fake_salesforce_query_instance()
+        expired_client = sfq.sf
+        expired_client.session.get.return_value = Mock(status_code=401)
+        renewed_client = Mock(session_id='RENEWED_SESSION_ID', sf_instance='FAKE_INSTANCE')
+        renewed_client.session.get.return_value = Mock(status_code=200)
+
+        with patch.object(SalesforceSession, 'renew', return_value=renewed_client) as renew_mock:
+            response = sfq.fetch_attachment('FAKE_ATTACHMENT_ID', 'FAKE_CONTENT_TYPE')
+
+        renew_mock.assert_called_once_with(expired_client)
+        self.assertEqual(200, response.status_code)
+        headers = renewed_client.session.get.call_args[1]['headers']
+        self.assertEqual('Bearer RENEWED_SESSION_ID', headers['Authorization'])
 
     def test_download_attachment(self):
         client = Client()
@@ -1080,7 +2912,8 @@ class DownloadAttachment(TestCase):
         }
         FAKE_BODY = base64.b64encode(b"FAKE_CONTRACT_BODY")
         attachment_mock = Mock()
-        attachment_mock.content = FAKE_BODY
+        attachment_mock.iter_content.return_value = iter([FAKE_BODY[:8], FAKE_BODY[8:]])
+        attachment_mock.headers = {'Content-Length': str(len(FAKE_BODY))}
 
         with patch.object(SalesforceQuery, 'fetch_attachment', return_value=attachment_mock), \
                 patch.object(SalesforceQuery, '__init__', return_value=None):
@@ -1089,7 +2922,68 @@ class DownloadAttachment(TestCase):
             )
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.content, FAKE_BODY)
+        self.assertEqual(b''.join(response.streaming_content), FAKE_BODY)
+        self.assertEqual(str(len(FAKE_BODY)), response['Content-Length'])
+        attachment_mock.close.assert_called_once_with()
+
+    def test_download_compressed_attachment_has_no_content_length(self):
+        attachment = AttachmentFactory()
+        FAKE_BODY = b"FAKE_CONTRACT_BODY"
+        attachment_mock = Mock(headers={'Content-Length': '12', 'Content-Encoding': 'gzip'})
+        attachment_mock.iter_content.return_value = iter([FAKE_BODY])
+
+        with patch.object(SalesforceQuery, 'fetch_attachment', return_value=attachment_mock), \
+                patch.object(SalesforceQuery, '__init__', return_value=None):
+            response = Client().get(reverse('download_attachment', kwargs={'attachment_id': attachment.id}))
+
+        self.assertEqual(b''.join(response.streaming_content), FAKE_BODY)
+        self.assertFalse(response.has_header('Content-Length'))
+
+    def test_download_attachment_twice_reads_from_disk(self):
+        client = Client()
+        attachment = AttachmentFactory()
+        url = reverse('download_attachment', kwargs={'attachment_id': attachment.id})
+        FAKE_BODY = b"FAKE_CONTRACT_BODY"
+        attachment_mock = Mock(headers={})
+        attachment_mock.iter_content.return_value = iter([FAKE_BODY])
+
+        with patch.object(SalesforceQuery, 'fetch_attachment', return_value=attachment_mock) as fetch_mock, \
+                patch.object(SalesforceQuery, '__init__', return_value=None):
+            first_response = client.get(url)
+            self.assertEqual(b''.join(first_response.streaming_content), FAKE_BODY)
+            second_response = client.get(url)
+            self.assertEqual(b''.join(second_response.streaming_content), FAKE_BODY)
+
+        fetch_mock.assert_called_once_with(attachment.salesforce_id, attachment.content_type)
+        self.assertEqual(str(len(FAKE_BODY)), second_response['Content-Length'])
+        self.assertEqual({'hits': 1, 'misses': 1}, attachment_cache.stats())
+
+    def test_interrupted_download_is_not_cached(self):
+        chunks = attachment_cache.store('FAKE_SALESFORCE_ID', iter([b'FIRST', b'SECOND']))
+        next(chunks)
+        chunks.close()
+        self.assertIsNone(attachment_cache.open('FAKE_SALESFORCE_ID'))
+        self.assertEqual([], os.listdir(attachment_cache.directory))
+
+    def test_least_recently_used_attachments_are_evicted(self):
+        with override_settings(ATTACHMENT_CACHE_MAX_BYTES=10):
+            for salesforce_id in ('FAKE_ID_1', 'FAKE_ID_2'):
+                list(attachment_cache.store(salesforce_id, iter([b'12345'])))
+                os.utime(attachment_cache.path(salesforce_id), (0, 0))
+            attachment_cache.open('FAKE_ID_1').close()
+            list(attachment_cache.store('FAKE_ID_3', iter([b'12345'])))
+        self.assertIsNone(attachment_cache.open('FAKE_ID_2'))
+        for salesforce_id in ('FAKE_ID_1', 'FAKE_ID_3'):
+            with attachment_cache.open(salesforce_id) as cached_file:
+                self.assertEqual(b'12345', cached_file.read())
+
+    def test_stats_outlive_the_default_cache_timeout(self):
+        _use_file_based_cache(self)
+        list(attachment_cache.store('FAKE_ID_1', iter([b'12345'])))
+        attachment_cache.open('FAKE_ID_1').close()
+        self.assertIsNone(attachment_cache.open('FAKE_ID_2'))
+        with freeze_time(timezone.now() + datetime.timedelta(days=1)):
+            self.assertEqual({'hits': 1, 'misses': 1}, attachment_cache.stats())
 
     def test_render_attachment_in_installment_viewg(self):
         factory = RequestFactory()
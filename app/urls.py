@@ -9,11 +9,22 @@ urlpatterns = [
     url(r'^contracts/update/(?P<pk>[0-9]+)/$', views.ContractUpdate.as_view(), name='contracts-update'),
     url(r'^contracts/(?P<pk>[0-9]+)/detail/$', views.DetailContractView.as_view(), name='contracts-detail'),
     url(r'^contracts/save/(?P<contract_id>\w+)/$', views.SaveCaseView.as_view(), name='contracts-save'),
+    url(r'^contracts/import/$', views.ImportCasesView.as_view(), name='contracts-import'),
     url(
         r'^contracts/(?P<contract_id>[0-9]+)/installments/$',
         views.InstallmentView.as_view(),
         name='installments-create',
     ),
+    url(
+        r'^contracts/(?P<contract_id>[0-9]+)/installments/schedule/$',
+        views.InstallmentScheduleView.as_view(),
+        name='installments-schedule',
+    ),
+    url(
+        r'^contracts/(?P<contract_id>[0-9]+)/installments/grid/$',
+        views.InstallmentGridView.as_view(),
+        name='installments-grid',
+    ),
     url(
         r'^contracts/(?P<contract_id>[0-9]+)/installments/update/(?P<pk>[0-9]+)/$',
         views.InstallmentUpdate.as_view(),
@@ -35,6 +46,7 @@ urlpatterns = [
         views.ToggleConditionView.as_view(),
         name='toggle-condition',
     ),
+    url(r'^contracts/conditions/done/$', views.ConditionBatchDoneView.as_view(), name='conditions-batch-done'),
     url(
         r'^contracts/(?P<contract_id>[0-9]+)/events/$',
         views.CreateEvent.as_view(),
@@ -64,6 +76,28 @@ urlpatterns = [
         name='installment-condition-delete',
     ),
     url(r'^contracts/installments/$', views.AllInstallmentsView.as_view(), name='all-installments'),
+    url(
+        r'^contracts/installments/bulk-update/$',
+        views.InstallmentBulkUpdateView.as_view(),
+        name='installments-bulk-update',
+    ),
+    url(r'^contracts/installments/summary/$', views.PortfolioSummaryView.as_view(), name='installments-summary'),
+    url(
+        r'^contracts/installments/summary/json/$',
+        views.PortfolioSummaryJsonView.as_view(),
+        name='installments-summary-json',
+    ),
+    url(r'^contracts/installments/exports/$', views.ExportJobCreateView.as_view(), name='installments-export'),
+    url(
+        r'^contracts/installments/exports/(?P<pk>[0-9]+)/$',
+        views.ExportJobStatusView.as_view(),
+        name='installments-export-status',
+    ),
+    url(
+        r'^contracts/installments/exports/(?P<pk>[0-9]+)/download/$',
+        views.ExportJobDownloadView.as_view(),
+        name='installments-export-download',
+    ),
     url(r'^contracts/', views.ContractsTableView.as_view(), name='contracts'),
     url(r'attachment/(?P<attachment_id>.+)/$', views.download_attachment, name='download_attachment'),
     url(r'^ajax/superset-query', views.presto_query, name='superset_query'),
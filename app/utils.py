@@ -1,117 +1,564 @@
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from urllib.parse import quote_plus
+
 import requests
 
-from simple_salesforce import Salesforce
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (
+    IntegrityError,
+    transaction,
+)
+from requests.adapters import HTTPAdapter
+from simple_salesforce import (
+    Salesforce,
+    SalesforceError,
+    SalesforceExpiredSession,
+    SalesforceGeneralError,
+)
 from textwrap import dedent
 
 from app import (
+    ATTACHMENT_CACHE_HITS_KEY,
+    ATTACHMENT_CACHE_MISSES_KEY,
+    IMPORT_ALREADY_EXISTS,
+    IMPORT_CREATED,
+    IMPORT_NO_SIGNED_DATE,
+    IMPORT_NOT_FOUND,
+    SF_API_VERSION,
+    SF_ATTACHMENT_CHUNK_SIZE,
+    SF_DATETIME_FORMAT,
     SF_DOMAIN,
+    SF_HTTP_TIMEOUT,
+    SF_IN_CLAUSE_CHUNK_SIZE,
     SF_PASSWORD,
+    SF_QUERY_MAX_WORKERS,
     SF_SECURITY_TOKEN,
+    SF_SESSION_CACHE_KEY,
+    SF_SESSION_CACHE_TIMEOUT,
     SF_USERNAME,
     SUPERSET_QUERY_DATE_FORMAT,
 )
+from app.models import (
+    Attachment,
+    Contract,
+)
+from app.pagination import invalidate_counts
 
 
-class SalesforceQuery:
+logger = logging.getLogger(__name__)
+
+
+class SalesforceSession:
+    """
+    Process-wide Salesforce client.
+
+    The first borrower logs in, or reuses the session id another worker left in the cache,
+    and every later borrower gets the same client back.
+    """
 
     def __init__(self):
-        self.sf = Salesforce(username=SF_USERNAME,
-                             password=SF_PASSWORD,
-                             security_token=SF_SECURITY_TOKEN,
-                             domain=SF_DOMAIN,
-                             )
+        self._client = None
+        self._lock = threading.Lock()
+        self.http = requests.Session()
+        self.http.mount('https://', HTTPAdapter(pool_maxsize=SF_QUERY_MAX_WORKERS * 2))
+
+    def borrow(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._connect()
+            return self._client
+
+    def renew(self, expired_client):
+        with self._lock:
+            if self._client is None or self._client is expired_client:
+                cached = cache.get(SF_SESSION_CACHE_KEY)
+                if cached and cached['session_id'] != getattr(expired_client, 'session_id', None):
+                    self._client = self._from_cache(cached)
+                else:
+                    self._client = self._login()
+            return self._client
+
+    def reset(self):
+        with self._lock:
+            self._client = None
+
+    def warm_up(self):
+        try:
+            self.borrow()
+        except (SalesforceError, requests.RequestException):
+            logger.exception('Could not open the Salesforce session on warm up')
+
+    def _connect(self):
+        cached = cache.get(SF_SESSION_CACHE_KEY)
+        if cached:
+            return self._from_cache(cached)
+        return self._login()
+
+    def _from_cache(self, cached):
+        return Salesforce(
+            session_id=cached['session_id'],
+            instance=cached['instance'],
+            session=self.http,
+            version=SF_API_VERSION,
+        )
+
+    def _login(self):
+        client = Salesforce(username=SF_USERNAME,
+                            password=SF_PASSWORD,
+                            security_token=SF_SECURITY_TOKEN,
+                            domain=SF_DOMAIN,
+                            session=self.http,
+                            version=SF_API_VERSION,
+                            )
+        cache.set(
+            SF_SESSION_CACHE_KEY,
+            {'session_id': client.session_id, 'instance': client.sf_instance},
+            SF_SESSION_CACHE_TIMEOUT,
+        )
+        return client
+
+
+salesforce_session = SalesforceSession()
+
+
+def renew_expired_session(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except SalesforceExpiredSession:
+            self.sf = self.session.renew(self.sf)
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def parse_case_numbers(comma_separated_case_numbers):
+    return list(dict.fromkeys(
+        num for num in re.split(r'[\s,]+', comma_separated_case_numbers) if num
+    ))
+
+
+def chunked(values, size):
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def join_cases_with_contracts(cases, contracts):
+    contracts_by_id = {contract['Id']: contract for contract in contracts}
+    for case in cases:
+        contract = contracts_by_id.get(case['Contract__c'])
+        if contract is None:
+            continue
+        yield {
+            'case_id': case['Id'],
+            'case_number': case['CaseNumber'],
+            'contract_id': case['Contract__c'],
+            'description': case['Description'],
+            'link_to_salesforce_case': case['Case_URL__c'],
+            'organizer_email': contract['Eventbrite_Username__c'],
+            'organizer_name': contract['Hoopla_Account_Name__c'],
+            'signed_date': contract['ActivatedDate'],
+        }
+
+
+def attachment_data(attachment):
+    return {
+        'salesforce_id': attachment['Id'],
+        'name': attachment['Name'],
+        'content_type': attachment['ContentType'],
+    }
+
+
+class SalesforceQuery:
+    session = salesforce_session
+
+    def __init__(self, session=None):
+        if session is not None:
+            self.session = session
+        self.sf = self.session.borrow()
+
+    @renew_expired_session
+    def _query_page(self, query=None, next_records_url=None):
+        if next_records_url:
+            return self.sf.query_more(next_records_url, identifier_is_url=True)
+        return self.sf.query(query)
+
+    def iter_query(self, query):
+        """
+        Yield the records of a SOQL query one batch at a time,
+        only asking Salesforce for the next batch once the current one is consumed.
+        """
+        yield from self._iter_query_result(self._query_page(query))
+
+    def _iter_query_result(self, result):
+        yield from result['records']
+        while result.get('nextRecordsUrl'):
+            result = self._query_page(next_records_url=result['nextRecordsUrl'])
+            yield from result['records']
 
     def fetch_cases(self, comma_separated_case_numbers):
-        case_numbers = comma_separated_case_numbers.split(',')
-        case_numbers_querystring = ','.join(repr(str(num)) for num in case_numbers) if case_numbers else "''"
-        cases = self.sf.query(
+        return list(self.iter_cases(comma_separated_case_numbers))
+
+    def iter_cases(self, comma_separated_case_numbers):
+        case_numbers = parse_case_numbers(comma_separated_case_numbers)
+        chunks = chunked(case_numbers, SF_IN_CLAUSE_CHUNK_SIZE)
+        if not chunks:
+            return
+        with ThreadPoolExecutor(max_workers=min(SF_QUERY_MAX_WORKERS, len(chunks))) as executor:
+            for cases in executor.map(self._fetch_cases_chunk, chunks):
+                yield from cases
+
+    def fetch_cases_by_ids(self, case_ids):
+        """
+        Fetch the cases with the given Ids, their contracts and the contracts' attachments,
+        batching every lookup into chunked IN queries.
+        """
+        cases = self._query_in_chunks(
+            'SELECT id, Contract__c, Description, CaseNumber, Case_URL__c from Case WHERE id IN ({})',
+            case_ids,
+        )
+        contract_ids = sorted({case['Contract__c'] for case in cases if case['Contract__c']})
+        contracts = self._query_in_chunks(
+            'SELECT Id, Eventbrite_Username__c, Hoopla_Account_Name__c, ActivatedDate from Contract WHERE id IN ({})',
+            contract_ids,
+        )
+        attachments = self._query_in_chunks(
+            'SELECT Id, Name, ContentType, ParentId from Attachment WHERE ParentId IN ({})',
+            contract_ids,
+        )
+        return cases, contracts, attachments
+
+    def fetch_contracts_by_ids(self, contract_ids, fields):
+        return self._query_in_chunks(
+            'SELECT {} from Contract WHERE Id IN ({{}})'.format(fields),
+            sorted(contract_ids),
+        )
+
+    def _query_in_chunks(self, query, values):
+        chunks = chunked(values, SF_IN_CLAUSE_CHUNK_SIZE)
+        if not chunks:
+            return []
+
+        def query_chunk(chunk):
+            return list(self.iter_query(query.format(','.join(repr(str(value)) for value in chunk))))
+
+        with ThreadPoolExecutor(max_workers=min(SF_QUERY_MAX_WORKERS, len(chunks))) as executor:
+            return [record for records in executor.map(query_chunk, chunks) for record in records]
+
+    def _fetch_cases_chunk(self, case_numbers):
+        case_numbers_querystring = ','.join(repr(str(num)) for num in case_numbers)
+        cases = list(self.iter_query(
             'SELECT id, Contract__c, Description, CaseNumber, Case_URL__c from Case WHERE CaseNumber IN ({})'
-            .format(case_numbers_querystring))['records']
+            .format(case_numbers_querystring)))
 
-        contract_ids = [c['Contract__c'] for c in cases]
+        contract_ids = sorted({c['Contract__c'] for c in cases if c['Contract__c']})
+        if not contract_ids:
+            return []
         contract_ids_querystring = ','.join(repr(str(id)) for id in contract_ids)
 
-        contracts = self.sf.query(
-            'SELECT Eventbrite_Username__c, Hoopla_Account_Name__c, ActivatedDate from Contract WHERE id IN ({})'
-            .format(contract_ids_querystring))['records']
-        result = []
-
-        for case, contract in zip(cases, contracts):
-            result.append({
-                'case_id': case['Id'],
-                'case_number': case['CaseNumber'],
-                'contract_id': case['Contract__c'],
-                'description': case['Description'],
-                'link_to_salesforce_case': case['Case_URL__c'],
-                'organizer_email': contract['Eventbrite_Username__c'],
-                'organizer_name': contract['Hoopla_Account_Name__c'],
-                'signed_date': contract['ActivatedDate'],
-            })
-        return result
+        contracts = self.iter_query(
+            'SELECT Id, Eventbrite_Username__c, Hoopla_Account_Name__c, ActivatedDate from Contract WHERE id IN ({})'
+            .format(contract_ids_querystring))
+        return list(join_cases_with_contracts(cases, contracts))
 
+    @renew_expired_session
     def get_case_by_id(self, case_id):
         case = self.sf.Case.get(case_id)
         return case
 
+    @renew_expired_session
     def get_contract_by_id(self, contract_id):
         contract = self.sf.Contract.get(contract_id)
         return contract
 
+    @renew_expired_session
+    def fetch_case_with_contract(self, case_id):
+        """
+        Fetch a case, its contract and the contract attachments in one composite request,
+        letting Salesforce resolve the case's Contract__c for the other two subrequests.
+        """
+        api_path = '/services/data/v{}/'.format(SF_API_VERSION)
+        attachments_query = "SELECT Id, Name, ContentType from Attachment WHERE ParentId = '@{case.Contract__c}'"
+        result = self.sf.restful('composite', method='POST', data=json.dumps({
+            'allOrNone': True,
+            'compositeRequest': [
+                {
+                    'method': 'GET',
+                    'url': api_path + 'sobjects/Case/' + case_id,
+                    'referenceId': 'case',
+                },
+                {
+                    'method': 'GET',
+                    'url': api_path + 'sobjects/Contract/@{case.Contract__c}',
+                    'referenceId': 'contract',
+                },
+                {
+                    'method': 'GET',
+                    'url': api_path + 'query/?q=' + quote_plus(attachments_query, safe="'@{}"),
+                    'referenceId': 'attachments',
+                },
+            ],
+        }))
+        bodies = {}
+        for subresponse in result['compositeResponse']:
+            if subresponse['httpStatusCode'] >= 300:
+                raise SalesforceGeneralError(
+                    'composite', subresponse['httpStatusCode'], subresponse['referenceId'], subresponse['body'],
+                )
+            bodies[subresponse['referenceId']] = subresponse['body']
+        attachments = [attachment_data(attachment) for attachment in self._iter_query_result(bodies['attachments'])]
+        return bodies['case'], bodies['contract'], attachments
+
     def fetch_cases_by_date(self, case_date_from, case_date_to):
-        cases = self.sf.query(
-            "SELECT id, Contract__c, Description, CaseNumber, Case_URL__c from Case WHERE (Subject LIKE '{r}' \
-            OR Subject like '{n}') AND Contract__c != null"
-            .format(r='RECOUPABLE%', n='NON-RECOUPABLE%'))['records']
+        return list(self.iter_cases_by_date(case_date_from, case_date_to))
 
+    def iter_cases_by_date(self, case_date_from, case_date_to):
         contracts_ids_query = "SELECT Contract__c from Case WHERE (Subject LIKE '{r}' OR Subject like '{n}') \
         AND Contract__c != null".format(r='RECOUPABLE%', n='NON-RECOUPABLE%')
 
-        contracts = self.sf.query(
+        contracts = self.iter_query(
             "SELECT Id, Eventbrite_Username__c, Hoopla_Account_Name__c, ActivatedDate from Contract WHERE id IN ({q}) \
             AND BillingCountry = 'Brazil' AND ActivatedDate > {f} AND ActivatedDate < {t}"
-            .format(q=contracts_ids_query, f=case_date_from, t=case_date_to))['records']
-
-        result = []
-
-        for case in cases:
-            for contract in contracts:
-                if case['Contract__c'] == contract['Id']:
-                    result.append({
-                        'case_id': case['Id'],
-                        'case_number': case['CaseNumber'],
-                        'contract_id': case['Contract__c'],
-                        'description': case['Description'],
-                        'link_to_salesforce_case': case['Case_URL__c'],
-                        'organizer_email': contract['Eventbrite_Username__c'],
-                        'organizer_name': contract['Hoopla_Account_Name__c'],
-                        'signed_date': contract['ActivatedDate'],
-                    })
-        return result
+            .format(q=contracts_ids_query, f=case_date_from, t=case_date_to))
+
+        contracts_in_range_query = "SELECT Id from Contract WHERE BillingCountry = 'Brazil' \
+            AND ActivatedDate > {f} AND ActivatedDate < {t}".format(f=case_date_from, t=case_date_to)
+
+        cases = self.iter_query(
+            "SELECT id, Contract__c, Description, CaseNumber, Case_URL__c from Case WHERE (Subject LIKE '{r}' \
+            OR Subject like '{n}') AND Contract__c IN ({q})"
+            .format(r='RECOUPABLE%', n='NON-RECOUPABLE%', q=contracts_in_range_query))
+
+        return join_cases_with_contracts(cases, contracts)
 
     def fetch_contract_attachments(self, contract_id):
-        attachments = self.sf.query(
-            "SELECT Id, Name, ContentType from Attachment WHERE ParentId = '{}'".format(contract_id))['records']
+        return list(self.iter_contract_attachments(contract_id))
 
-        result = []
+    def iter_contract_attachments(self, contract_id):
+        attachments = self.iter_query(
+            "SELECT Id, Name, ContentType from Attachment WHERE ParentId = '{}'".format(contract_id))
 
         for attachment in attachments:
-            result.append({
-                'salesforce_id': attachment['Id'],
-                'name': attachment['Name'],
-                'content_type': attachment['ContentType'],
-            })
-
-        return result
+            yield attachment_data(attachment)
 
+    @renew_expired_session
     def fetch_attachment(self, attachment_id, content_type):
         session_id = self.sf.session_id
         instance = self.sf.sf_instance
-        response = requests.get('https://' + instance + '/services/data/v39.0/sobjects/Attachment/'
-                                + attachment_id + '/body',
-                                headers={'Content-Type': content_type, 'Authorization': 'Bearer ' + session_id})
+        response = self.sf.session.get('https://' + instance + '/services/data/v39.0/sobjects/Attachment/'
+                                       + attachment_id + '/body',
+                                       headers={'Content-Type': content_type, 'Authorization': 'Bearer ' + session_id},
+                                       stream=True,
+                                       timeout=SF_HTTP_TIMEOUT)
+        if response.status_code == 401:
+            response.close()
+            raise SalesforceExpiredSession(response.url, response.status_code, 'Attachment', response.reason)
+        response.raise_for_status()
         return response
 
 
+class AttachmentCache:
+    """
+    Least recently used cache of Salesforce attachment bodies on local disk.
+
+    Entries are only visible once fully written, and the oldest ones are
+    evicted whenever the directory grows past ATTACHMENT_CACHE_MAX_BYTES.
+    """
+    temp_prefix = '.tmp-'
+
+    @property
+    def directory(self):
+        return settings.ATTACHMENT_CACHE_DIR
+
+    @property
+    def max_bytes(self):
+        return settings.ATTACHMENT_CACHE_MAX_BYTES
+
+    def path(self, salesforce_id):
+        return os.path.join(self.directory, hashlib.sha1(salesforce_id.encode('utf-8')).hexdigest())
+
+    def open(self, salesforce_id):
+        path = self.path(salesforce_id)
+        try:
+            cached_file = open(path, 'rb')
+        except FileNotFoundError:
+            self._count(ATTACHMENT_CACHE_MISSES_KEY)
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self._count(ATTACHMENT_CACHE_HITS_KEY)
+        return cached_file
+
+    def store(self, salesforce_id, chunks):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=self.temp_prefix)
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in chunks:
+                    temp_file.write(chunk)
+                    yield chunk
+            os.replace(temp_path, self.path(salesforce_id))
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith(self.temp_prefix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def stats(self):
+        """
+        Approximate hit and miss counts. Each count is a read-modify-write, so
+        concurrent downloads can lose increments; good enough to watch the hit
+        rate, not for exact accounting.
+        """
+        return {
+            'hits': cache.get(ATTACHMENT_CACHE_HITS_KEY, 0),
+            'misses': cache.get(ATTACHMENT_CACHE_MISSES_KEY, 0),
+        }
+
+    def _count(self, key):
+        # Not atomic (see stats()): BaseCache.incr() is a get and set as well on
+        # FileBasedCache, and it would also re-set the key with the default
+        # timeout, so store the new value without expiry instead
+        cache.set(key, cache.get(key, 0) + 1, None)
+
+
+attachment_cache = AttachmentCache()
+
+
+def import_cases(case_ids, sf_query=None):
+    """
+    Save the given Salesforce cases as contracts with their attachments in one transaction,
+    skipping case numbers that were already imported and contracts without an activation
+    date. Returns one outcome per case Id.
+    """
+    case_ids = list(dict.fromkeys(case_ids))
+    cases, contracts, attachments = (sf_query or SalesforceQuery()).fetch_cases_by_ids(case_ids)
+    cases_by_id = {case['Id']: case for case in cases}
+    contracts_by_id = {contract['Id']: contract for contract in contracts}
+    existing_case_numbers = set(Contract.objects.filter(
+        case_number__in=[case['CaseNumber'] for case in cases],
+    ).values_list('case_number', flat=True))
+
+    report = []
+    new_contracts = []
+    for case_id in case_ids:
+        case = cases_by_id.get(case_id)
+        if case is None or case['Contract__c'] not in contracts_by_id:
+            status = IMPORT_NOT_FOUND
+        elif case['CaseNumber'] in existing_case_numbers:
+            status = IMPORT_ALREADY_EXISTS
+        elif not contracts_by_id[case['Contract__c']]['ActivatedDate']:
+            status = IMPORT_NO_SIGNED_DATE
+        else:
+            status = IMPORT_CREATED
+            contract_data = contracts_by_id[case['Contract__c']]
+            existing_case_numbers.add(case['CaseNumber'])
+            new_contracts.append(Contract(
+                organizer_account_name=contract_data['Hoopla_Account_Name__c'],
+                organizer_email=contract_data['Eventbrite_Username__c'],
+                signed_date=datetime.datetime.strptime(contract_data['ActivatedDate'], SF_DATETIME_FORMAT),
+                description=case['Description'],
+                case_number=case['CaseNumber'],
+                salesforce_id=case['Contract__c'],
+                salesforce_case_id=case_id,
+                link_to_salesforce_case=case['Case_URL__c'],
+            ))
+            # bulk_create skips save(), which normally fills the search column
+            new_contracts[-1].refresh_organizer_search()
+        report.append({
+            'case_id': case_id,
+            'case_number': case['CaseNumber'] if case else None,
+            'status': status,
+        })
+
+    if not new_contracts:
+        return report
+    try:
+        save_imported_contracts(new_contracts, attachments)
+    except IntegrityError:
+        # A concurrent import saved some of these case numbers after the check
+        # above; save the rest one by one and report those as already there
+        outcomes = {outcome['case_number']: outcome for outcome in report}
+        for contract in new_contracts:
+            try:
+                save_imported_contracts([contract], attachments)
+            except IntegrityError:
+                if not Contract.objects.filter(case_number=contract.case_number).exists():
+                    raise
+                outcomes[contract.case_number]['status'] = IMPORT_ALREADY_EXISTS
+    # bulk_create sends no post_save, so retire the cached list counts here
+    invalidate_counts()
+    return report
+
+
+def save_imported_contracts(new_contracts, attachments):
+    with transaction.atomic():
+        Contract.objects.bulk_create(new_contracts)
+        contract_pks = dict(Contract.objects.filter(
+            case_number__in=[contract.case_number for contract in new_contracts],
+        ).values_list('case_number', 'pk'))
+        contract_pks_by_salesforce_id = {}
+        for contract in new_contracts:
+            contract_pks_by_salesforce_id.setdefault(contract.salesforce_id, []).append(
+                contract_pks[contract.case_number],
+            )
+        Attachment.objects.bulk_create([
+            Attachment(contract_id=contract_pk, **attachment_data(attachment))
+            for attachment in attachments
+            for contract_pk in contract_pks_by_salesforce_id.get(attachment['ParentId'], [])
+        ])
+
+
+def iter_response_content(response, chunk_size=SF_ATTACHMENT_CHUNK_SIZE):
+    try:
+        yield from response.iter_content(chunk_size=chunk_size)
+    finally:
+        response.close()
+
+
+class Echo:
+    """Pseudo-buffer for csv.writer: hands each written line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
 def generate_presto_query(event_id=None, from_date=None, to_date=None, currency=None):
     currency = currency or 'BRL'
     from_date_condition = "AND trx_date > '{}'".format(
@@ -1,20 +1,32 @@
-from io import BytesIO
-import csv
 import datetime
-import operator
+import functools
+import json
+import os
 
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.db.models import Q
 from django.forms import DateInput
 from django.http import (
-    HttpResponse,
+    FileResponse,
+    Http404,
     JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import (
+    get_object_or_404,
+    redirect,
+    render,
+)
+from django.urls import (
+    reverse,
+    reverse_lazy,
 )
-from django.shortcuts import redirect
-from django.urls import reverse_lazy
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import (
@@ -29,32 +41,62 @@ from django_filters import (
     CharFilter,
     ChoiceFilter,
     DateFilter,
+    DateFromToRangeFilter,
     FilterSet,
+    RangeFilter,
 )
 from django_filters.views import FilterView
+from django_filters.widgets import DateRangeWidget
 from django_tables2.views import SingleTableMixin
+from django.utils import timezone
 from django.utils.decorators import method_decorator
+from django.utils.text import compress_sequence
 from dropbox.exceptions import BadInputError
 from pure_pagination.mixins import PaginationMixin
 
 from app import (
-    BASIC_CONDITIONS,
+    COUNT_CACHE_TIMEOUT,
     DROPBOX_ERROR,
+    EXPORT_DONE,
+    EXPORT_RESULT_MAX_AGE,
     ITEMS_PER_PAGE,
     LINK_TO_RECOUPS,
     LINK_TO_REPORT_EVENTS,
     LINK_TO_SEARCH_EVENT_OR_USER,
+    SF_DATETIME_FORMAT,
     STATUS,
     SUPERSET_DEFAULT_CURRENCY,
     SUPERSET_QUERY_DATE_FORMAT,
 )
-from app.forms import CustomAuthenticationForm
+from app.forms import (
+    CustomAuthenticationForm,
+    InstallmentBulkUpdateForm,
+    InstallmentGridFormSet,
+    InstallmentScheduleForm,
+)
 from app.models import (
     Attachment,
     Contract,
     Event,
+    ExportJob,
     Installment,
     InstallmentCondition,
+    InstallmentReport,
+)
+from app.pagination import (
+    CachedCountPaginator,
+    KeysetPaginationMixin,
+    count_cache_key,
+)
+from app.reporting import update_installments
+from app.schedules import (
+    bulk_update_installments,
+    create_installments,
+)
+from app.search import get_organizer_search
+from app.sync import (
+    synced_cases_by_date,
+    synced_cases_by_numbers,
 )
 from app.tables import (
     ContractsTable,
@@ -62,7 +104,12 @@ from app.tables import (
     InstallmentsTable,
 )
 from app.utils import (
+    attachment_cache,
     generate_presto_query,
+    import_cases,
+    iter_csv_lines,
+    iter_response_content,
+    parse_case_numbers,
     SalesforceQuery,
 )
 
@@ -83,10 +130,7 @@ class ContractsFilter(FilterSet):
     )
 
     def search_organizer(self, qs, name, value):
-        return qs.filter(
-            Q(organizer_account_name__icontains=value) |
-            Q(organizer_email__icontains=value)
-        )
+        return get_organizer_search().matching(qs, value)
 
     def search_signed_date(self, qs, name, value):
         return qs.filter(
@@ -118,12 +162,33 @@ class ContractUpdate(UpdateView):
         return context
 
 
-class ContractsTableView(LoginRequiredMixin, SingleTableMixin, PaginationMixin, FilterView):
+class ContractsTableView(LoginRequiredMixin, KeysetPaginationMixin, SingleTableMixin, PaginationMixin, FilterView):
     queryset = Contract.objects.all()
     table_class = ContractsTable
     template_name = "app/contracts_table.html"
     filterset_class = ContractsFilter
     paginate_by = ITEMS_PER_PAGE
+    keyset_ordering = ('-signed_date', '-id')
+
+    def use_keyset(self):
+        # Search results are ordered by relevance, which the date cursor would throw away
+        return super().use_keyset() and not self.request.GET.get('organizer_search', '').strip()
+
+    def get_table_data(self):
+        if self.use_keyset():
+            return self.keyset_page.object_list
+        return super().get_table_data()
+
+    def get_table_pagination(self, table):
+        # The keyset page is already sliced; paginating the table again would COUNT(*) the whole set
+        if self.use_keyset():
+            return False
+        pagination = super().get_table_pagination(table)
+        pagination['paginator_class'] = functools.partial(
+            CachedCountPaginator,
+            count_key=self.count_cache_key('offset'),
+        )
+        return pagination
 
 
 class InstallmentView(LoginRequiredMixin, SingleTableMixin, CreateView):
@@ -140,7 +205,7 @@ class InstallmentView(LoginRequiredMixin, SingleTableMixin, CreateView):
 
     def get_queryset(self):
         queryset = Installment.objects.filter(contract_id=self.kwargs['contract_id'])
-        return queryset.all()
+        return queryset.with_balance()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -161,20 +226,63 @@ class InstallmentView(LoginRequiredMixin, SingleTableMixin, CreateView):
                 'type': 'text',
             },
         )
+        if 'schedule_form' not in context:
+            context['schedule_form'] = InstallmentScheduleForm()
+        context['grid_formset'] = InstallmentGridFormSet(
+            queryset=Installment.objects.filter(contract_id=self.kwargs['contract_id']).order_by('id'),
+        )
         return context
 
     def get_success_url(self):
         return reverse_lazy('installments-create', kwargs=self.kwargs)
 
     def form_valid(self, form, **kwargs):
-        form.instance.contract_id = self.kwargs['contract_id']
-        self.object = form.save()
-        for condition in BASIC_CONDITIONS:
-            InstallmentCondition.objects.create(
-                installment=self.object,
-                condition_name=condition,
-            )
-        return super(InstallmentView, self).form_valid(form)
+        # Same path as a schedule of one, so the conditions go in with a single INSERT
+        self.object = create_installments(self.kwargs['contract_id'], [form.instance])[0]
+        return redirect(self.get_success_url())
+
+
+class InstallmentScheduleView(InstallmentView):
+    """Creates every installment of a schedule at once, from the schedule form on the create page."""
+
+    def post(self, request, *args, **kwargs):
+        self.object = None
+        schedule_form = InstallmentScheduleForm(request.POST)
+        if schedule_form.is_valid():
+            create_installments(self.kwargs['contract_id'], schedule_form.build_installments())
+            return redirect(self.get_success_url())
+        return self.render_to_response(self.get_context_data(
+            form=self.get_form_class()(),
+            schedule_form=schedule_form,
+        ))
+
+
+class InstallmentGridView(LoginRequiredMixin, View):
+    """
+    Saves the rows changed in the installment grid of the create page. The
+    formset validates them, one UPDATE writes them and only those rows are
+    sent back, so rebalancing a whole schedule is a single request.
+    """
+
+    def post(self, request, *args, **kwargs):
+        formset = InstallmentGridFormSet(
+            request.POST,
+            queryset=Installment.objects.filter(contract_id=self.kwargs['contract_id']),
+        )
+        if not formset.is_valid():
+            return JsonResponse({'errors': formset.errors, 'non_form_errors': formset.non_form_errors()}, status=400)
+        changed = [form for form in formset if form.has_changed()]
+        bulk_update_installments(
+            [form.instance for form in changed],
+            sorted({name for form in changed for name in form.changed_data}),
+        )
+        return JsonResponse({'installments': [self.row(form.instance) for form in changed]})
+
+    def row(self, installment):
+        row = {name: getattr(installment, name) for name in InstallmentGridFormSet.form._meta.fields}
+        row['id'] = installment.pk
+        row['balance'] = installment.balance
+        return row
 
 
 class ContractAdd(TemplateView):
@@ -182,7 +290,6 @@ class ContractAdd(TemplateView):
     template_name = "app/add_contracts.html"
 
     def get_context_data(self, **kwargs):
-        sf = SalesforceQuery()
         context = super().get_context_data(**kwargs)
         case_numbers = self.request.GET.get('case_numbers') or self.kwargs.get('case_numbers')
         date_from = self.request.GET.get('case_date_from')
@@ -192,18 +299,30 @@ class ContractAdd(TemplateView):
             try:
                 date_from_formated = '{2}-{0}-{1}T00:00:00.000+0000'.format(*date_from.split('/'))
                 date_to_formated = '{2}-{0}-{1}T23:59:59.000+0000'.format(*date_to.split('/'))
-                contract_data = sf.fetch_cases_by_date(date_from_formated, date_to_formated)
+                contract_data = synced_cases_by_date(
+                    datetime.datetime.strptime(date_from_formated, SF_DATETIME_FORMAT),
+                    datetime.datetime.strptime(date_to_formated, SF_DATETIME_FORMAT),
+                )
+                if not contract_data:
+                    contract_data = SalesforceQuery().fetch_cases_by_date(date_from_formated, date_to_formated)
                 for elem in contract_data:
                     elem['save'] = elem['case_id']
                     context["table"] = FetchSalesForceCasesTable(contract_data)
+                context['case_ids'] = [elem['case_id'] for elem in contract_data]
             except Exception:
                 context["message"] = "Please enter both dates"
         if case_numbers:
             try:
-                contract_data = sf.fetch_cases(case_numbers)
+                numbers = parse_case_numbers(case_numbers)
+                contract_data = synced_cases_by_numbers(numbers)
+                synced_numbers = {elem['case_number'] for elem in contract_data}
+                missing_numbers = [num for num in numbers if num not in synced_numbers]
+                if missing_numbers:
+                    contract_data += SalesforceQuery().fetch_cases(','.join(missing_numbers))
                 for elem in contract_data:
                     elem['save'] = elem['case_id']
                 context['table'] = FetchSalesForceCasesTable(contract_data)
+                context['case_ids'] = [elem['case_id'] for elem in contract_data]
             except Exception:
                 context["message"] = "This case number: '{}' doesn't exist".format(case_numbers)
         return context
@@ -213,32 +332,38 @@ class ContractAdd(TemplateView):
 class SaveCaseView(View):
 
     def post(self, request, *args, **kwargs):
-        sf = SalesforceQuery()
         case_id = self.kwargs['contract_id']
-        case_data = sf.get_case_by_id(case_id)
+        case_data, contract_data, attachments_data = SalesforceQuery().fetch_case_with_contract(case_id)
         contract_id = case_data['Contract__c']
-        contract_data = sf.get_contract_by_id(contract_id)
-        attachments_data = sf.fetch_contract_attachments(contract_id)
-        contract = Contract.objects.create(
-            organizer_account_name=contract_data['Hoopla_Account_Name__c'],
-            organizer_email=contract_data['Eventbrite_Username__c'],
-            signed_date=datetime.datetime.strptime(contract_data['ActivatedDate'], "%Y-%m-%dT%H:%M:%S.%f%z"),
-            description=case_data['Description'],
-            case_number=case_data['CaseNumber'],
-            salesforce_id=contract_id,
-            salesforce_case_id=case_id,
-            link_to_salesforce_case=case_data['Case_URL__c'],
-        )
-        for attachment in attachments_data:
-            Attachment.objects.create(
-                name=attachment['name'],
-                salesforce_id=attachment['salesforce_id'],
-                content_type=attachment['content_type'],
-                contract=contract,
+        with transaction.atomic():
+            contract = Contract.objects.create(
+                organizer_account_name=contract_data['Hoopla_Account_Name__c'],
+                organizer_email=contract_data['Eventbrite_Username__c'],
+                signed_date=datetime.datetime.strptime(contract_data['ActivatedDate'], "%Y-%m-%dT%H:%M:%S.%f%z"),
+                description=case_data['Description'],
+                case_number=case_data['CaseNumber'],
+                salesforce_id=contract_id,
+                salesforce_case_id=case_id,
+                link_to_salesforce_case=case_data['Case_URL__c'],
             )
+            Attachment.objects.bulk_create([
+                Attachment(
+                    name=attachment['name'],
+                    salesforce_id=attachment['salesforce_id'],
+                    content_type=attachment['content_type'],
+                    contract=contract,
+                ) for attachment in attachments_data
+            ])
         return redirect('installments-create', contract.id)
 
 
+class ImportCasesView(LoginRequiredMixin, View):
+
+    def post(self, request, *args, **kwargs):
+        report = import_cases(request.POST.getlist('case_ids'))
+        return render(request, 'app/import_cases.html', {'report': report})
+
+
 class ConditionView(LoginRequiredMixin, CreateView):
     template_name = "app/create_condition.html"
     model = InstallmentCondition
@@ -253,7 +378,17 @@ class ConditionView(LoginRequiredMixin, CreateView):
         attachments = Attachment.objects.filter(contract_id=self.kwargs['contract_id'])
         context['attachments'] = attachments
         context['installment'] = installment
-        context['object_list'] = InstallmentCondition.objects.filter(installment_id=self.kwargs['installment_id']).all()
+        conditions = list(InstallmentCondition.objects.filter(installment_id=self.kwargs['installment_id']))
+        file_names = [condition.upload_file.name for condition in conditions if condition.upload_file]
+        # Only CachedLinkDropBoxStorage resolves links in a batch
+        resolve_urls = getattr(default_storage, 'urls', None)
+        if resolve_urls is not None:
+            file_links = resolve_urls(file_names) if file_names else {}
+        else:
+            file_links = {name: default_storage.url(name) for name in file_names}
+        for condition in conditions:
+            condition.upload_file_url = file_links.get(condition.upload_file.name)
+        context['object_list'] = conditions
         context['SUPERSET_DEFAULT_CURRENCY'] = SUPERSET_DEFAULT_CURRENCY
 
         return context
@@ -273,11 +408,24 @@ class ToggleConditionView(View):
         installment_id = self.kwargs.get('installment_id')
 
         condition_id = self.kwargs.get('condition_id')
-        condition = InstallmentCondition.objects.get(pk=condition_id)
-        condition.toggle_done()
+        InstallmentCondition.objects.filter(pk=condition_id, installment_id=installment_id).toggle_done()
         return redirect('conditions', contract_id, installment_id)
 
 
+class ConditionBatchDoneView(LoginRequiredMixin, View):
+    """Marks the posted `done` condition ids done and `undone` ids undone, across installments, in one UPDATE."""
+
+    def post(self, request, *args, **kwargs):
+        ids = {}
+        for name in ('done', 'undone'):
+            values = request.POST.getlist(name)
+            if not all(value.isdigit() for value in values):
+                return JsonResponse({'errors': {name: ['Condition ids must be integers.']}}, status=400)
+            ids[name] = [int(value) for value in values]
+        updated = InstallmentCondition.objects.set_done(ids['done'], ids['undone'])
+        return JsonResponse({'updated': updated})
+
+
 class ConditionBackupProofView(View):
 
     def post(self, request, *args, **kwargs):
@@ -319,7 +467,6 @@ class InstallmentsFilter(FilterSet):
     djfdate_time_signed_date = DateFilter(
         label='Signed date',
         method='search_contract_signed_date',
-        lookup_expr='icontains',
         widget=DateInput(
             attrs={
                 'id': 'datepicker_signed_date',
@@ -330,7 +477,6 @@ class InstallmentsFilter(FilterSet):
     djfdate_time_max_payment_date = DateFilter(
         label='Max payment date',
         method='search_maximum_payment_date',
-        lookup_expr='icontains',
         widget=DateInput(
             attrs={
                 'id': 'datepicker_max_payment_date',
@@ -341,7 +487,6 @@ class InstallmentsFilter(FilterSet):
     djfdate_ttime_payment_date = DateFilter(
         label='Payment date',
         method='search_payment_date',
-        lookup_expr='icontains',
         widget=DateInput(
             attrs={
                 'id': 'datepicker_payment_date',
@@ -353,7 +498,27 @@ class InstallmentsFilter(FilterSet):
         choices=STATUS,
         empty_label='Status options',
         method='search_status',
-        lookup_expr='icontains',
+    )
+    # Renders <name>_after and <name>_before inputs, filtered with gte/lte/range
+    signed_date = DateFromToRangeFilter(
+        label='Signed between',
+        field_name='contract__signed_date',
+        widget=DateRangeWidget(attrs={'class': 'datepicker-range', 'type': 'text'}),
+    )
+    payment_date = DateFromToRangeFilter(
+        label='Paid between',
+        field_name='payment_date',
+        widget=DateRangeWidget(attrs={'class': 'datepicker-range', 'type': 'text'}),
+    )
+    maximum_payment_date = DateFromToRangeFilter(
+        label='Max payment between',
+        field_name='maximum_payment_date',
+        widget=DateRangeWidget(attrs={'class': 'datepicker-range', 'type': 'text'}),
+    )
+    balance = RangeFilter(
+        label='Balance between',
+        field_name='balance_amount',
+        method='search_balance',
     )
 
     def search_payment_date(self, qs, name, value):
@@ -368,65 +533,258 @@ class InstallmentsFilter(FilterSet):
 
     def search_status(self, qs, name, value):
         return qs.filter(
-            Q(status__icontains=value)
+            Q(status=value)
         )
 
     def search_contract_signed_date(self, qs, name, value):
         return qs.filter(
-            Q(contract__signed_date__icontains=value)
+            Q(contract__signed_date=value)
         )
 
     def search_contract_organizer(self, qs, name, value):
+        return get_organizer_search().matching(qs, value, contract_field='contract')
+
+    def search_balance(self, qs, name, value):
+        # Annotate only here: on Django 1.11 any annotation turns the list
+        # count and totals into a GROUP BY subquery
+        qs = qs.with_balance()
+        if value.start is not None:
+            qs = qs.filter(balance_amount__gte=value.start)
+        if value.stop is not None:
+            qs = qs.filter(balance_amount__lte=value.stop)
+        return qs
+
+    class Meta:
+        model = Installment
+        fields = ('search_organizer',)
+
+
+class InstallmentReportsFilter(InstallmentsFilter):
+    """InstallmentsFilter over InstallmentReport, where the contract columns and balance are local."""
+    signed_date = DateFromToRangeFilter(
+        label='Signed between',
+        field_name='signed_date',
+        widget=DateRangeWidget(attrs={'class': 'datepicker-range', 'type': 'text'}),
+    )
+    balance = RangeFilter(label='Balance between', field_name='balance')
+
+    def search_contract_signed_date(self, qs, name, value):
         return qs.filter(
-            Q(contract__organizer_account_name__icontains=value) |
-            Q(contract__organizer_email__icontains=value)
+            Q(signed_date=value)
         )
 
     class Meta:
-        model = Installment
+        model = InstallmentReport
         fields = ('search_organizer',)
 
 
-class AllInstallmentsView(LoginRequiredMixin, FilterView, PaginationMixin, ListView):
-    model = Installment
+class AllInstallmentsView(LoginRequiredMixin, KeysetPaginationMixin, FilterView, PaginationMixin, ListView):
+    model = InstallmentReport
+    context_object_name = 'installment_list'
     template_name = "app/all_installments.html"
-    filterset_class = InstallmentsFilter
+    filterset_class = InstallmentReportsFilter
     paginate_by = ITEMS_PER_PAGE
+    keyset_ordering = ('pk',)
+    # Columns rendered by all_installments.html and the CSV export
+    list_fields = (
+        'is_recoup',
+        'status',
+        'upfront_projection',
+        'recoup_amount',
+        'balance',
+        'maximum_payment_date',
+        'payment_date',
+        'gts',
+        'gtf',
+        'organizer_account_name',
+        'organizer_email',
+        'signed_date',
+    )
+
+    # CSV header, and the report columns each one is read from
+    csv_fields = (
+        ('is_recoup', 'is_recoup'),
+        ('status', 'status'),
+        ('contract.organizer_account_name', 'organizer_account_name'),
+        ('recoup_amount', 'recoup_amount'),
+        ('upfront_projection', 'upfront_projection'),
+        ('balance', 'balance'),
+        ('contract.organizer_email', 'organizer_email'),
+        ('contract.signed_date', 'signed_date'),
+        ('upfront_projection', 'upfront_projection'),
+        ('maximum_payment_date', 'maximum_payment_date'),
+        ('payment_date', 'payment_date'),
+        ('gts', 'gts'),
+        ('gtf', 'gtf'),
+    )
+
+    def get_queryset(self):
+        return InstallmentReport.objects.only(*self.list_fields).order_by('pk')
 
     def get(self, request, *args, **kwargs):
-        filtered_response = super().get(request, *args, **kwargs)
         if self.request.GET.get('download'):
-            response = HttpResponse(content_type='text/csv')
-            filename = "{}-installments.csv".format(datetime.datetime.now().replace(microsecond=0).isoformat())
-            response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
-            installments = filtered_response.context_data['installment_list']
-            writer = csv.writer(response)
-            fields = [
-                'is_recoup',
-                'status',
-                'contract.organizer_account_name',
-                'recoup_amount',
-                'upfront_projection',
-                'balance',
-                'contract.organizer_email',
-                'contract.signed_date',
-                'upfront_projection',
-                'maximum_payment_date',
-                'payment_date',
-                'gts',
-                'gtf',
-            ]
-            writer.writerow(fields)
-            for installment in installments:
-                writer.writerow([operator.attrgetter(field)(installment) for field in fields])
-            return response
-        return filtered_response
+            return self.export_csv()
+        return super().get(request, *args, **kwargs)
+
+    def get_export_queryset(self):
+        self.filterset = self.get_filterset(self.get_filterset_class())
+        if not self.filterset.is_bound or self.filterset.is_valid() or not self.get_strict():
+            return self.filterset.qs
+        return self.filterset.queryset.none()
+
+    @classmethod
+    def csv_lookups(cls):
+        return [lookup for _, lookup in cls.csv_fields]
+
+    @classmethod
+    def csv_row(cls, row):
+        return [row[lookup] for _, lookup in cls.csv_fields]
+
+    def iter_csv_rows(self, queryset):
+        lookups = self.csv_lookups()
+        # iterator() skips the queryset cache, and uses a server-side cursor on PostgreSQL
+        for values in queryset.values_list(*lookups).iterator():
+            yield self.csv_row(dict(zip(lookups, values)))
+
+    def export_csv(self):
+        header = [name for name, _ in self.csv_fields]
+        lines = iter_csv_lines(header, self.iter_csv_rows(self.get_export_queryset()))
+        filename = "{}-installments.csv".format(datetime.datetime.now().replace(microsecond=0).isoformat())
+        if self.request.GET.get('compress') == 'gzip':
+            response = StreamingHttpResponse(
+                compress_sequence(line.encode('utf-8') for line in lines),
+                content_type='application/gzip',
+            )
+            filename += '.gz'
+        else:
+            response = StreamingHttpResponse(lines, content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+        return response
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # Cached like the counts, under the same filter key and write generation
+        key = self.count_cache_key('totals')
+        totals = cache.get(key)
+        if totals is None:
+            totals = self.object_list.totals()
+            cache.set(key, totals, COUNT_CACHE_TIMEOUT)
+        context['totals'] = totals
+        context['bulk_update_form'] = InstallmentBulkUpdateForm()
         return context
 
 
+class InstallmentBulkUpdateView(LoginRequiredMixin, View):
+    """
+    Applies the posted status, payment date and/or recoup amount to every
+    installment matching the list filters in the querystring.
+    """
+
+    def post(self, request, *args, **kwargs):
+        view = AllInstallmentsView()
+        filterset = view.filterset_class(data=request.GET, queryset=view.get_queryset())
+        form = InstallmentBulkUpdateForm(request.POST)
+        if not filterset.is_valid():
+            return JsonResponse({'errors': filterset.errors}, status=400)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        return JsonResponse({'updated': update_installments(filterset.qs, form.changes())})
+
+
+def filter_param_names(filterset_class):
+    """Query parameter names of a filterset, including the suffixed inputs of range widgets."""
+    names = []
+    for name, search_filter in filterset_class.base_filters.items():
+        suffixes = getattr(search_filter.field.widget, 'suffixes', [None])
+        names.extend('_'.join([name, suffix]) if suffix else name for suffix in suffixes)
+    return names
+
+
+def export_job_data(job):
+    data = {
+        'id': job.id,
+        'status': job.status,
+        'rows': job.rows,
+        'status_url': reverse('installments-export-status', kwargs={'pk': job.id}),
+    }
+    if job.status == EXPORT_DONE:
+        data['download_url'] = reverse('installments-export-download', kwargs={'pk': job.id})
+    return data
+
+
+class ExportJobCreateView(LoginRequiredMixin, View):
+
+    def post(self, request, *args, **kwargs):
+        filterset_class = AllInstallmentsView.filterset_class
+        filterset = filterset_class(data=request.POST, queryset=InstallmentReport.objects.none())
+        if not filterset.is_valid():
+            return JsonResponse({'errors': filterset.errors}, status=400)
+        params = {
+            name: request.POST.get(name)
+            for name in filter_param_names(filterset_class)
+            if request.POST.get(name)
+        }
+        params_hash = ExportJob.hash_params(params)
+        # An identical export that is queued, running or recently built is reused
+        job = ExportJob.objects.reusable().filter(
+            params_hash=params_hash,
+            created__gte=timezone.now() - datetime.timedelta(seconds=EXPORT_RESULT_MAX_AGE),
+        ).order_by('-created').first()
+        if job is None:
+            job = ExportJob.objects.create(params_hash=params_hash, params=json.dumps(params, sort_keys=True))
+        return JsonResponse(export_job_data(job), status=202)
+
+
+class ExportJobStatusView(LoginRequiredMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(export_job_data(get_object_or_404(ExportJob, pk=self.kwargs['pk'])))
+
+
+class ExportJobDownloadView(LoginRequiredMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(ExportJob, pk=self.kwargs['pk'])
+        if job.status != EXPORT_DONE:
+            raise Http404
+        return redirect(job.file.url)
+
+
+class PortfolioSummaryView(LoginRequiredMixin, FilterView):
+    filterset_class = InstallmentsFilter
+    template_name = 'app/portfolio_summary.html'
+
+    def get_queryset(self):
+        return Installment.objects.all()
+
+    def get_summary(self):
+        # Shares the list count generation, so any installment or contract write retires it
+        key = count_cache_key('PortfolioSummaryView', self.request.GET, 'summary')
+        summary = cache.get(key)
+        if summary is None:
+            groups = list(self.object_list.summary())
+            totals = {
+                name: sum(group[name] for group in groups)
+                for name in ('installments', 'upfront_projection', 'recoup_amount', 'balance')
+            }
+            summary = {'groups': groups, 'totals': totals}
+            cache.set(key, summary, COUNT_CACHE_TIMEOUT)
+        return summary
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['summary'] = self.get_summary()
+        return context
+
+
+class PortfolioSummaryJsonView(PortfolioSummaryView):
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.filterset.is_bound and not self.filterset.is_valid():
+            return JsonResponse({'errors': self.filterset.errors}, status=400)
+        return JsonResponse(context['summary'])
+
+
 def presto_query(request):
     query_params = request.GET
 
@@ -535,7 +893,6 @@ class DeleteEvent(View):
 
 
 def download_attachment(request, **kwargs):
-    sf = SalesforceQuery()
     attachment_id = kwargs['attachment_id']
     attachment = Attachment.objects.filter(id=attachment_id).get()
     content_type = attachment.content_type
@@ -544,10 +901,19 @@ def download_attachment(request, **kwargs):
     filename = name + '.' + extension
     content_disposition = "attachment; filename=" + filename
     salesforce_attachment_id = attachment.salesforce_id
-    attachment_content = sf.fetch_attachment(salesforce_attachment_id, content_type)
-    buffer = BytesIO()
-    buffer.write(attachment_content.content)
-    response = HttpResponse(buffer.getvalue(), content_type='{}'.format(content_type))
+    cached_file = attachment_cache.open(salesforce_attachment_id)
+    if cached_file is not None:
+        response = FileResponse(cached_file, content_type='{}'.format(content_type))
+        response['Content-Length'] = os.fstat(cached_file.fileno()).st_size
+    else:
+        attachment_content = SalesforceQuery().fetch_attachment(salesforce_attachment_id, content_type)
+        response = StreamingHttpResponse(
+            attachment_cache.store(salesforce_attachment_id, iter_response_content(attachment_content)),
+            content_type='{}'.format(content_type),
+        )
+        # iter_content() decodes gzip/deflate, so a compressed length would not match the body
+        if 'Content-Length' in attachment_content.headers and 'Content-Encoding' not in attachment_content.headers:
+            response['Content-Length'] = attachment_content.headers['Content-Length']
     response["Content-Disposition"] = content_disposition.encode('utf-8')
     return response
 
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -42,7 +43,7 @@ STATICFILES_DIRS = (
 # Application definition
 
 INSTALLED_APPS = [
-    'app',
+    'app.apps.AppConfig',
     'bootstrap4',
     'django.contrib.admin',
     'django.contrib.auth',
@@ -142,3 +143,7 @@ PAGINATION_SETTINGS = {
     'MARGIN_PAGES_DISPLAYED': 2,
     'SHOW_FIRST_PAGE_WHEN_INVALID': True,
 }
+
+# Salesforce attachments never change, so their bodies are kept on local disk
+ATTACHMENT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'upfronts_attachments')
+ATTACHMENT_CACHE_MAX_BYTES = 512 * 1024 * 1024
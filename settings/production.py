@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 import dj_database_url
 from settings import get_env_variable
 from settings.base import *  # noqa
@@ -14,6 +17,14 @@ SOCIAL_AUTH_EVENTBRITE_SECRET = get_env_variable(
 )
 SOCIAL_AUTH_REDIRECT_IS_HTTPS = True
 
-DEFAULT_FILE_STORAGE = 'storages.backends.dropbox.DropBoxStorage'
+DEFAULT_FILE_STORAGE = 'app.storage.CachedLinkDropBoxStorage'
 DROPBOX_OAUTH2_TOKEN = get_env_variable('DROPBOX_OAUTH2_TOKEN')
 DROPBOX_ROOT_PATH = '/Backup_Files'
+
+# Shared by every gunicorn worker on the dyno, so they all reuse one Salesforce session
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'upfronts_cache'),
+    },
+}
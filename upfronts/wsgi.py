@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings.dev")
 
 application = get_wsgi_application()
+
+from app.utils import salesforce_session  # noqa: E402
+
+salesforce_session.warm_up()